@@ -0,0 +1,8 @@
+'''Benchmarks for pages application.
+
+Generate a synthetic site in a local SQLite database and time the hot paths:
+
+    python -m benchmarks.run --pages 1000 --languages 3 --placeholders 4 \
+        --output results.json
+    python -m benchmarks.compare before.json after.json
+'''
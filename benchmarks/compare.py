@@ -0,0 +1,46 @@
+'''Compare two benchmark results files.
+
+Exits with status 1 if median time of any benchmark grew more than threshold
+times or it makes more queries than before.
+'''
+import json
+import optparse
+import sys
+
+
+def compare(before, after, threshold):
+    '''Get a list of (name, before, after, ratio, is regression) for benchmarks
+    existing in both results
+    '''
+    rows = []
+    for name in sorted(set(before) & set(after)):
+        old, new = before[name], after[name]
+        ratio = new['median'] / (old['median'] or 1e-9)
+        regression = ratio > threshold or new['queries'] > old['queries']
+        rows.append((name, old, new, ratio, regression))
+    return rows
+
+
+def main(argv=None):
+    '''Print comparison table
+    '''
+    parser = optparse.OptionParser(usage='%prog [options] before after')
+    parser.add_option('--threshold', type='float', default=1.2,
+                      help='Allowed slowdown ratio of median time')
+    options, args = parser.parse_args(argv)
+    if len(args) != 2:
+        parser.error('two results files required')
+    before, after = [json.load(open(path))['results'] for path in args]
+    regressions = 0
+    for name, old, new, ratio, regression in compare(before, after,
+                                                     options.threshold):
+        regressions += regression
+        print('%-20s %8.2fms -> %8.2fms  x%.2f  queries %d -> %d%s' % (
+                name, old['median'] * 1000, new['median'] * 1000, ratio,
+                old['queries'], new['queries'],
+                regression and '  REGRESSION' or ''))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
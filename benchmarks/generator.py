@@ -0,0 +1,98 @@
+'''Synthetic large site generator.
+
+Creates N pages translated into M languages, each with K placeholders filled
+with articles, and menus linking some of the pages. Rows are inserted with
+bulk_create, so no signals are sent while generating.
+'''
+from django.conf import settings
+
+from pages import models, processing
+
+TEMPLATE = 'benchmark/page.html'
+PARAGRAPH = ('<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed '
+             'do eiusmod tempor incididunt ut labore et dolore magna aliqua. '
+             '<a href="/page-%d-%s/">Related page</a></p>')
+HEADING = '<h2>%s %s</h2>'
+BATCH_SIZE = 100
+
+
+def clear():
+    '''Remove all pages data
+    '''
+    for model in (models.MenuItem, models.Menu, models.PageArticle,
+                  models.ArticleBody, models.PageTranslation, models.Page,
+                  models.Placeholder, models.Layout, models.Language):
+        model.objects.all().delete()
+
+
+def add_body(bodies, content):
+    '''Add content to a dict of article bodies by hashes, get its hash
+    '''
+    body_hash = models.ArticleBody.objects.get_hash(content)
+    bodies[body_hash] = content
+    return body_hash
+
+
+def generate(pages=100, languages=2, placeholders=3, menu_size=10,
+             paragraphs=20):
+    '''Generate a site, get a dict with generated objects counts
+    '''
+    clear()
+    codes = [code for code, __ in settings.LANGUAGES[:languages]]
+    places = ['place%d' % index for index in range(placeholders)]
+    settings.PAGES_TEMPLATES_PLACEHOLDERS = {TEMPLATE: tuple(places)}
+    # Dictionaries
+    models.Language.objects.bulk_create(
+                    [models.Language(code=code) for code in codes])
+    models.Placeholder.objects.bulk_create(
+                    [models.Placeholder(alias=alias, name=alias)
+                     for alias in places])
+    layout = models.Layout.objects.create(name='Benchmark', template=TEMPLATE,
+                                          is_default=True)
+    # Pages and translations
+    models.Page.objects.bulk_create([models.Page(is_default=index == 0)
+                                     for index in range(pages)],
+                                    batch_size=BATCH_SIZE)
+    page_ids = list(models.Page.objects.order_by('id')
+                                       .values_list('id', flat=True))
+    models.PageTranslation.objects.bulk_create([
+            models.PageTranslation(page_id=page_id, language_id=code,
+                    layout=layout, alias='page-%d-%s' % (index, code),
+                    title_tag='Page %d (%s)' % (index, code),
+                    header='Page %d' % index, title='Page %d' % index,
+                    meta_description='Description of page %d' % index,
+                    meta_keywords='page, %d, %s' % (index, code))
+            for index, page_id in enumerate(page_ids) for code in codes],
+        batch_size=BATCH_SIZE)
+    # Articles
+    translations = models.PageTranslation.objects.values_list('id', 'alias')
+    # Every article has its own text, as articles of real sites
+    articles, bodies = [], {}
+    for translation_id, alias in translations:
+        for place in places:
+            number = len(articles)
+            text = HEADING % (alias, place) + ''.join(
+                        PARAGRAPH % ((number + index * 7) % pages, codes[0])
+                        for index in range(paragraphs))
+            articles.append(models.PageArticle(page_id=translation_id,
+                    layout=layout, place_id=place,
+                    article_title='%s %s' % (alias, place),
+                    text_body_id=add_body(bodies, text),
+                    html_body_id=add_body(bodies, processing.process(text))))
+    models.ArticleBody.objects.bulk_create(
+            [models.ArticleBody(hash=body_hash, content=content)
+             for body_hash, content in bodies.items()],
+        batch_size=BATCH_SIZE)
+    models.PageArticle.objects.bulk_create(articles, batch_size=BATCH_SIZE)
+    # Menus
+    for alias, offset in (('main', 0), ('footer', menu_size)):
+        menu = models.Menu.objects.create(name=alias, alias=alias)
+        models.MenuItem.objects.bulk_create([
+                models.MenuItem(menu=menu, page_id=page_id, order=order)
+                for order, page_id in enumerate(
+                                    page_ids[offset:offset + menu_size])])
+    return {'pages': pages, 'languages': len(codes),
+            'placeholders': placeholders,
+            'translations': len(page_ids) * len(codes),
+            'articles': len(page_ids) * len(codes) * placeholders,
+            'menu_size': menu_size}
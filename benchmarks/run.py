@@ -0,0 +1,149 @@
+'''Run pages benchmarks and write results as JSON.
+
+Every benchmark is called a number of times, for each one minimal, median and
+mean wall time, count of SQL queries, database time and pages cache hits
+are recorded.
+'''
+import json
+import optparse
+import os
+import platform
+import sys
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+import django
+from django import template
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.http import QueryDict
+from django.test.client import RequestFactory
+
+from pages import forms, instrumentation, models, views
+
+from benchmarks import generator
+
+
+def measure(function, repeat):
+    '''Call function repeat times, get timing, queries and cache statistics
+    '''
+    timings, queries, db_time, cache_hits = [], [], 0.0, 0
+    for __ in range(repeat):
+        with instrumentation.Tracker('benchmark') as tracker:
+            function()
+        timings.append(tracker.duration)
+        queries.append(tracker.queries)
+        db_time += tracker.db_time
+        cache_hits += tracker.cache_hits
+    timings.sort()
+    return {'calls': repeat,
+            'min': timings[0],
+            'median': timings[len(timings) // 2],
+            'mean': sum(timings) / len(timings),
+            'queries': max(queries),
+            'db_time': db_time / repeat,
+            'cache_hits': cache_hits}
+
+
+def get_benchmarks():
+    '''Get a dict of benchmark name and callable pairs
+    '''
+    admin.autodiscover()
+    factory = RequestFactory()
+    superuser = User.objects.filter(is_superuser=True)[0]
+    page_admin = admin.site._registry[models.Page]
+    page = models.Page.objects.order_by('-id')[0]
+    alias = page.get_translation().alias
+    menu = models.Menu.objects.get(alias='main')
+    menu_pages = [str(page_id) for page_id in
+                  models.Page.objects.order_by('-id')
+                                     .values_list('id', flat=True)[:20]]
+    menu_template = template.Template('{% load menu_tags %}'
+                                      '{% menu_items "items" "main" %}'
+                                      '{% for item in items %}{{ item }}'
+                                      '{% endfor %}')
+
+    def request(path='/', **params):
+        '''Create GET request from superuser
+        '''
+        request = factory.get(path, params)
+        request.user = superuser
+        return request
+
+    def render(response):
+        '''Render template response
+        '''
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    def menu_form_save():
+        '''Save main menu with items
+        '''
+        data = QueryDict('', mutable=True)
+        data.update({'name': menu.name, 'alias': menu.alias,
+                     'is_active': 'on'})
+        data.setlist('items', menu_pages)
+        form = forms.MenuForm(data, instance=menu)
+        assert form.is_valid(), form.errors
+        form.save()
+
+    return {
+        'get_page_data': lambda: views.get_page_data(None, alias),
+        'page_view': lambda: views.page_view(request(), alias),
+        'page_view_default': lambda: views.page_view(request()),
+        'menu_items': lambda: menu_template.render(template.Context()),
+        'admin_changelist': lambda: render(
+                                page_admin.changelist_view(request())),
+        'admin_change_view': lambda: render(
+                                page_admin.change_view(request(),
+                                                       str(page.pk))),
+        'admin_add_view': lambda: render(page_admin.add_view(request())),
+        'menu_form_save': menu_form_save,
+    }
+
+
+def main(argv=None):
+    '''Parse options, generate a site and run benchmarks
+    '''
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('--pages', type='int', default=1000)
+    parser.add_option('--languages', type='int', default=3)
+    parser.add_option('--placeholders', type='int', default=4)
+    parser.add_option('--menu-size', type='int', default=10)
+    parser.add_option('--repeat', type='int', default=20)
+    parser.add_option('--only', action='append', default=[],
+                      help='Run only benchmark with name, can be repeated')
+    parser.add_option('--output', help='Write results into file')
+    options = parser.parse_args(argv)[0]
+
+    call_command('syncdb', interactive=False, verbosity=0)
+    site = generator.generate(options.pages, options.languages,
+                              options.placeholders, options.menu_size)
+    if not User.objects.filter(is_superuser=True).exists():
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+    results = {}
+    for name, function in sorted(get_benchmarks().items()):
+        if options.only and name not in options.only:
+            continue
+        results[name] = measure(function, options.repeat)
+        sys.stderr.write('%-20s median %8.2fms  queries %d\n' % (name,
+                            results[name]['median'] * 1000,
+                            results[name]['queries']))
+    output = json.dumps({
+        'site': site,
+        'environment': {'python': platform.python_version(),
+                        'django': django.get_version(),
+                        'database': 'sqlite3'},
+        'results': results,
+    }, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, 'w') as output_file:
+            output_file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
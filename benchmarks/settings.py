@@ -0,0 +1,34 @@
+'''Django settings used to run benchmarks
+'''
+import os
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEBUG = False
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('PAGES_BENCHMARK_DB',
+                               os.path.join(BASE_DIR, 'benchmark.sqlite3')),
+    }
+}
+INSTALLED_APPS = (
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.admin',
+    'tinymce',
+    'pages',
+)
+LANGUAGE_CODE = 'en'
+LANGUAGES = (
+    ('en', 'English'), ('ru', 'Russian'), ('uk', 'Ukrainian'),
+    ('de', 'German'), ('fr', 'French'), ('es', 'Spanish'),
+    ('it', 'Italian'), ('pl', 'Polish'),
+)
+ROOT_URLCONF = 'benchmarks.urls'
+SECRET_KEY = 'pages-benchmarks'
+STATIC_URL = '/static/'
+TEMPLATE_DIRS = (os.path.join(BASE_DIR, 'templates'), )
+PAGES_TEMPLATES_PLACEHOLDERS = {}  # Filled by generator
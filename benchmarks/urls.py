@@ -0,0 +1,11 @@
+'''Url mapping for benchmarks
+'''
+from django.conf.urls.defaults import include, patterns, url
+from django.contrib import admin
+
+admin.autodiscover()
+
+urlpatterns = patterns('',
+    url(r'^admin/', include(admin.site.urls)),
+    url(r'', include('pages.urls')),
+)
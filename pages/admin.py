@@ -1,6 +1,7 @@
 '''Build an admin interface for pages and page-related things
 '''
 import functools
+import hashlib
 import urlparse
 
 from django import http
@@ -10,11 +11,18 @@ from django.contrib import admin
 from django.core import exceptions, urlresolvers
 from django.db import transaction
 from django.views.decorators import csrf
-from django.utils import decorators, encoding, functional, html, safestring
+from django.utils import (decorators, encoding, html, safestring,
+                          translation)
 from django.utils.translation import ugettext as _
 
+import blocks
+import bus
+import cache
+import changelist
 import forms
+import instrumentation
 import models
+import publishing
 
 csrf_protect_m = decorators.method_decorator(csrf.csrf_protect)
 
@@ -104,10 +112,12 @@ class PageAdmin(admin.ModelAdmin):
     model = models.Page
     add_form_template = 'admin/page_change_form.html'
     change_form_template = 'admin/page_change_form.html'
+    change_list_template = 'admin/page_change_list.html'
     search_fields = ('translations__header', 'translations__title',
                      'translations__alias', )
     list_filter = ('translations__layout', )
     list_display = ('title', 'alias', 'layout', )
+    actions = ('publish', )
 
     def title(self, obj):
         '''Get title
@@ -127,6 +137,21 @@ class PageAdmin(admin.ModelAdmin):
         return obj.get_translation().layout
     layout.short_description = _('layout')
 
+    def get_changelist(self, request, **kwargs):
+        '''Get keyset paginated changelist if PAGES_ADMIN_KEYSET is set
+        '''
+        if getattr(settings, 'PAGES_ADMIN_KEYSET', False):
+            return changelist.KeysetChangeList
+        return super(PageAdmin, self).get_changelist(request, **kwargs)
+
+    def publish(self, request, queryset):
+        '''Publish selected pages
+        '''
+        published = publishing.publish_pages(queryset)
+        self.message_user(request, _('%d page translations published') %
+                                   len(published))
+    publish.short_description = _('Publish selected pages')
+
     def get_urls(self):
         '''Get urls accessible in admin interface
         '''
@@ -152,27 +177,26 @@ class PageAdmin(admin.ModelAdmin):
         '''Get a list of placeholders for layout
         '''
         aliases = settings.PAGES_TEMPLATES_PLACEHOLDERS.get(template_name, ())
-        return [models.Placeholder.objects.get_or_create(alias=alias)[0]
-                for alias in aliases]
+        return bus.placeholders.get(template_name, lambda: [
+                    models.Placeholder.objects.get_or_create(alias=alias)[0]
+                    for alias in aliases])
 
     def render_layout_form(self, language, layout, page):
         '''
         '''
         from django.template import loader
-        if page:
-            def get_instance(place):
-                return models.PageArticle.objects.get_or_create(layout=layout,
-                                                    page=page, place=place)[0]
-        else:
-            get_instance = lambda __: None
-
-        formset = [forms.PageContentForm(None, layout=layout, place=place,
-                                         instance=get_instance(place),
-                                         language=language)
-                   for place in self.get_placeholders(layout.template)]
+        places = self.get_placeholders(layout.template)
+        instances = (blocks.load_instances(page, layout, places) if page
+                     else {})
+        formset = [forms.get_content_form(blocks.get_type(place.pk))(None,
+                                layout=layout, place=place,
+                                instance=instances.get(place.pk),
+                                language=language)
+                   for place in places]
         return loader.render_to_string('admin/includes/content_form.html',
                                        {'formset': formset})
 
+    @instrumentation.track('admin.page.layout_view')
     @csrf_protect_m
     def layout_view(self, request, page_id=None, layout_id=None,
                     lang_code=None):
@@ -180,25 +204,40 @@ class PageAdmin(admin.ModelAdmin):
         '''
         # Select language
         lang_code = lang_code or settings.LANGUAGE_CODE
-        lang = models.Language.objects.get(code=lang_code)
+        lang = bus.languages.get(lang_code,
+                    lambda: models.Language.objects.get(code=lang_code))
         # Select layout
-        layout_manager = models.Layout.objects
-        layout = (layout_manager.get(id=layout_id) if layout_id
-                  else self.default_layout)
+        layout = (bus.layouts.get(int(layout_id),
+                            lambda: models.Layout.objects.get(id=layout_id))
+                  if layout_id else self.default_layout)
         # Select page
         if page_id:
             page = models.PageTranslation.objects.get(page_id=page_id,
                                                       language=lang)
-        else:
-            page = None
-
-        return http.HttpResponse(self.render_layout_form(lang, layout, page))
-
-    @functional.cached_property
+            return http.HttpResponse(self.render_layout_form(lang, layout,
+                                                             page))
+        return http.HttpResponse(self.render_empty_layout_form(lang, layout))
+
+    def render_empty_layout_form(self, language, layout):
+        '''Render forms of new page content for layout, they depend only on
+        layout, language, admin interface language and placeholders of layout
+        template, so they are cached by them
+        '''
+        version = hashlib.md5(repr((layout.template, [
+                    (place.pk, blocks.get_label(blocks.get_type(place.pk)))
+                    for place in self.get_placeholders(layout.template)])))
+        return cache.get_or_compute(
+                    cache.layout_form_key(layout.pk, language.code,
+                                          translation.get_language(),
+                                          version.hexdigest()),
+                    lambda: self.render_layout_form(language, layout, None))
+
+    @property
     def default_layout(self):
-        '''Get default layout
+        '''Get default layout, it's kept until layouts are changed in any
+        process
         '''
-        return models.Layout.objects.get_default()
+        return bus.layouts.get('default', models.Layout.objects.get_default)
 
     def validate_forms(self, forms):
         '''Validate a list of forms
@@ -226,26 +265,28 @@ class PageAdmin(admin.ModelAdmin):
                                 instance=get_instance(language), page=page,
                                 initial={'is_active': True,
                                          'layout__id': self.default_layout.id})
-                for language in models.Language.objects.all()]
+                for language in bus.languages.get('all', lambda: list(
+                                            models.Language.objects.all()))]
 
     def get_layout_forms(self, translations, data=None, page=None):
         '''Get layout forms
         '''
-        if page:
-            def get_instance(transl, place, layout):
-                page_translation = models.PageTranslation.objects.get(
-                                        page=page, language=transl.language)
-                return models.PageArticle.objects.get_or_create(layout=layout,
-                                        page=page_translation, place=place)[0]
-        else:
-            get_instance = lambda __, ___, ____: None
         for translation in translations:
             layout = translation.layout or self.default_layout
+            places = self.get_placeholders(layout.template)
+            instances = {}
+            if page:
+                # Blocks of every type are loaded with a single query
+                instances = blocks.load_instances(
+                            models.PageTranslation.objects.get(page=page,
+                                            language=translation.language),
+                            layout, places)
             translation.content_forms = [
-                forms.PageContentForm(data, layout=layout, place=placeholder,
-                    instance=get_instance(translation, placeholder, layout),
+                forms.get_content_form(blocks.get_type(placeholder.pk))(data,
+                    layout=layout, place=placeholder,
+                    instance=instances.get(placeholder.pk),
                     language=translation.language)
-                for placeholder in self.get_placeholders(layout.template)]
+                for placeholder in places]
 
     def save_data(self, request, new_object, form, translations):
         '''Save model and translations with whole data
@@ -255,7 +296,16 @@ class PageAdmin(admin.ModelAdmin):
             tranls_obj = translation.save(page=new_object)
             for content in translation.content_forms:
                 content.save(page=tranls_obj)
+        if getattr(settings, 'PAGES_PUBLISH_ON_SAVE', False):
+            publishing.publish_pages([new_object])
+
+    @instrumentation.track('admin.page.changelist_view')
+    def changelist_view(self, request, extra_context=None):
+        '''The 'change list' admin view for this model.
+        '''
+        return super(PageAdmin, self).changelist_view(request, extra_context)
 
+    @instrumentation.track('admin.page.add_view')
     @csrf_protect_m
     @transaction.commit_on_success
     def add_view(self, request, form_url='', extra_context=None):
@@ -323,6 +373,7 @@ class PageAdmin(admin.ModelAdmin):
         return self.render_change_form(request, context, form_url=form_url,
                                        add=True)
 
+    @instrumentation.track('admin.page.change_view')
     @csrf_protect_m
     @transaction.commit_on_success
     def change_view(self, request, object_id, form_url='', extra_context=None):
@@ -409,6 +460,27 @@ class MenuAdmin(ActivityMixin):
     form = forms.MenuForm
     list_display = ('name', 'alias', ActivityMixin.do_change_active, )
 
+    @instrumentation.track('admin.menu.changelist_view')
+    def changelist_view(self, request, extra_context=None):
+        '''The 'change list' admin view for this model.
+        '''
+        return super(MenuAdmin, self).changelist_view(request, extra_context)
+
+    @instrumentation.track('admin.menu.add_view')
+    def add_view(self, request, form_url='', extra_context=None):
+        '''The 'add' admin view for this model.
+        '''
+        return super(MenuAdmin, self).add_view(request, form_url,
+                                               extra_context)
+
+    @instrumentation.track('admin.menu.change_view')
+    def change_view(self, request, object_id, form_url='',
+                    extra_context=None):
+        '''The 'change' admin view for this model.
+        '''
+        return super(MenuAdmin, self).change_view(request, object_id,
+                                                  form_url, extra_context)
+
     def save_related(self, request, form, formsets, change):
         """Given the ``HttpRequest``, the parent ``ModelForm`` instance, the
         list of inline formsets and a boolean value based on whether the
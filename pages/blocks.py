@@ -0,0 +1,92 @@
+'''Registry of content block types.
+
+Every concrete PageContent subclass is registered as a block type when its
+class is prepared. Block type model defines:
+
+    read_model - read model class for block rows, its place attribute should
+                 contain placeholder alias
+    prefetch_blocks(blocks) - class method getting a list of read models of
+                 blocks of the type shown on a page, it can load related data
+                 for all of them at once and get a new list
+    edited_blocks(queryset) - class method getting a queryset of blocks
+                 loaded for editing, it can select their related rows
+    new_blocks(translation, layout, places) - class method getting a list
+                 of unsaved empty blocks, missing blocks are created with
+                 bulk_create() so save() and signals aren't called for them
+
+Blocks of all types for a page are loaded in a single pass with a query per
+type. Placeholders contain articles by default, types of other placeholders
+are set by aliases with PAGES_BLOCK_TYPES setting:
+
+    PAGES_BLOCK_TYPES = {'gallery': 'gallery.GalleryBlock'}
+'''
+import collections
+
+from django.conf import settings
+
+DEFAULT_TYPE = 'pages.PageArticle'
+
+registry = collections.OrderedDict()  # Block type models by labels
+
+
+def get_label(model):
+    '''Get block type label of model
+    '''
+    return '%s.%s' % (model._meta.app_label, model._meta.object_name)
+
+
+def register(model):
+    '''Register block type model
+    '''
+    registry[get_label(model)] = model
+
+
+def get_type(place):
+    '''Get block type model for placeholder alias
+    '''
+    return registry[getattr(settings, 'PAGES_BLOCK_TYPES', {}).get(
+                                                        place, DEFAULT_TYPE)]
+
+
+def make_blocks(model, rows):
+    '''Get a list of read models of blocks of type for rows
+    '''
+    blocks = [model.read_model._make(row) for row in rows]
+    return model.prefetch_blocks(blocks) if blocks else blocks
+
+
+def load(translation_id, layout_id):
+    '''Load read models of blocks of all types shown on page translation
+    with layout, get a dict of them by placeholders aliases
+    '''
+    blocks = {}
+    for model in registry.values():
+        rows = model.objects.filter(page=translation_id, layout=layout_id)\
+                            .values_list(*model.read_model.fields)
+        blocks.update((block.place, block)
+                      for block in make_blocks(model, rows))
+    return blocks
+
+
+def load_instances(translation, layout, places):
+    '''Get a dict of blocks of translation with layout in placeholders by
+    placeholders aliases, missing blocks are created
+    '''
+    places_by_type = collections.defaultdict(list)
+    for place in places:
+        places_by_type[get_type(place.pk)].append(place)
+    instances = {}
+    for model, type_places in places_by_type.items():
+        for block in model.edited_blocks(model.objects.filter(
+                    page=translation, layout=layout, place__in=type_places)):
+            instances[block.place_id] = block
+        missing = [place for place in type_places
+                   if place.pk not in instances]
+        if missing:
+            model.objects.bulk_create(model.new_blocks(translation, layout,
+                                                       missing))
+            # Primary keys of created rows aren't set by bulk_create()
+            for block in model.edited_blocks(model.objects.filter(
+                        page=translation, layout=layout, place__in=missing)):
+                instances[block.place_id] = block
+    return instances
@@ -0,0 +1,189 @@
+'''Invalidation bus for in-process state of worker processes.
+
+Signals reach only the process which changed data, so every namespace of
+in-process state (routing index, default layout, placeholders, languages)
+has a generation counter kept in shared storage. A process changing data
+bumps the counter, and all processes poll counters of all namespaces with a
+single request, but not often than once per PAGES_BUS_INTERVAL milliseconds.
+Local state of namespaces whose counters changed is dropped. Changes made in
+transactions bump counters once more after the transaction ends (see deferred
+module), so state reloaded from old rows before commit doesn't stay.
+
+Storage is selected with PAGES_BUS_BACKEND setting, a dotted path to backend
+class:
+
+    pages.bus.CacheBackend - counters are kept in the cache used for pages
+        (see PAGES_CACHE_BACKEND), it should be shared between processes
+        (memcached, redis and so on);
+    pages.bus.LocalBackend - counters are kept in memory of the process,
+        useful for tests and single process servers.
+'''
+import collections
+import threading
+import time
+
+from django.conf import settings
+from django.core import urlresolvers
+from django.db.models import signals
+from django.dispatch import receiver
+
+import cache
+import deferred
+import models
+
+KEY_PREFIX = 'pages:bus:'
+TIMEOUT = 60 * 60 * 24 * 30
+
+_backends = {}
+_subscribers = collections.defaultdict(list)
+_lock = threading.Lock()
+_state = {'seen': {}, 'checked': 0}
+
+
+class CacheBackend(object):
+    '''Generation counters kept in pages cache
+    '''
+
+    def get_many(self, namespaces):
+        '''Get a dict with current generations of namespaces
+        '''
+        values = cache.get_cache().get_many([KEY_PREFIX + namespace
+                                             for namespace in namespaces])
+        return dict((key[len(KEY_PREFIX):], value)
+                    for key, value in values.items())
+
+    def incr(self, namespace):
+        '''Increase generation of namespace, get a new one
+        '''
+        backend, key = cache.get_cache(), KEY_PREFIX + namespace
+        try:
+            return backend.incr(key)
+        except ValueError:  # There is no counter, it was lost or never set
+            # Start from current time, so lost counter doesn't repeat values
+            generation = int(time.time() * 1000)
+            backend.set(key, generation, TIMEOUT)
+            return generation
+
+
+class LocalBackend(object):
+    '''Generation counters kept in memory of current process
+    '''
+    generations = collections.defaultdict(int)
+
+    def get_many(self, namespaces):
+        '''Get a dict with current generations of namespaces
+        '''
+        return dict((namespace, self.generations[namespace])
+                    for namespace in namespaces)
+
+    def incr(self, namespace):
+        '''Increase generation of namespace, get a new one
+        '''
+        with _lock:
+            self.generations[namespace] += 1
+            return self.generations[namespace]
+
+
+def get_backend():
+    '''Get bus backend
+    '''
+    path = getattr(settings, 'PAGES_BUS_BACKEND', 'pages.bus.CacheBackend')
+    if path not in _backends:
+        _backends[path] = urlresolvers.get_callable(path)()
+    return _backends[path]
+
+
+def subscribe(namespace, callback):
+    '''Call callback without arguments when namespace state becomes stale
+    '''
+    _subscribers[namespace].append(callback)
+
+
+def notify(namespace):
+    '''Drop local state of namespace
+    '''
+    for callback in _subscribers[namespace]:
+        callback()
+
+
+def bump(namespace):
+    '''Drop local state of namespace in all processes
+    '''
+    notify(namespace)
+    _state['seen'][namespace] = get_backend().incr(namespace)
+
+
+def poll(force=False):
+    '''Drop local state of namespaces changed by other processes. Shared
+    storage is checked not often than once per PAGES_BUS_INTERVAL ms
+    '''
+    now = time.time()
+    interval = getattr(settings, 'PAGES_BUS_INTERVAL', 500) / 1000.0
+    if not force and now - _state['checked'] < interval:
+        return
+    _state['checked'] = now
+    seen = _state['seen']
+    generations = get_backend().get_many(list(_subscribers))
+    for namespace in _subscribers:
+        generation = generations.get(namespace)
+        if namespace in seen and seen[namespace] != generation:
+            notify(namespace)
+        seen[namespace] = generation
+
+
+class LocalState(object):
+    '''Values computed once per process and dropped when namespace is bumped
+    '''
+
+    def __init__(self, namespace):
+        '''Create state of namespace
+        '''
+        self.namespace = namespace
+        self.values = {}
+        subscribe(namespace, self.clear)
+
+    def get(self, key, compute):
+        '''Get value for key, compute it with callable if there is no value
+        '''
+        poll()
+        values = self.values
+        try:
+            return values[key]
+        except KeyError:
+            # Value computed during clearing is kept in dropped dict only
+            value = values[key] = compute()
+            return value
+
+    def clear(self):
+        '''Drop all values
+        '''
+        self.values = {}
+
+
+layouts = LocalState('layouts')
+placeholders = LocalState('placeholders')
+languages = LocalState('languages')
+
+
+@receiver(signals.post_save, sender=models.Layout)
+@receiver(signals.post_delete, sender=models.Layout)
+def layout_changed(sender, **kwargs):
+    '''Drop layouts state
+    '''
+    deferred.repeat_after_commit(bump, 'layouts')
+
+
+@receiver(signals.post_save, sender=models.Placeholder)
+@receiver(signals.post_delete, sender=models.Placeholder)
+def placeholder_changed(sender, **kwargs):
+    '''Drop placeholders state
+    '''
+    deferred.repeat_after_commit(bump, 'placeholders')
+
+
+@receiver(signals.post_save, sender=models.Language)
+@receiver(signals.post_delete, sender=models.Language)
+def language_changed(sender, **kwargs):
+    '''Drop languages state
+    '''
+    deferred.repeat_after_commit(bump, 'languages')
@@ -0,0 +1,304 @@
+'''Caching of data used on the public pages path.
+
+Cache is disabled until PAGES_CACHE_TIMEOUT setting is set to a positive
+number of seconds. Backend is selected with PAGES_CACHE_BACKEND setting
+(the 'default' one is used if it isn't set).
+
+Entries live PAGES_CACHE_TIMEOUT seconds shortened by random
+PAGES_CACHE_JITTER part of it (0.1 by default), so entries computed together
+(after deploy or invalidation) don't expire together.
+
+All entries are stored together with content generation. The generation is
+increased to make all entries stale at once, and it's fetched in the same
+round-trip as an entry itself. Usually only entries of affected pages and
+menus are deleted, see dependencies module.
+
+Entries are invalidated at once and once more after the transaction making
+changes ends (see deferred module), so entries stored by concurrent readers
+of not yet committed data don't live until timeout.
+
+The shared cache can be fronted with a per-process LRU tier when
+PAGES_LOCAL_CACHE_ENTRIES setting is set to a positive number. Its size in
+bytes is limited by PAGES_LOCAL_CACHE_BYTES (16Mb by default), entries live
+PAGES_LOCAL_CACHE_TIMEOUT seconds (5 by default) shortened by jitter too.
+Local tiers of all processes are cleared on any invalidation through the bus,
+so they could show stale data not longer than PAGES_BUS_INTERVAL. Only one
+thread of the process computes a missing entry at a time, others wait and
+take its result.
+
+Rendered pages are cached too when PAGES_CACHE_HTML setting is on. Only
+responses for anonymous users are cached, so templates of such pages should
+not output anything specific for request (like csrf tokens). Rendered pages
+remember versions of menus shown on them and become stale when menus change.
+'''
+import contextlib
+import random
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core import cache as django_cache
+
+import bus
+import deferred
+import instrumentation
+import lru
+
+GENERATION_KEY = 'pages:generation'
+GENERATION_TIMEOUT = 60 * 60 * 24 * 30
+
+_backends = {}
+_local_caches = {}
+_locks = {}  # Locks of keys being computed with count of threads using them
+_locks_lock = threading.Lock()
+_local = threading.local()
+
+
+def get_cache():
+    '''Get cache backend used for pages
+    '''
+    name = getattr(settings, 'PAGES_CACHE_BACKEND', 'default')
+    if name not in _backends:
+        _backends[name] = django_cache.get_cache(name)
+    return _backends[name]
+
+
+def get_timeout():
+    '''Get timeout for pages cache entries, zero means cache is disabled
+    '''
+    return getattr(settings, 'PAGES_CACHE_TIMEOUT', 0)
+
+
+def get_jitter():
+    '''Get the largest part of timeout entries could live shorter
+    '''
+    return getattr(settings, 'PAGES_CACHE_JITTER', 0.1)
+
+
+def jittered(timeout):
+    '''Get timeout shortened by random jitter, at least one second
+    '''
+    return max(1, int(timeout * (1 - random.uniform(0, get_jitter()))))
+
+
+def get_local_cache():
+    '''Get in-process cache tier or None if it's disabled
+    '''
+    entries = getattr(settings, 'PAGES_LOCAL_CACHE_ENTRIES', 0)
+    if not entries:
+        return None
+    options = (entries,
+               getattr(settings, 'PAGES_LOCAL_CACHE_BYTES', 16 * 1024 * 1024),
+               getattr(settings, 'PAGES_LOCAL_CACHE_TIMEOUT', 5),
+               get_jitter())
+    if options not in _local_caches:
+        local_cache = _local_caches.setdefault(options,
+                                               lru.LRUCache(*options))
+        bus.subscribe('cache', local_cache.clear)
+    return _local_caches[options]
+
+
+def local_stats():
+    '''Get usage statistics of in-process tier or None if it's disabled
+    '''
+    local_cache = get_local_cache()
+    return local_cache.stats() if local_cache is not None else None
+
+
+def page_key(slug):
+    '''Get cache key for page data
+    '''
+    return 'pages:page:%s' % (slug or '')
+
+
+def html_key(slug):
+    '''Get cache key for rendered page
+    '''
+    return 'pages:html:%s' % (slug or '')
+
+
+def menu_key(alias, language):
+    '''Get cache key for menu items
+    '''
+    return 'pages:menu:%s:%s' % (language, alias)
+
+
+def menu_version_key(alias):
+    '''Get cache key for menu version
+    '''
+    return 'pages:menu-version:%s' % alias
+
+
+def layout_form_key(layout_id, language, ui_language, version):
+    '''Get cache key for rendered empty content forms of layout in language
+    of content, labels are translated to admin interface language
+    '''
+    return 'pages:layout-form:%s:%s:%s:%s' % (language, ui_language,
+                                              layout_id, version)
+
+
+def new_generation():
+    '''Start a new content generation. Current time is used for generation
+    start, so even lost generation key never brings stale entries back
+    '''
+    generation = int(time.time() * 1000)
+    get_cache().set(GENERATION_KEY, generation, GENERATION_TIMEOUT)
+    return generation
+
+
+@contextlib.contextmanager
+def computing(key):
+    '''Lock key, so only one thread of the process computes its value
+    '''
+    with _locks_lock:
+        lock, users = _locks.get(key) or (threading.Lock(), 0)
+        _locks[key] = (lock, users + 1)
+    try:
+        with lock:
+            yield
+    finally:
+        with _locks_lock:
+            lock, users = _locks.pop(key)
+            if users > 1:
+                _locks[key] = (lock, users - 1)
+
+
+def get_or_compute(key, compute, is_valid=None, timeout=None):
+    '''Get value from cache or compute it with callable and put into cache
+    for timeout seconds (PAGES_CACHE_TIMEOUT by default). Cached value is
+    also recomputed if is_valid callable returns False for it (values of
+    in-process tier aren't checked, they are dropped on changes)
+    '''
+    if not get_timeout():
+        return compute()
+    timeout = timeout or get_timeout()
+    local_cache = get_local_cache()
+    if local_cache is not None:
+        bus.poll()
+        value = local_cache.get(key)
+        if value is not lru.MISSING:
+            instrumentation.count_cache(True)
+            return value
+    with computing(key):
+        if local_cache is not None:
+            # Value could be computed by another thread while waiting
+            value = local_cache.get(key)
+            if value is not lru.MISSING:
+                instrumentation.count_cache(True)
+                return value
+        value = get_or_compute_shared(key, compute, is_valid, timeout)
+        if local_cache is not None:
+            local_cache.set(key, value, timeout)
+    return value
+
+
+def get_or_compute_shared(key, compute, is_valid, timeout):
+    '''Get value from shared cache or compute it and put into shared cache
+    '''
+    backend = get_cache()
+    values = backend.get_many([GENERATION_KEY, key])
+    generation = values.get(GENERATION_KEY) or new_generation()
+    entry = values.get(key)
+    if (entry is not None and entry[0] == generation
+            and (is_valid is None or is_valid(entry[1]))):
+        instrumentation.count_cache(True)
+        return entry[1]
+    instrumentation.count_cache(False)
+    value = compute()
+    backend.set(key, (generation, value), jittered(timeout))
+    return value
+
+
+def clear_local():
+    '''Clear in-process tiers of all processes
+    '''
+    if get_local_cache() is not None:
+        bus.bump('cache')
+
+
+def invalidate():
+    '''Make all cached pages data stale
+    '''
+    if get_timeout():
+        deferred.repeat_after_commit(increase_generation)
+
+
+def increase_generation():
+    '''Start a new content generation
+    '''
+    try:
+        get_cache().incr(GENERATION_KEY)
+    except ValueError:  # There is no generation key
+        new_generation()
+    clear_local()
+
+
+def invalidate_pages(aliases):
+    '''Delete cached data and rendered pages with aliases, None alias stands
+    for the default page
+    '''
+    if get_timeout() and aliases:
+        deferred.repeat_after_commit(delete_pages, frozenset(aliases))
+
+
+def delete_pages(aliases):
+    '''Delete cached data and rendered pages
+    '''
+    get_cache().delete_many([key(alias) for alias in aliases
+                             for key in (page_key, html_key)])
+    clear_local()
+
+
+def invalidate_menus(aliases, languages):
+    '''Delete cached menu items and make rendered pages showing menus stale
+    '''
+    aliases = frozenset(aliases)
+    if get_timeout() and aliases:
+        deferred.repeat_after_commit(delete_menus, aliases,
+                                     frozenset(languages))
+
+
+def delete_menus(aliases, languages):
+    '''Delete cached menu items and versions
+    '''
+    backend = get_cache()
+    backend.delete_many([menu_key(alias, language) for alias in aliases
+                         for language in languages])
+    backend.delete_many([menu_version_key(alias) for alias in aliases])
+    clear_local()
+
+
+def menu_versions(aliases):
+    '''Get a dict with current versions of menus, a new random version is
+    started for menus without it
+    '''
+    backend = get_cache()
+    keys = dict((menu_version_key(alias), alias) for alias in aliases)
+    versions = backend.get_many(keys.keys())
+    for key in set(keys) - set(versions):
+        backend.add(key, uuid.uuid4().hex, GENERATION_TIMEOUT)
+        versions[key] = backend.get(key)
+    return dict((keys[key], version) for key, version in versions.items())
+
+
+@contextlib.contextmanager
+def collect_menus():
+    '''Collect aliases of menus shown while block is running
+    '''
+    previous = getattr(_local, 'menus', None)
+    _local.menus = menus = set()
+    try:
+        yield menus
+    finally:
+        _local.menus = previous
+        if previous is not None:  # Menus are shown in outer block too
+            previous.update(menus)
+
+
+def note_menu(alias):
+    '''Remember that menu is shown
+    '''
+    menus = getattr(_local, 'menus', None)
+    if menus is not None:
+        menus.add(alias)
@@ -0,0 +1,83 @@
+'''Keyset paginated changelist for large pages tables.
+
+The default admin changelist counts all filtered pages and pages with
+OFFSET, both get slower as the table grows and the page number goes up.
+With PAGES_ADMIN_KEYSET setting the pages changelist instead:
+
+    seeks the next page by primary key of the last shown page (the "after"
+    query parameter), so every page is read by the index in constant time;
+    counts pages up to PAGES_ADMIN_COUNT_LIMIT only (1000 by default);
+    filters pages by translations with a semijoin subquery, so pages matched
+    by several translations are shown once without DISTINCT.
+
+Pages are shown newest first, sorting by columns isn't supported.
+'''
+from django.conf import settings
+from django.contrib.admin.views import main
+
+KEY_VAR = 'after'
+
+
+def get_count_limit():
+    '''Get the largest count of pages counted exactly
+    '''
+    return getattr(settings, 'PAGES_ADMIN_COUNT_LIMIT', 1000)
+
+
+def limited_count(queryset):
+    '''Count rows of queryset up to the count limit
+    '''
+    # Sliced count() isn't limited in SQL, so only ids are read
+    return len(queryset.order_by().values_list('pk', flat=True)[
+                                                        :get_count_limit()])
+
+
+class KeysetChangeList(main.ChangeList):
+    '''Changelist paginated by primary key without total counts
+    '''
+    keyset = True
+
+    def get_query_set(self, request):
+        '''Get filtered pages, filters by related rows don't duplicate pages
+        '''
+        self.params.pop(KEY_VAR, None)  # Isn't a lookup
+        queryset = super(KeysetChangeList, self).get_query_set(request)
+        if not queryset.query.where:
+            return self.root_query_set
+        matched = queryset.order_by().values_list('pk', flat=True)
+        matched.query.distinct = False  # Semijoin doesn't need it
+        return self.root_query_set.filter(pk__in=matched)
+
+    def get_results(self, request):
+        '''Get a page of results after the key given in request
+        '''
+        queryset = self.query_set.order_by('-pk')
+        try:
+            after = int(request.GET.get(KEY_VAR, 0))
+        except ValueError:
+            raise main.IncorrectLookupParameters
+        if after:
+            queryset = queryset.filter(pk__lt=after)
+        results = list(queryset[:self.list_per_page + 1])
+        self.result_list = results[:self.list_per_page]
+        self.next_key = (self.result_list[-1].pk
+                         if len(results) > self.list_per_page else None)
+        self.is_first_page = not after
+        self.result_count = limited_count(self.query_set)
+        self.full_result_count = (self.result_count
+                                  if not self.query_set.query.where
+                                  else limited_count(self.root_query_set))
+        self.count_limited = self.result_count >= get_count_limit()
+        self.can_show_all = False
+        self.multi_page = self.next_key is not None or not self.is_first_page
+        self.paginator = None
+
+    def next_url(self):
+        '''Get query string of the next page
+        '''
+        return self.get_query_string({KEY_VAR: self.next_key})
+
+    def first_url(self):
+        '''Get query string of the first page
+        '''
+        return self.get_query_string()
@@ -0,0 +1,120 @@
+'''Cloning of site content into a new language.
+
+Translations of all pages in source language are copied with bulk_create,
+their content blocks of all types and links are copied with single
+INSERT ... SELECT queries, so no model instances are created for content.
+Copies get unique aliases made of source alias and language code, and they
+are inactive by default.
+
+Copied articles keep processed html of the source ones, so links rewritten
+by processors point to source language pages until articles are processed
+again (reprocess argument, or pages_reprocess command).
+'''
+from django.db import connection, transaction
+
+import blocks
+import bus
+import cache
+import deferred
+import dependencies
+import models
+import publishing
+import routing
+
+BATCH_SIZE = 500
+SKIPPED_FIELDS = ('id', 'language', 'alias', 'is_active', 'publish_at',
+                  'expire_at', 'updated_at')
+
+
+def unique_alias(alias, language, taken):
+    '''Get alias for copy which isn't taken yet and mark it taken
+    '''
+    length = models.PageTranslation._meta.get_field('alias').max_length
+    base = candidate = ('%s-%s' % (alias, language))[:length]
+    index = 1
+    while candidate in taken:
+        index += 1
+        suffix = '-%d' % index
+        candidate = base[:length - len(suffix)] + suffix
+    taken.add(candidate)
+    return candidate
+
+
+def copy_rows(model, columns, source_language, target_language, after_id):
+    '''Copy rows of model related to translations in source language to
+    translations of the same pages in target language created after id
+    '''
+    quote = connection.ops.quote_name
+    translations = quote(models.PageTranslation._meta.db_table)
+    column = lambda name: quote(model._meta.get_field(name).column)
+    related = column(columns[0])
+    copied = ', '.join('o.%s' % column(name) for name in columns[1:])
+    cursor = connection.cursor()
+    cursor.execute(
+        'INSERT INTO %(table)s (%(related)s, %(columns)s) '
+        'SELECT dst.id, %(copied)s FROM %(table)s o '
+        'JOIN %(translations)s src ON o.%(related)s = src.id '
+        'JOIN %(translations)s dst ON dst.page_id = src.page_id '
+        'WHERE src.language_id = %%s AND dst.language_id = %%s '
+        'AND dst.id > %%s' % {
+            'table': quote(model._meta.db_table), 'related': related,
+            'columns': ', '.join(column(name) for name in columns[1:]),
+            'copied': copied, 'translations': translations},
+        [source_language, target_language, after_id])
+    transaction.set_dirty()
+    return cursor.rowcount
+
+
+@deferred.commit_on_success
+def copy_language(source_language, target_language, active=False):
+    '''Copy translations, articles and links, get a list of ids of created
+    translations
+    '''
+    models.Language.objects.get_or_create(code=target_language)
+    translations = models.PageTranslation.objects
+    last = translations.order_by('-id').values_list('id', flat=True)[:1]
+    after_id = last[0] if last else 0
+    taken = set(translations.values_list('alias', flat=True))
+    fields = [field.attname for field in models.PageTranslation._meta.fields
+              if field.name not in SKIPPED_FIELDS]
+    sources = translations.filter(language=source_language).exclude(
+                        page__in=translations.filter(language=target_language)
+                                             .values('page_id'))
+    translations.bulk_create([
+                models.PageTranslation(language_id=target_language,
+                        alias=unique_alias(values['alias'], target_language,
+                                           taken),
+                        is_active=active,
+                        **dict((name, values[name]) for name in fields))
+                for values in sources.values('alias', *fields).iterator()],
+        batch_size=BATCH_SIZE)
+    for model in blocks.registry.values():
+        copy_rows(model, ('page', ) + tuple(field.name
+                                for field in model._meta.fields
+                                if field.name not in ('id', 'page')),
+                  source_language, target_language, after_id)
+    copy_rows(models.PageLink, ('source', 'target'), source_language,
+              target_language, after_id)
+    return list(translations.filter(language=target_language,
+                                    id__gt=after_id)
+                            .values_list('id', flat=True))
+
+
+def clone_language(source_language, target_language, active=False,
+                   reprocess=False):
+    '''Clone all pages content from source language into target one, get a
+    list of ids of created translations
+    '''
+    created = copy_language(source_language, target_language, active)
+    if reprocess:
+        dependencies.reprocess(created)
+    if active and created:
+        routing.invalidate()
+        if publishing.is_serving_published():
+            publishing.publish(created)
+    # Menus in target language could be cached empty
+    cache.invalidate_menus(models.Menu.objects.values_list('alias',
+                                                           flat=True),
+                           [target_language])
+    deferred.repeat_after_commit(bus.bump, 'languages')
+    return created
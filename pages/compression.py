@@ -0,0 +1,75 @@
+'''Precompressed response bodies.
+
+Bodies are compressed once when they are put into cache and then served in
+the encoding client accepts, so nothing is compressed per request. Brotli is
+used only if brotli package is installed.
+'''
+from django import http
+from django.utils import cache as cache_utils
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Encodings in order of preference
+ENCODINGS = ('br', 'gzip', 'identity')
+
+
+def compress(content):
+    '''Get a dict of bodies for every supported encoding
+    '''
+    bodies = {'identity': content}
+    compressed = compress_string(content)
+    if len(compressed) < len(content):
+        bodies['gzip'] = compressed
+    if brotli is not None:
+        compressed = brotli.compress(content)
+        if len(compressed) < len(content):
+            bodies['br'] = compressed
+    return bodies
+
+
+def accepted_encodings(header):
+    '''Get a set of encodings accepted by Accept-Encoding header value
+    '''
+    accepted = set(['identity'])
+    for part in header.split(','):
+        params = [param.strip() for param in part.split(';')]
+        encoding, quality = params[0].lower(), 1.0
+        if not encoding:
+            continue
+        for param in params[1:]:
+            if param.startswith('q='):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0
+        if quality > 0:
+            accepted.add(encoding)
+        else:
+            accepted.discard(encoding)
+    return accepted
+
+
+def choose_encoding(request, bodies):
+    '''Choose the best encoding available for request
+    '''
+    accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    for encoding in ENCODINGS:
+        if encoding in bodies and (encoding in accepted or '*' in accepted):
+            return encoding
+    return 'identity'
+
+
+def compressed_response(request, bodies, content_type):
+    '''Create response with the body in the best encoding accepted
+    '''
+    encoding = choose_encoding(request, bodies)
+    response = http.HttpResponse(bodies[encoding], content_type=content_type)
+    if encoding != 'identity':
+        response['Content-Encoding'] = encoding
+    response['Content-Length'] = str(len(bodies[encoding]))
+    cache_utils.patch_vary_headers(response, ('Accept-Encoding', ))
+    return response
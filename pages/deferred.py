@@ -0,0 +1,95 @@
+'''Work deferred until the end of database transaction.
+
+Data derived from models (caches, routing table) should be refreshed only
+after changes are committed, otherwise concurrent readers could store
+uncommitted or old rows into them. Callbacks passed to after_commit() inside
+a managed transaction are queued (once for the same callback and arguments)
+and run when the transaction ends:
+
+    after requests, so changes made by admin views (and views wrapped with
+    TransactionMiddleware) are handled;
+    after functions decorated with deferred.commit_on_success.
+
+Outside managed transactions changes are already committed, so callbacks are
+run at once. Callbacks of rolled back transactions are run too, they should
+only drop derived data.
+'''
+import collections
+import functools
+import logging
+import threading
+
+from django.core import signals
+from django.db import transaction
+from django.dispatch import receiver
+
+logger = logging.getLogger('pages')
+
+_local = threading.local()
+
+
+def get_pending():
+    '''Get an ordered dict with (callback, arguments) keys queued by the
+    current thread, used as an ordered set
+    '''
+    pending = getattr(_local, 'pending', None)
+    if pending is None:
+        pending = _local.pending = collections.OrderedDict()
+    return pending
+
+
+def after_commit(callback, *args):
+    '''Run callback with arguments after the current transaction ends
+    '''
+    if not transaction.is_managed():
+        callback(*args)
+        return
+    get_pending()[(callback, args)] = None
+
+
+def repeat_after_commit(callback, *args):
+    '''Run callback with arguments now and once more after the current
+    transaction ends, for work which is needed at once but could be undone by
+    concurrent readers of old rows until commit
+    '''
+    callback(*args)
+    if transaction.is_managed():
+        after_commit(callback, *args)
+
+
+def run_pending():
+    '''Run queued callbacks, failures are logged
+    '''
+    pending = get_pending()
+    while pending:
+        (callback, args), __ = pending.popitem(last=False)
+        try:
+            callback(*args)
+        except Exception:  # pylint: disable=W0703
+            logger.exception('Deferred %r failed', callback)
+
+
+def commit_on_success(function):
+    '''The same as transaction.commit_on_success, but callbacks queued in
+    the transaction are run after it
+    '''
+    managed = transaction.commit_on_success(function)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        '''Run function in transaction
+        '''
+        try:
+            return managed(*args, **kwargs)
+        finally:
+            if not transaction.is_managed():
+                run_pending()
+    return wrapper
+
+
+@receiver(signals.request_finished)
+def request_finished(sender, **kwargs):
+    '''Run callbacks queued while handling request
+    '''
+    if not transaction.is_managed():
+        run_pending()
@@ -0,0 +1,238 @@
+'''Dependencies between pages used for precise invalidation.
+
+Internal links are extracted from PageArticle.text on save and kept in
+PageLink table, menus are related to pages by MenuItem rows. When a page
+translation changes only cached data and rendered pages of the translation
+itself, of translations linking to its page and of menus showing it are
+invalidated. Articles linking to a page by its alias are processed again when
+the alias changes, so rewritten links stay correct.
+
+Handlers run inside transactions making changes, cache entries they delete
+are deleted once more after the transaction ends (see deferred module), so
+pages cached by concurrent readers of old rows don't stay stale.
+
+affected_aliases() can be used by anything keeping pages output outside of
+cache (like static export) to find out which pages should be rebuilt.
+'''
+import re
+import urlparse
+
+from django.core import urlresolvers
+from django.db.models import signals
+from django.dispatch import receiver
+
+import cache
+import models
+import processing
+import signals as pages_signals
+
+HREF_RE = re.compile(r'''\shref\s*=\s*["']([^"']+)["']''', re.I)
+
+
+def extract_links(text):
+    '''Get a set of page ids and a set of aliases linked from html text
+    '''
+    page_ids = set(int(match.group(2))
+                   for match in processing.PAGE_LINK_RE.finditer(text))
+    aliases = set()
+    for href in HREF_RE.findall(text):
+        url = urlparse.urlsplit(href)
+        if url.scheme or url.netloc or not url.path.startswith('/'):
+            continue
+        try:
+            match = urlresolvers.resolve(url.path)
+        except urlresolvers.Resolver404:
+            continue
+        if match.url_name == 'show_page' and match.kwargs.get('slug'):
+            aliases.add(match.kwargs['slug'])
+    return page_ids, aliases
+
+
+def update_links(translation_id):
+    '''Rebuild links of page translation from texts of its articles
+    '''
+    page_ids, aliases = set(), set()
+    for text in models.PageArticle.objects.filter(page=translation_id)\
+                                .values_list('text_body__content', flat=True):
+        article_page_ids, article_aliases = extract_links(text)
+        page_ids.update(article_page_ids)
+        aliases.update(article_aliases)
+    if aliases:
+        page_ids.update(models.PageTranslation.objects.filter(
+                    alias__in=aliases).values_list('page_id', flat=True))
+    page_ids = set(models.Page.objects.filter(pk__in=page_ids)
+                                      .values_list('id', flat=True))
+    links = models.PageLink.objects.filter(source=translation_id)
+    existing = set(links.values_list('target_id', flat=True))
+    if existing - page_ids:
+        links.filter(target__in=existing - page_ids).delete()
+    models.PageLink.objects.bulk_create([
+                models.PageLink(source_id=translation_id, target_id=page_id)
+                for page_id in page_ids - existing])
+
+
+def dependent_translations(translation_ids):
+    '''Get ids of translations linking to pages of translations with ids in
+    the same language
+    '''
+    targets = set(models.PageTranslation.objects.filter(
+                pk__in=translation_ids).values_list('page_id', 'language_id'))
+    if not targets:
+        return set()
+    links = models.PageLink.objects.filter(
+                target__in=set(page_id for page_id, __ in targets),
+                source__language__in=set(language for __, language in targets))
+    dependent = set(source_id for source_id, target_id, language
+                    in links.values_list('source_id', 'target_id',
+                                         'source__language')
+                    if (target_id, language) in targets)
+    return dependent - set(translation_ids)
+
+
+def translation_aliases(translation_ids):
+    '''Get a set of aliases of translations, None stands for the default page
+    '''
+    aliases = set()
+    translations = models.PageTranslation.objects.filter(
+            pk__in=translation_ids).values_list('alias', 'page__is_default')
+    for alias, is_default in translations:
+        aliases.add(alias)
+        if is_default:
+            aliases.add(None)
+    return aliases
+
+
+def affected_translations(translation_ids):
+    '''Get ids of translations whose pages output depends on translations
+    with ids, including themselves
+    '''
+    return set(translation_ids) | dependent_translations(translation_ids)
+
+
+def affected_aliases(translation_ids):
+    '''Get aliases of pages whose output depends on translations with ids
+    '''
+    return translation_aliases(affected_translations(translation_ids))
+
+
+def page_menus(page_ids):
+    '''Get aliases of menus showing pages
+    '''
+    return set(models.MenuItem.objects.filter(page__in=page_ids)
+                                      .values_list('menu_id', flat=True))
+
+
+def all_languages():
+    '''Get codes of all languages
+    '''
+    return list(models.Language.objects.values_list('code', flat=True))
+
+
+def reprocess(translation_ids):
+    '''Process articles of translations again
+    '''
+    articles = models.PageArticle.objects.filter(page__in=translation_ids)
+    for article in articles.select_related('page', 'text_body'):
+        article.save()
+
+
+@receiver(signals.post_init, sender=models.PageTranslation)
+def remember_alias(sender, instance, **kwargs):
+    '''Remember alias translation was loaded with
+    '''
+    instance._loaded_alias = instance.__dict__.get('alias')
+
+
+@receiver(signals.post_save, sender=models.PageTranslation)
+@receiver(signals.post_delete, sender=models.PageTranslation)
+def translation_changed(sender, instance, **kwargs):
+    '''Invalidate translation page, pages linking to it and menus showing it
+    '''
+    aliases = set([instance.alias, getattr(instance, '_loaded_alias', None)])
+    if models.Page.objects.filter(pk=instance.page_id,
+                                  is_default=True).exists():
+        aliases.add(None)
+    cache.invalidate_pages(aliases)
+    cache.invalidate_menus(page_menus([instance.page_id]),
+                           [instance.language_id])
+    if not kwargs.get('created'):
+        dependent = dependent_translations([instance.pk])
+        if dependent and instance._loaded_alias != instance.alias:
+            reprocess(dependent)  # Links rewritten with old alias
+        cache.invalidate_pages(translation_aliases(dependent))
+    instance._loaded_alias = instance.alias
+
+
+@receiver(signals.post_save, sender=models.PageArticle)
+@receiver(signals.post_delete, sender=models.PageArticle)
+def article_changed(sender, instance, **kwargs):
+    '''Update links of article page translation and invalidate it
+    '''
+    # Links are deleted together with translation
+    if (kwargs['signal'] is signals.post_save or models.PageTranslation
+                            .objects.filter(pk=instance.page_id).exists()):
+        update_links(instance.page_id)
+    cache.invalidate_pages(translation_aliases([instance.page_id]))
+
+
+@receiver(signals.post_save, sender=models.Page)
+def page_changed(sender, instance, **kwargs):
+    '''Default page could be changed
+    '''
+    cache.invalidate_pages([None])
+
+
+@receiver(signals.post_save, sender=models.Layout)
+@receiver(signals.post_delete, sender=models.Layout)
+def layout_changed(sender, instance, **kwargs):
+    '''Invalidate pages shown with layout
+    '''
+    cache.invalidate_pages(translation_aliases(
+                        models.PageTranslation.objects.filter(layout=instance)
+                                              .values_list('id', flat=True)))
+
+
+@receiver(signals.post_save, sender=models.Menu)
+@receiver(signals.post_delete, sender=models.Menu)
+def menu_changed(sender, instance, **kwargs):
+    '''Invalidate menu and pages showing it
+    '''
+    cache.invalidate_menus([instance.alias], all_languages())
+
+
+@receiver(signals.post_save, sender=models.MenuItem)
+@receiver(signals.post_delete, sender=models.MenuItem)
+def menu_item_changed(sender, instance, **kwargs):
+    '''Invalidate menu of item and pages showing it
+    '''
+    cache.invalidate_menus([instance.menu_id], all_languages())
+
+
+@receiver(signals.m2m_changed, sender=models.MenuItem)
+def menu_items_changed(sender, instance, **kwargs):
+    '''Invalidate menus changed in bulk
+    '''
+    if isinstance(instance, models.Menu):
+        menus = [instance.pk]
+    else:
+        menus = models.Menu.objects.values_list('alias', flat=True)
+    cache.invalidate_menus(menus, all_languages())
+
+
+@receiver(signals.post_delete, sender=models.PublishedPage)
+def published_page_deleted(sender, instance, **kwargs):
+    '''Invalidate unpublished page
+    '''
+    cache.invalidate_pages([instance.alias, None] if instance.is_default
+                           else [instance.alias])
+
+
+@receiver(pages_signals.pages_published)
+def pages_published(sender, translation_ids, aliases=(), **kwargs):
+    '''Invalidate published and replaced pages, pages depending on them and
+    menus showing them
+    '''
+    cache.invalidate_pages(affected_aliases(translation_ids) | set(aliases))
+    page_ids = models.PageTranslation.objects.filter(
+                    pk__in=translation_ids).values_list('page_id', flat=True)
+    cache.invalidate_menus(page_menus(page_ids), all_languages())
@@ -6,6 +6,7 @@ import unidecode
 
 from django import forms
 from django.contrib.admin import widgets
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
 from tinymce.widgets import TinyMCE
@@ -54,6 +55,14 @@ class PageTranslationForm(forms.ModelForm):
             cleaned_data['header'] = cleaned_data.get('title_tag', '')
         if not cleaned_data.get('alias', None):
             cleaned_data['alias'] = slugify(cleaned_data.get('title_tag', ''))
+        publish_at = cleaned_data.get('publish_at')
+        expire_at = cleaned_data.get('expire_at')
+        if publish_at and expire_at and expire_at <= publish_at:
+            raise forms.ValidationError(
+                            _('Page should expire after it is published'))
+        if publish_at and publish_at > timezone.now():
+            # Page is activated by schedule, not at once
+            cleaned_data['is_active'] = False
         return cleaned_data
 
     def save(self, commit=True, page=None):
@@ -71,6 +80,7 @@ class PageTranslationForm(forms.ModelForm):
     FIELD_GROUPS = (
         ('title_tag', 'layout', 'alias', ),
         ('header', 'title', 'is_active', ),
+        ('publish_at', 'expire_at', ),
         ('meta_description', 'meta_keywords', )
     )
 
@@ -128,7 +138,8 @@ class PageContentForm(forms.ModelForm):
         # Create form
         super(PageContentForm, self).__init__(*args, **kwargs)
         # Update a widget
-        self.fields['text'].widget = TinyMCE()
+        if 'text' in self.fields:
+            self.fields['text'].widget = TinyMCE()
 
     def save(self, commit=True, page=None):
         '''Save object
@@ -148,6 +159,44 @@ class PageContentForm(forms.ModelForm):
         exclude = ('layout', 'page', 'place', )  # Set them manually
 
 
+class PageArticleForm(PageContentForm):
+    '''Form for page articles, text is kept in article bodies
+    '''
+    text = forms.CharField(label=_('page text'),
+                           help_text=_('page html content'))
+
+    def __init__(self, *args, **kwargs):
+        '''Create form with article text
+        '''
+        super(PageArticleForm, self).__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.initial.setdefault('text', self.instance.text)
+
+    def save(self, commit=True, page=None):
+        '''Save article with text
+        '''
+        self.instance.text = self.cleaned_data['text']
+        return super(PageArticleForm, self).save(commit, page)
+
+
+_content_forms = {models.PageArticle: PageArticleForm}
+
+
+def get_content_form(model):
+    '''Get admin form class for blocks of block type model
+    '''
+    if model not in _content_forms:
+        block_model = model
+
+        class ContentForm(PageContentForm):
+            '''Form of block type model
+            '''
+            class Meta(PageContentForm.Meta):
+                model = block_model
+        _content_forms[model] = ContentForm
+    return _content_forms[model]
+
+
 def get_filter_func(items):
     '''Get function for 
     '''
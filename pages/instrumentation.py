@@ -0,0 +1,299 @@
+'''Instrumentation of pages hot paths.
+
+Counts SQL queries to all databases, total database time and pages cache hits
+and misses for tracked blocks of code:
+
+    with instrumentation.track('my_block'):
+        ...
+
+    @instrumentation.track('page_view')
+    def page_view(request, slug=None):
+        ...
+
+Tracking is off until PAGES_INSTRUMENTATION setting is on. Then every tracked
+block is checked against its budget from PAGES_QUERY_BUDGETS setting (a dict
+{name: max queries}), blocks exceeded their budget are logged with 'pages'
+logger. Finished trackers are passed into the callable (or its dotted path)
+from PAGES_METRICS_CALLBACK setting.
+
+InstrumentationMiddleware tracks whole requests by view name. Blocks run by
+pool threads for a tracked block (see parallel module) are counted for it.
+'''
+import contextlib
+import functools
+import logging
+import threading
+import time
+
+from django import db
+from django.conf import settings
+from django.utils import importlib
+
+logger = logging.getLogger('pages')
+
+_local = threading.local()
+
+
+def is_enabled():
+    '''Check is instrumentation turned on
+    '''
+    return getattr(settings, 'PAGES_INSTRUMENTATION', False)
+
+
+def get_budget(name):
+    '''Get queries budget for tracked block name
+    '''
+    return getattr(settings, 'PAGES_QUERY_BUDGETS', {}).get(name)
+
+
+def get_callback():
+    '''Get metrics callback
+    '''
+    callback = getattr(settings, 'PAGES_METRICS_CALLBACK', None)
+    if isinstance(callback, basestring):
+        module, attr = callback.rsplit('.', 1)
+        callback = getattr(importlib.import_module(module), attr)
+    return callback
+
+
+def active_trackers():
+    '''Get a list of trackers running in current thread
+    '''
+    if not hasattr(_local, 'trackers'):
+        _local.trackers = []
+    return _local.trackers
+
+
+def count_cache(hit):
+    '''Count pages cache hit or miss for running trackers
+    '''
+    for tracker in active_trackers():
+        if hit:
+            tracker.cache_hits += 1
+        else:
+            tracker.cache_misses += 1
+
+
+class Tracker(object):
+    '''Counters for a tracked block of code
+    '''
+
+    def __init__(self, name, budget=None):
+        '''Create new tracker, queries to all databases are counted
+        '''
+        self.name = name
+        self.budget = get_budget(name) if budget is None else budget
+        self.connections = db.connections.all()
+        self.queries = self.cache_hits = self.cache_misses = 0
+        self.db_time = self.duration = 0.0
+        self.started = None
+        self.debug_cursors = None
+        self.first_queries = None
+        self.carried = []  # Trackers of blocks run by other threads
+
+    @property
+    def over_budget(self):
+        '''Check were there more queries than budget allows
+        '''
+        return self.budget is not None and self.queries > self.budget
+
+    def start(self):
+        '''Start tracking
+        '''
+        trackers = active_trackers()
+        if not trackers:
+            self.debug_cursors = [connection.use_debug_cursor
+                                  for connection in self.connections]
+            for connection in self.connections:
+                connection.use_debug_cursor = True
+        trackers.append(self)
+        self.first_queries = [len(connection.queries)
+                              for connection in self.connections]
+        self.started = time.time()
+
+    def stop(self):
+        '''Stop tracking, check budget and report metrics
+        '''
+        self.finish()
+        if self.over_budget:
+            logger.warning('%s made %d queries (%.1fms) while budget is %d',
+                           self.name, self.queries, self.db_time * 1000,
+                           self.budget)
+        callback = get_callback()
+        if callback is not None:
+            callback(self)
+
+    def finish(self):
+        '''Stop counting, add counters of carried trackers
+        '''
+        self.duration = time.time() - self.started
+        queries = [query for connection, first in zip(self.connections,
+                                                      self.first_queries)
+                   for query in connection.queries[first:]]
+        self.queries = len(queries)
+        self.db_time = sum(float(query['time']) for query in queries)
+        for tracker in self.carried:
+            self.queries += tracker.queries
+            self.db_time += tracker.db_time
+            self.cache_hits += tracker.cache_hits
+            self.cache_misses += tracker.cache_misses
+        trackers = active_trackers()
+        trackers.remove(self)
+        if not trackers:
+            for connection, debug_cursor in zip(self.connections,
+                                                self.debug_cursors):
+                connection.use_debug_cursor = debug_cursor
+                if not (debug_cursor or settings.DEBUG):
+                    # Do not keep queries log nobody asked for
+                    del connection.queries[:]
+
+    def __enter__(self):
+        '''Start tracking block
+        '''
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        '''Stop tracking block
+        '''
+        self.stop()
+
+
+class NullTracker(object):
+    '''Tracker used when instrumentation is turned off
+    '''
+
+    def __enter__(self):
+        '''Do nothing
+        '''
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        '''Do nothing
+        '''
+        pass
+
+
+class Track(object):
+    '''Context manager and decorator creating trackers. Tracking of view
+    continues until its template response is rendered
+    '''
+
+    def __init__(self, name, budget=None):
+        '''Remember name and budget for trackers
+        '''
+        self.name = name
+        self.budget = budget
+        self.tracker = None
+
+    def __enter__(self):
+        '''Start tracking block
+        '''
+        self.tracker = (Tracker(self.name, self.budget) if is_enabled()
+                        else NullTracker())
+        return self.tracker.__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        '''Stop tracking block
+        '''
+        return self.tracker.__exit__(exc_type, exc_value, traceback)
+
+    def __call__(self, function):
+        '''Decorate function to track its calls
+        '''
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            '''Call function with tracking
+            '''
+            if not is_enabled():
+                return function(*args, **kwargs)
+            tracker = Tracker(self.name, self.budget)
+            tracker.start()
+            try:
+                result = function(*args, **kwargs)
+            except:
+                tracker.stop()
+                raise
+            if (hasattr(result, 'add_post_render_callback')
+                    and not result.is_rendered):
+                result.add_post_render_callback(
+                                        lambda response: tracker.stop())
+            else:
+                tracker.stop()
+            return result
+        return wrapper
+
+
+def track(name, budget=None):
+    '''Get a tracker for a block of code, it can be used as a decorator too
+    '''
+    return Track(name, budget)
+
+
+class InstrumentationMiddleware(object):
+    '''Track every request with name of its view
+    '''
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        '''Start tracking of view
+        '''
+        if is_enabled():
+            name = '.'.join((view_func.__module__,
+                             getattr(view_func, '__name__',
+                                     view_func.__class__.__name__)))
+            request._pages_tracker = Tracker(name)
+            request._pages_tracker.start()
+
+    def process_response(self, request, response):
+        '''Finish tracking
+        '''
+        tracker = getattr(request, '_pages_tracker', None)
+        if tracker is not None:
+            del request._pages_tracker
+            tracker.stop()
+        return response
+
+
+@contextlib.contextmanager
+def carried(trackers):
+    '''Count queries and cache hits of a block run by pool thread for
+    trackers started by the thread passing the block
+    '''
+    if not trackers:
+        yield
+        return
+    tracker = Tracker('carried')
+    tracker.start()
+    try:
+        yield
+    finally:
+        tracker.finish()
+        for started in trackers:
+            started.carried.append(tracker)
+
+
+@contextlib.contextmanager
+def assert_budget(queries, name='assert_budget'):
+    '''Test helper: fail if a block makes more queries than allowed
+    '''
+    tracker = Tracker(name, queries)
+    with tracker:
+        yield tracker
+    if tracker.over_budget:
+        raise AssertionError('%s made %d queries while budget is %d' %
+                             (name, tracker.queries, queries))
+
+
+class BudgetAssertionsMixin(object):
+    '''TestCase mixin with query budget assertions
+    '''
+
+    def assertQueryBudget(self, name, function, *args, **kwargs):
+        '''Call function and fail if it makes more queries than budget for
+        name from PAGES_QUERY_BUDGETS setting allows
+        '''
+        budget = get_budget(name)
+        if budget is None:
+            raise AssertionError('There is no budget for %s' % name)
+        with assert_budget(budget, name):
+            return function(*args, **kwargs)
@@ -0,0 +1,94 @@
+'''Size-bounded least recently used cache kept in memory of the process.
+
+Used as the first tier in front of the shared pages cache, see cache module.
+Size of entries is estimated with length of their pickled form, that is
+close to what the shared cache stores.
+'''
+import collections
+import cPickle as pickle
+import random
+import threading
+import time
+
+MISSING = object()
+
+
+class LRUCache(object):
+    '''Cache bounded by entries count and approximate size in bytes. Entries
+    expire after timeout shortened by random jitter, so entries set together
+    don't expire together
+    '''
+
+    def __init__(self, max_entries, max_bytes=0, timeout=5, jitter=0.1):
+        '''Create empty cache, zero max_bytes means size isn't limited
+        '''
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.jitter = jitter
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        '''Get value for key or MISSING if there is no fresh value
+        '''
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    self.bytes -= entry[2]
+                self.misses += 1
+                return MISSING
+            self.entries[key] = entry  # Move to the most recent end
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, timeout=None):
+        '''Put value for key, its timeout can be only shorter than the cache
+        one
+        '''
+        size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        if self.max_bytes and size > self.max_bytes:
+            return
+        timeout = min(self.timeout, timeout or self.timeout)
+        expires = time.time() + timeout * (1 - random.uniform(0, self.jitter))
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[2]
+            self.entries[key] = (expires, value, size)
+            self.bytes += size
+            while (len(self.entries) > self.max_entries
+                   or self.max_bytes and self.bytes > self.max_bytes):
+                __, entry = self.entries.popitem(last=False)
+                self.bytes -= entry[2]
+                self.evictions += 1
+
+    def delete_many(self, keys):
+        '''Delete values for keys
+        '''
+        with self.lock:
+            for key in keys:
+                entry = self.entries.pop(key, None)
+                if entry is not None:
+                    self.bytes -= entry[2]
+
+    def clear(self):
+        '''Delete all values
+        '''
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        '''Get a dict with usage statistics
+        '''
+        with self.lock:
+            requests = self.hits + self.misses
+            return {'entries': len(self.entries), 'bytes': self.bytes,
+                    'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions,
+                    'hit_ratio': float(self.hits) / requests if requests
+                                 else 0.0}
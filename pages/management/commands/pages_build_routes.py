@@ -0,0 +1,56 @@
+'''Build shared routing table file for pages
+'''
+import time
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from pages import bus, routing
+
+
+class Command(BaseCommand):
+    '''Serialize aliases of active page translations into routing table file
+    mapped into memory by worker processes. With --loop option the table is
+    rebuilt whenever it's marked stale (see PAGES_ROUTING_TABLE_AUTO)
+    '''
+    help = 'Build routing table file used to resolve page aliases'
+    option_list = BaseCommand.option_list + (
+        make_option('--output', dest='output', default=None,
+                    help='Path to table file, PAGES_ROUTING_TABLE by default'),
+        make_option('--loop', dest='loop', action='store_true',
+                    default=False,
+                    help='Keep running and rebuild the table when it\'s stale'),
+        make_option('--interval', dest='interval', type='float', default=1.0,
+                    help='Seconds between checks in loop mode'),
+    )
+
+    def handle(self, *args, **options):
+        '''Build the table
+        '''
+        path = options['output'] or getattr(settings, 'PAGES_ROUTING_TABLE',
+                                            None)
+        if not path:
+            raise CommandError('Set PAGES_ROUTING_TABLE or use --output')
+        stale = [True]
+        bus.subscribe('routing-table', lambda: stale.__setitem__(0, True))
+        bus.poll(force=True)
+        while True:
+            if stale[0]:
+                stale[0] = False
+                self.build(path, int(options['verbosity']))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+            bus.poll(force=True)
+
+    def build(self, path, verbosity):
+        '''Build the table and report it
+        '''
+        routing.build_table(path)
+        table = routing.RouteTable(path)
+        if verbosity:
+            self.stdout.write('Routing table %s built: %d aliases, '
+                              'version %d\n' % (path, len(table),
+                                                table.version))
+        table.close()
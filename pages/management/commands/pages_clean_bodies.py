@@ -0,0 +1,19 @@
+'''Delete article bodies not used by articles
+'''
+from django.core.management.base import BaseCommand
+
+from pages import models
+
+
+class Command(BaseCommand):
+    '''Delete texts and processed html left after articles were changed or
+    deleted. Should be run when articles aren't edited
+    '''
+    help = 'Delete article bodies not referenced by page articles'
+
+    def handle(self, *args, **options):
+        '''Delete bodies
+        '''
+        deleted = models.ArticleBody.objects.delete_unused()
+        if int(options['verbosity']):
+            self.stdout.write('%d article bodies deleted\n' % deleted)
@@ -0,0 +1,35 @@
+'''Clone pages content into a new language
+'''
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pages import cloning, models
+
+
+class Command(BaseCommand):
+    '''Copy translations of all pages with their articles from source
+    language into target one
+    '''
+    args = '<source language> <target language>'
+    help = 'Copy all pages content from source language into target one'
+    option_list = BaseCommand.option_list + (
+        make_option('--active', dest='active', action='store_true',
+                    default=False, help='Make copies active'),
+        make_option('--reprocess', dest='reprocess', action='store_true',
+                    default=False,
+                    help='Process copied articles for the target language'),
+    )
+
+    def handle(self, *args, **options):
+        '''Clone content
+        '''
+        if len(args) != 2:
+            raise CommandError('Set source and target languages')
+        source, target = args
+        if not models.Language.objects.filter(code=source).exists():
+            raise CommandError('There is no language %s' % source)
+        created = cloning.clone_language(source, target, options['active'],
+                                         options['reprocess'])
+        if int(options['verbosity']):
+            self.stdout.write('%d page translations created\n' % len(created))
@@ -0,0 +1,97 @@
+'''Move texts of page articles into article bodies
+'''
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connections, router, transaction
+
+from pages import models, processing
+
+
+class Command(BaseCommand):
+    '''Convert page articles created before article bodies: texts and
+    processed html of text and html columns are stored as ArticleBody rows,
+    articles reference them and the old columns are dropped. Should be run
+    once after syncdb created pages_articlebody table, while articles aren't
+    edited
+    '''
+    help = ('Move article texts of old pages_pagearticle columns into '
+            'article bodies')
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size', dest='chunk_size', type='int',
+                    default=500, help='Count of articles converted at once'),
+    )
+
+    def handle(self, *args, **options):
+        '''Convert articles
+        '''
+        using = router.db_for_write(models.PageArticle)
+        connection = connections[using]
+        table = models.PageArticle._meta.db_table
+        cursor = connection.cursor()
+        columns = [column[0] for column in connection.introspection
+                                    .get_table_description(cursor, table)]
+        if 'text' not in columns:
+            raise CommandError('Articles are converted already')
+        if models.ArticleBody._meta.db_table not in \
+                connection.introspection.table_names():
+            raise CommandError('Run syncdb to create article bodies table')
+        with transaction.commit_on_success(using=using):
+            self.add_columns(connection, columns)
+            converted = self.convert(connection, 'html' in columns,
+                                     options['chunk_size'])
+            for column in ('text', 'html'):
+                if column in columns:
+                    cursor.execute('ALTER TABLE %s DROP COLUMN %s' % (
+                                        connection.ops.quote_name(table),
+                                        connection.ops.quote_name(column)))
+        if int(options['verbosity']):
+            self.stdout.write('%d articles converted\n' % converted)
+
+    def add_columns(self, connection, columns):
+        '''Add missing columns referencing article bodies
+        '''
+        quote = connection.ops.quote_name
+        cursor = connection.cursor()
+        for name in ('text_body', 'html_body'):
+            field = models.PageArticle._meta.get_field(name)
+            if field.column in columns:
+                continue
+            cursor.execute('ALTER TABLE %s ADD COLUMN %s %s NULL' % (
+                                quote(models.PageArticle._meta.db_table),
+                                quote(field.column),
+                                field.db_type(connection=connection)))
+            for sql in connection.creation.sql_indexes_for_field(
+                                    models.PageArticle, field, no_style()):
+                cursor.execute(sql)
+
+    def convert(self, connection, has_html, chunk_size):
+        '''Store texts of articles without bodies, get a count of converted
+        articles. Html is processed again if it wasn't stored
+        '''
+        quote = connection.ops.quote_name
+        meta = models.PageArticle._meta
+        query = 'SELECT %s, %s, %s FROM %s WHERE %s > %%s AND %s IS NULL ' \
+                'ORDER BY %s LIMIT %d' % (
+                        quote(meta.pk.column), quote('text'),
+                        quote('html') if has_html else quote('text'),
+                        quote(meta.db_table), quote(meta.pk.column),
+                        quote(meta.get_field('text_body').column),
+                        quote(meta.pk.column), chunk_size)
+        cursor = connection.cursor()
+        last_pk, converted = 0, 0
+        while True:
+            cursor.execute(query, [last_pk])
+            chunk = cursor.fetchall()
+            if not chunk:
+                break
+            for pk, text, html in chunk:
+                models.PageArticle.objects.filter(pk=pk).update(
+                    text_body=models.ArticleBody.objects.store(text or u''),
+                    html_body=models.ArticleBody.objects.store(
+                        (html or u'') if has_html
+                        else processing.process(text or u'')))
+            converted += len(chunk)
+            last_pk = chunk[-1][0]
+        return converted
@@ -0,0 +1,33 @@
+'''Publish pages
+'''
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pages import models, publishing
+
+
+class Command(BaseCommand):
+    '''Publish translations of pages with aliases or all translations
+    '''
+    args = '<alias alias ...>'
+    help = 'Publish page translations with aliases (or all of them)'
+    option_list = BaseCommand.option_list + (
+        make_option('--all', dest='all', action='store_true', default=False,
+                    help='Publish all page translations'),
+    )
+
+    def handle(self, *aliases, **options):
+        '''Publish pages
+        '''
+        if options['all']:
+            published = publishing.publish_all()
+        elif aliases:
+            published = publishing.publish(
+                    models.PageTranslation.objects.filter(alias__in=aliases)
+                                          .values_list('id', flat=True))
+        else:
+            raise CommandError('Set aliases of pages or use --all')
+        if int(options['verbosity']):
+            self.stdout.write('%d page translations published\n' %
+                              len(published))
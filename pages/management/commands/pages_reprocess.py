@@ -0,0 +1,49 @@
+'''Reprocess page articles content
+'''
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from pages import cache, models, processing, publishing
+
+
+class Command(BaseCommand):
+    '''Run content processors for all page articles and store results
+    '''
+    help = 'Process text of all page articles again'
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size', dest='chunk_size', type='int',
+                    default=500, help='Count of articles loaded at once'),
+        make_option('--republish', dest='republish', action='store_true',
+                    default=False,
+                    help='Publish again changed pages which are published'),
+    )
+
+    def handle(self, *args, **options):
+        '''Reprocess articles
+        '''
+        chunk_size = options['chunk_size']
+        articles = models.PageArticle.objects.select_related('page',
+                                    'text_body', 'html_body').order_by('pk')
+        last_pk, processed, changed = 0, 0, set()
+        while True:
+            chunk = list(articles.filter(pk__gt=last_pk)[:chunk_size])
+            if not chunk:
+                break
+            for article in chunk:
+                html = processing.process(article.text, article)
+                if html != article.html:
+                    # Update the column only, content itself isn't changed
+                    models.PageArticle.objects.filter(pk=article.pk).update(
+                            html_body=models.ArticleBody.objects.store(html))
+                    changed.add(article.page_id)
+            processed += len(chunk)
+            last_pk = chunk[-1].pk
+        cache.invalidate()
+        if options['republish'] and changed:
+            publishing.publish(models.PublishedPage.objects.filter(
+                                        translation__in=changed)
+                                    .values_list('translation_id', flat=True))
+        if int(options['verbosity']):
+            self.stdout.write('%d articles processed, %d pages changed\n' %
+                              (processed, len(changed)))
@@ -0,0 +1,40 @@
+'''Apply scheduled publishing transitions
+'''
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from pages import scheduling
+
+
+class Command(BaseCommand):
+    '''Activate page translations with due publish_at and deactivate ones
+    with due expire_at. Should be run by cron, or with --loop option
+    '''
+    help = 'Apply due scheduled publishing transitions of pages'
+    option_list = BaseCommand.option_list + (
+        make_option('--loop', dest='loop', action='store_true',
+                    default=False,
+                    help='Keep running and apply transitions when due'),
+        make_option('--interval', dest='interval', type='int', default=60,
+                    help='The longest sleep between checks in loop mode'),
+    )
+
+    def handle(self, *args, **options):
+        '''Apply transitions
+        '''
+        while True:
+            changed = scheduling.apply_due()
+            if int(options['verbosity']):
+                self.stdout.write('%d page translations changed\n' %
+                                  len(changed))
+            if not options['loop']:
+                break
+            transition = scheduling.get_next_transition()
+            delay = options['interval']
+            if transition is not None:
+                seconds = (transition - timezone.now()).total_seconds()
+                delay = max(1, min(delay, seconds))
+            time.sleep(delay)
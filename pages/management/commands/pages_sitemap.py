@@ -0,0 +1,33 @@
+'''Write sitemap files of pages
+'''
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pages import sitemap
+
+
+class Command(BaseCommand):
+    '''Write sitemap index and sections files, so they can be served as
+    static files
+    '''
+    help = 'Write sitemap files of active page translations'
+    option_list = BaseCommand.option_list + (
+        make_option('--output', dest='output', default=None,
+                    help='Directory to write sitemap files to'),
+        make_option('--base-url', dest='base_url', default=None,
+                    help='Scheme and host of site, like https://example.com'),
+        make_option('--gzip', dest='gzip', action='store_true',
+                    default=False, help='Write gzipped files'),
+    )
+
+    def handle(self, *args, **options):
+        '''Write files
+        '''
+        if not options['output'] or not options['base_url']:
+            raise CommandError('Set --output and --base-url')
+        names = sitemap.write(options['output'],
+                              options['base_url'].rstrip('/'),
+                              options['gzip'])
+        if int(options['verbosity']):
+            self.stdout.write('%d sitemap files written\n' % len(names))
@@ -0,0 +1,60 @@
+'''Warm up pages caches
+'''
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pages import cache, warmup
+
+
+class Command(BaseCommand):
+    '''Fill menus, page data and rendered pages caches for all active pages
+    '''
+    help = 'Fill pages caches for all active pages and menus'
+    option_list = BaseCommand.option_list + (
+        make_option('--workers', dest='workers', type='int', default=4,
+                    help='Size of the workers pool'),
+        make_option('--processes', dest='processes', action='store_true',
+                    default=False, help='Use processes instead of threads'),
+        make_option('--no-priority', dest='prioritize', action='store_false',
+                    default=True,
+                    help="Don't warm default and menu pages first"),
+    )
+
+    def handle(self, *args, **options):
+        '''Run warm-up
+        '''
+        if not cache.get_timeout():
+            raise CommandError('Pages cache is disabled, set '
+                               'PAGES_CACHE_TIMEOUT')
+        verbosity = int(options['verbosity'])
+        tasks = warmup.get_tasks(options['prioritize'])
+        stats = {'done': 0, 'errors': 0, 'slowest': (0, None)}
+        started = time.time()
+
+        def report(result):
+            '''Report task result
+            '''
+            task, duration, error = result
+            stats['done'] += 1
+            stats['slowest'] = max(stats['slowest'], (duration, task))
+            if error:
+                stats['errors'] += 1
+                self.stderr.write('%s failed: %s\n' % (task, error))
+            elif verbosity > 1:
+                self.stdout.write('[%d/%d] %s %.3fs\n' % (stats['done'],
+                                            len(tasks), task, duration))
+            elif verbosity and stats['done'] % 100 == 0:
+                self.stdout.write('%d/%d done\n' % (stats['done'],
+                                                    len(tasks)))
+
+        warmup.run(tasks, options['workers'], options['processes'], report)
+        if verbosity:
+            elapsed = time.time() - started
+            self.stdout.write('Warmed %d items (%d errors) in %.2fs, '
+                              '%.1f items/s, slowest %s %.3fs\n' % (
+                                    stats['done'], stats['errors'], elapsed,
+                                    stats['done'] / (elapsed or 1),
+                                    stats['slowest'][1],
+                                    stats['slowest'][0]))
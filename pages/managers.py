@@ -1,7 +1,11 @@
 '''Managers for pages classes, can be used to easies access for models
 '''
+import hashlib
+
 from django.db import models
 
+import signals as pages_signals
+
 
 class ActiveQuerySet(models.query.QuerySet):
     '''QuerySet has additional methods to siplify access to active items
@@ -20,12 +24,20 @@ class ActiveQuerySet(models.query.QuerySet):
     def make_active(self):
         '''Mark items as active
         '''
-        return self.update(is_active=True)
+        return self.update_activity(True)
 
     def mark_inactive(self):
         '''Mark items as inactive
         '''
-        return self.update(is_active=False)
+        return self.update_activity(False)
+
+    def update_activity(self, is_active):
+        '''Update is_active field of items, update() sends no model signals,
+        so data derived from items is notified with pages_bulk_updated
+        '''
+        count = self.update(is_active=is_active)
+        pages_signals.pages_bulk_updated.send(sender=self.model)
+        return count
 
 
 class ActiveManager(models.Manager):
@@ -57,3 +69,28 @@ class LayoutManager(ActiveManager):
         '''Get default
         '''
         return self.get(is_default=True)
+
+
+class ArticleBodyManager(models.Manager):
+    '''Manager for ArticleBody model, bodies are stored by hash of content
+    '''
+
+    def get_hash(self, content):
+        '''Get hash of content
+        '''
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+    def store(self, content):
+        '''Store content unless it's stored already, get its hash
+        '''
+        content_hash = self.get_hash(content)
+        self.get_or_create(hash=content_hash, defaults={'content': content})
+        return content_hash
+
+    def delete_unused(self):
+        '''Delete bodies not referenced by articles
+        '''
+        unused = self.filter(text_articles=None, html_articles=None)
+        count = unused.count()
+        unused.delete()
+        return count
@@ -14,6 +14,24 @@ class ActivityMixin(models.Model):
         abstract = True
 
 
+class ScheduleMixin(models.Model):
+    '''Mixin contains scheduled transitions of active field
+
+        publish_at - time object becomes active at
+        expire_at - time object becomes inactive at
+
+    Transitions are applied by pages_schedule command, fields are cleared
+    after that
+    '''
+    publish_at = models.DateTimeField(verbose_name=_('publish at'), null=True,
+                                      blank=True, db_index=True)
+    expire_at = models.DateTimeField(verbose_name=_('expire at'), null=True,
+                                     blank=True, db_index=True)
+
+    class Meta:
+        abstract = True
+
+
 class HTMLMetaMixin(models.Model):
     '''Mixin contains fields can be used to generate html meta tags and some
     other html > head tags
@@ -7,13 +7,23 @@ Layout
 Placeholder
 PageTranslation
 PageContent
+ArticleBody
 PageArticle
+PageLink
+PageHits
+PublishedPage
 '''
 from django.db import models
+from django.db.models import signals
+from django.dispatch import receiver
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
+import blocks
 import managers
 import mixins
+import processing
+import readmodels
 
 Language = mixins.Language
 
@@ -86,6 +96,13 @@ class Layout(mixins.ActivityMixin):
             query = query.update(is_default=False)
         return super(Layout, self).save(*args, **kwargs)
 
+    @property
+    def blocks(self):
+        '''Articles of layout, the same as pagearticle_blocks (kept for code
+        written before block types)
+        '''
+        return self.pagearticle_blocks
+
     def __str__(self):
         '''Get string representation
         '''
@@ -113,6 +130,13 @@ class Placeholder(models.Model):
             self.name = self.alias
         return super(Placeholder, self).save(*args, **kwargs)
 
+    @property
+    def blocks(self):
+        '''Articles in placeholder, the same as pagearticle_blocks (kept for
+        code written before block types)
+        '''
+        return self.pagearticle_blocks
+
     def __str__(self):
         '''Get placeholder name
         '''
@@ -124,13 +148,15 @@ class Placeholder(models.Model):
         return unicode(self.__str__())
 
 
-class PageTranslation(mixins.ActivityMixin, mixins.HTMLMetaMixin,
-                      mixins.NavigationMixin, mixins.TranslationMixin):
+class PageTranslation(mixins.ActivityMixin, mixins.ScheduleMixin,
+                      mixins.HTMLMetaMixin, mixins.NavigationMixin,
+                      mixins.TranslationMixin):
     '''Represent page translation for current language
     '''
     page = models.ForeignKey(Page, related_name='translations',
                              verbose_name=_('page'))
     layout = models.ForeignKey(Layout, related_name='pages')
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True)
 
     class Meta:
         verbose_name = _('page translation')
@@ -142,6 +168,13 @@ class PageTranslation(mixins.ActivityMixin, mixins.HTMLMetaMixin,
         '''
         return super(PageTranslation, self).save(*args, **kwargs)
 
+    @property
+    def content(self):
+        '''Articles of translation, the same as pagearticle_blocks (kept for
+        code written before block types)
+        '''
+        return self.pagearticle_blocks
+
     def __str__(self):
         '''Get string representation
         '''
@@ -155,28 +188,141 @@ class PageTranslation(mixins.ActivityMixin, mixins.HTMLMetaMixin,
 
 class PageContent(models.Model):
     '''Base class represents page content for language. It's just a base class
-    for all page content classes
+    for all page content classes, every subclass is registered as block type
+    (see blocks module)
     '''
-    page = models.ForeignKey(PageTranslation, related_name='content')
-    layout = models.ForeignKey(Layout, related_name='blocks')
-    place = models.ForeignKey(Placeholder, related_name='blocks')
+    page = models.ForeignKey(PageTranslation, related_name='%(class)s_blocks')
+    layout = models.ForeignKey(Layout, related_name='%(class)s_blocks')
+    place = models.ForeignKey(Placeholder, related_name='%(class)s_blocks')
+
+    read_model = None  # Read model class used to show blocks
 
     class Meta:
         abstract = True
 
+    @classmethod
+    def prefetch_blocks(cls, blocks):
+        '''Load data related to a list of read models of blocks shown on page
+        at once, get a list of read models
+        '''
+        return blocks
+
+    @classmethod
+    def edited_blocks(cls, queryset):
+        '''Get queryset of blocks loaded for editing in admin, it can select
+        related rows edited with blocks
+        '''
+        return queryset
+
+    @classmethod
+    def new_blocks(cls, translation, layout, places):
+        '''Get a list of unsaved empty blocks of translation with layout in
+        placeholders, they are saved with bulk_create()
+        '''
+        return [cls(page=translation, layout=layout, place=place)
+                for place in places]
+
+
+@receiver(signals.class_prepared)
+def register_block_type(sender, **kwargs):
+    '''Register page content classes as block types
+    '''
+    if issubclass(sender, PageContent):
+        blocks.register(sender)
+
+
+class ArticleBody(models.Model):
+    '''Text or processed html of articles. Equal contents are stored once
+    for all articles, by hash of content
+    '''
+    hash = models.CharField(_('hash'), max_length=40, primary_key=True)
+    content = models.TextField(_('content'), blank=True)
+
+    objects = managers.ArticleBodyManager()
+
+    class Meta:
+        verbose_name = _('article body')
+        verbose_name_plural = _('article bodies')
+
+    def __unicode__(self):
+        '''Get hash in unicode form
+        '''
+        return unicode(self.hash)
+
+
+def body_property(name):
+    '''Get a property for article content kept in ArticleBody referenced by
+    <name>_body field. Content is loaded on first access, assigned content is
+    stored on article save
+    '''
+    cache_name = '_%s_content' % name
+
+    def get_content(self):
+        '''Get content, load it if needed
+        '''
+        if cache_name not in self.__dict__:
+            body_id = getattr(self, '%s_body_id' % name)
+            self.__dict__[cache_name] = (getattr(self, '%s_body' % name)
+                                         .content if body_id else u'')
+        return self.__dict__[cache_name]
+
+    def set_content(self, value):
+        '''Set content
+        '''
+        self.__dict__[cache_name] = value
+
+    return property(get_content, set_content)
+
 
 class PageArticle(PageContent):
-    '''Page contains an article
+    '''Page contains an article. Its text and processed html are kept in
+    article bodies, so articles with the same content share them
     '''
     article_title = models.CharField(_('article title'), max_length=1024,
                                      null=False, blank=False)
-    text = models.TextField(_('page text'), help_text=_('page html content'),
-                            null=False, blank=False)
+    text_body = models.ForeignKey(ArticleBody, related_name='text_articles',
+                                  editable=False, verbose_name=_('page text'))
+    html_body = models.ForeignKey(ArticleBody, related_name='html_articles',
+                                  editable=False,
+                                  verbose_name=_('processed html'))
+
+    text = body_property('text')  # Page html content
+    html = body_property('html')  # Page text processed for showing
+
+    read_model = readmodels.BlockView
 
     class Meta:
         verbose_name = _('page article')
         verbose_name_plural = _('page articles')
 
+    @classmethod
+    def edited_blocks(cls, queryset):
+        '''Get queryset of articles with their texts
+        '''
+        return queryset.select_related('text_body')
+
+    @classmethod
+    def new_blocks(cls, translation, layout, places):
+        '''Get a list of unsaved empty articles sharing empty bodies
+        '''
+        text_body_id = ArticleBody.objects.store(u'')
+        html_body_id = ArticleBody.objects.store(processing.process(u''))
+        return [cls(page=translation, layout=layout, place=place,
+                    text_body_id=text_body_id, html_body_id=html_body_id)
+                for place in places]
+
+    def save(self, *args, **kwargs):
+        '''Save article with processed text, page translation is marked as
+        updated
+        '''
+        self.html = processing.process(self.text, self)
+        self.text_body_id = ArticleBody.objects.store(self.text)
+        self.html_body_id = ArticleBody.objects.store(self.html)
+        result = super(PageArticle, self).save(*args, **kwargs)
+        PageTranslation.objects.filter(pk=self.page_id).update(
+                                                updated_at=timezone.now())
+        return result
+
     def __str__(self):
         '''Get placeholder name
         '''
@@ -188,6 +334,47 @@ class PageArticle(PageContent):
         return unicode(self.__str__())
 
 
+class PageLink(models.Model):
+    '''Link from page translation articles to a page. Pages shown with
+    the source translation depend on the target page translation in the same
+    language
+    '''
+    source = models.ForeignKey(PageTranslation, related_name='links',
+                               verbose_name=_('source page translation'))
+    target = models.ForeignKey(Page, related_name='backlinks',
+                               verbose_name=_('target page'))
+
+    class Meta:
+        verbose_name = _('page link')
+        verbose_name_plural = _('page links')
+        unique_together = ('source', 'target')
+
+    def __unicode__(self):
+        '''Get name in unicode form
+        '''
+        return u'%s -> %s' % (self.source_id, self.target_id)
+
+
+class PageHits(models.Model):
+    '''Count of views of page translation in a day, views are counted in
+    memory of processes and added in batches (see stats module)
+    '''
+    translation = models.ForeignKey(PageTranslation, related_name='hits',
+                                    verbose_name=_('page translation'))
+    date = models.DateField(_('date'), db_index=True)
+    hits = models.PositiveIntegerField(_('hits'), default=0)
+
+    class Meta:
+        verbose_name = _('page hits')
+        verbose_name_plural = _('page hits')
+        unique_together = ('translation', 'date')
+
+    def __unicode__(self):
+        '''Get name in unicode form
+        '''
+        return u'%s %s: %d' % (self.translation_id, self.date, self.hits)
+
+
 class MenuItem(models.Model):
     '''Item position
     '''
@@ -233,3 +420,42 @@ class Menu(mixins.ActivityMixin):
         '''Get name in unicode form
         '''
         return unicode(self.__str__())
+
+
+class PublishedPage(models.Model):
+    '''Denormalized snapshot of published page translation. Contains all
+    the data needed to show a page, so page is loaded with single row lookup
+    by primary key
+    '''
+    alias = models.CharField(_('alias'), max_length=50, primary_key=True)
+    language = models.ForeignKey(Language, verbose_name=_('language'))
+    translation = models.ForeignKey(PageTranslation, related_name='published',
+                                    verbose_name=_('page translation'))
+    layout = models.ForeignKey(Layout, related_name='published')
+    is_default = models.BooleanField(_('is default page'), default=False,
+                                     db_index=True)
+    template = models.CharField(_('layout template'), max_length=256)
+    data = models.TextField(_('serialized page data'))
+    published_at = models.DateTimeField(_('published at'), auto_now=True)
+
+    class Meta:
+        verbose_name = _('published page')
+        verbose_name_plural = _('published pages')
+
+    def __str__(self):
+        '''Get alias
+        '''
+        return self.alias
+
+    def __unicode__(self):
+        '''Get alias in unicode form
+        '''
+        return unicode(self.alias)
+
+
+# Connect signal handlers of modules keeping data derived from models
+import bus  # pylint: disable=W0611
+import cache  # pylint: disable=W0611
+import dependencies  # pylint: disable=W0611
+import routing  # pylint: disable=W0611
+import scheduling  # pylint: disable=W0611
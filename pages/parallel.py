@@ -0,0 +1,133 @@
+'''Concurrent variant of the page view.
+
+The view waits for the cache and the database concurrently instead of in
+sequence: page data and menus shown on the page are looked up in cache at
+the same time, and on cache miss page translation and its blocks are loaded
+at the same time. Menus of a page are learned from its previous renders.
+
+Calls are run in a shared pool of PAGES_CONCURRENT_WORKERS threads, pages
+urls use this view when the setting is set to a positive number. Pool threads
+keep their own database connections, reads of requests pinned to primary
+database (see routers module) go to primary from pool threads too. Phases
+timed and queries made by pool threads are added to timings and trackers of
+the request (see profiling and instrumentation modules).
+'''
+import multiprocessing.pool
+import threading
+
+from django import db, http
+from django.conf import settings
+
+from . import (cache, compression, instrumentation, profiling, publishing,
+               routers, routing, scheduling, stats, views)
+from .templatetags import menu_tags
+
+_state = {'pool': None, 'workers': 0}
+_lock = threading.Lock()
+_local = threading.local()
+_page_menus = {}  # Aliases of menus shown on pages by page slugs
+
+
+def get_pool():
+    '''Get a pool of threads or None if concurrent calls are disabled
+    '''
+    workers = getattr(settings, 'PAGES_CONCURRENT_WORKERS', 0)
+    if not workers:
+        return None
+    with _lock:
+        if _state['workers'] != workers:
+            if _state['pool'] is not None:
+                _state['pool'].close()
+            _state['pool'] = multiprocessing.pool.ThreadPool(workers)
+            _state['workers'] = workers
+        return _state['pool']
+
+
+def run_call(pinned, timings, trackers, function, *args):
+    '''Run function in pool thread with the same database routing, timings
+    and trackers as the calling thread
+    '''
+    _local.in_pool = True
+    routers.pin_to_primary(pinned)
+    try:
+        with profiling.carried(timings), instrumentation.carried(trackers):
+            return function(*args)
+    finally:
+        routers.pin_to_primary(False)
+        # Don't keep pooled connections idle in transaction
+        for connection in db.connections.all():
+            connection.commit_unless_managed()
+
+
+def gather(calls):
+    '''Run (function, argument, ...) calls concurrently, get a list of their
+    results. The first call is run by the current thread, exceptions of calls
+    are raised
+    '''
+    pool = get_pool()
+    if pool is None or len(calls) < 2 or getattr(_local, 'in_pool', False):
+        return [call[0](*call[1:]) for call in calls]
+    context = (routers.is_pinned(), profiling.current_timings(),
+               list(instrumentation.active_trackers()))
+    pending = [pool.apply_async(run_call, context + tuple(call))
+               for call in calls[1:]]
+    first = calls[0][0](*calls[0][1:])
+    return [first] + [result.get() for result in pending]
+
+
+def load_page_data(slug=None):
+    '''Load template name and read models for page and its blocks, page
+    translation and blocks of routed pages are loaded concurrently
+    '''
+    route = routing.lookup(slug) if slug else None
+    if route is None:
+        return views.load_page_data(slug)
+    pages, blocks = gather([
+                (views.load_translation, route.translation_id),
+                (views.load_blocks, route.translation_id, route.layout_id)])
+    if not pages:
+        raise http.Http404
+    return route.template, {'page': pages[0], 'blocks': blocks}
+
+
+def get_page_data(request, slug=None):
+    '''Get all data needed for page
+    '''
+    load = (publishing.load_published if publishing.is_serving_published()
+            else load_page_data)
+    return cache.get_or_compute(cache.page_key(slug), lambda: load(slug),
+                                timeout=scheduling.cache_timeout())
+
+
+def render_page(request, slug=None):
+    '''Render a page with its data and menus got concurrently
+    '''
+    language = settings.LANGUAGE_CODE
+    menus = sorted(_page_menus.get(slug, ()))
+    results = gather([(get_page_data, request, slug)] +
+                     [(menu_tags.get_menu_items, alias, language)
+                      for alias in menus])
+    template_name, data = results[0]
+    data = dict(data, prefetched_menus=dict(zip(menus, results[1:])))
+    with cache.collect_menus() as shown:
+        response = views.render_template(request, template_name, data)
+    _page_menus[slug] = frozenset(shown)
+    return response
+
+
+@profiling.timed
+@instrumentation.track('page_view')
+@stats.counted
+def page_view(request, slug=None):
+    '''Render a page template with a content, the same as views.page_view
+    '''
+    with profiling.phase('route'):
+        if slug and not routing.alias_exists(slug):
+            raise http.Http404
+    if not views.is_html_cacheable(request):
+        return render_page(request, slug)
+    content_type, bodies, __ = cache.get_or_compute(cache.html_key(slug),
+                        lambda: views.render_compressed(request, slug,
+                                                        render_page),
+                        views.is_html_fresh, scheduling.cache_timeout())
+    return compression.compressed_response(request, bodies, content_type)
@@ -0,0 +1,250 @@
+'''Processing of page articles content.
+
+Article text is processed once when PageArticle is saved and the result is
+stored in PageArticle.html, so pages show precomputed html and nothing is done
+per request. Processors are callables taking html and article and returning
+new html, they are set with dotted paths in PAGES_CONTENT_PROCESSORS setting:
+
+    PAGES_CONTENT_PROCESSORS = (
+        'pages.processing.sanitize',
+        'pages.processing.rewrite_page_links',
+        'pages.processing.lazy_images',
+        'pages.processing.heading_anchors',
+    )
+
+After processors list is changed run pages_reprocess command.
+
+sanitize processor parses html and keeps only allowed tags (PAGES_ALLOWED_TAGS
+setting) with allowed attributes (PAGES_ALLOWED_ATTRIBUTES, a dict {tag:
+attributes}, attributes of '*' are allowed for all tags). Links and images
+can only use URL schemes from PAGES_ALLOWED_URL_SCHEMES (or be relative),
+other URLs are replaced with "#". Content of scripts, styles and embedded
+objects is removed, content of other not allowed tags is kept as text.
+'''
+import cgi
+import HTMLParser
+import re
+
+from django.conf import settings
+from django.core import urlresolvers
+from django.template import defaultfilters
+
+import models
+
+ALLOWED_TAGS = frozenset([
+    'a', 'abbr', 'b', 'blockquote', 'br', 'caption', 'cite', 'code', 'dd',
+    'del', 'div', 'dl', 'dt', 'em', 'figcaption', 'figure', 'h1', 'h2', 'h3',
+    'h4', 'h5', 'h6', 'hr', 'i', 'img', 'ins', 'li', 'ol', 'p', 'pre', 'q',
+    's', 'small', 'span', 'strong', 'sub', 'sup', 'table', 'tbody', 'td',
+    'tfoot', 'th', 'thead', 'tr', 'u', 'ul'])
+ALLOWED_ATTRIBUTES = {
+    '*': ('class', 'dir', 'id', 'lang', 'title'),
+    'a': ('href', 'name', 'rel', 'target'),
+    'img': ('alt', 'height', 'loading', 'src', 'width'),
+    'ol': ('start', 'type'),
+    'td': ('colspan', 'rowspan'),
+    'th': ('colspan', 'rowspan', 'scope'),
+}
+ALLOWED_URL_SCHEMES = ('http', 'https', 'mailto', 'tel', 'page')
+URL_ATTRIBUTES = frozenset(['href', 'src'])
+REMOVED_CONTENT_TAGS = frozenset(['embed', 'iframe', 'noscript', 'object',
+                                  'script', 'style', 'template'])
+VOID_TAGS = frozenset(['br', 'hr', 'img'])
+URL_SCHEME_RE = re.compile(r'^([^/?#]*):')
+URL_IGNORED_RE = re.compile(r'[\x00-\x20\x7f]+')
+PAGE_LINK_RE = re.compile(r'''(\shref\s*=\s*["'])page:(\d+)(["'])''', re.I)
+IMAGE_RE = re.compile(r'<img\b(?![^>]*\sloading\s*=)', re.I)
+HEADING_RE = re.compile(r'<(h[2-4])\b([^>]*)>(.*?)</\1>', re.I | re.S)
+TAG_RE = re.compile(r'<[^>]+>')
+
+
+def get_processors():
+    '''Get a list of processors
+    '''
+    return [urlresolvers.get_callable(processor) for processor in
+            getattr(settings, 'PAGES_CONTENT_PROCESSORS', ())]
+
+
+def process(html, article=None):
+    '''Process html with all processors
+    '''
+    for processor in get_processors():
+        html = processor(html, article)
+    return html
+
+
+class Sanitizer(HTMLParser.HTMLParser):
+    '''Parser writing only allowed tags, attributes and URLs of html fed
+    into it, tags are balanced
+    '''
+
+    def __init__(self):
+        '''Create parser with allow-lists from settings
+        '''
+        HTMLParser.HTMLParser.__init__(self)
+        self.tags = getattr(settings, 'PAGES_ALLOWED_TAGS', ALLOWED_TAGS)
+        self.attributes = getattr(settings, 'PAGES_ALLOWED_ATTRIBUTES',
+                                  ALLOWED_ATTRIBUTES)
+        self.schemes = getattr(settings, 'PAGES_ALLOWED_URL_SCHEMES',
+                               ALLOWED_URL_SCHEMES)
+        self.output = []
+        self.opened = []
+        self.removed = None  # Tag with removed content and nesting level
+
+    def is_safe_url(self, url):
+        '''Check is URL relative or has allowed scheme
+        '''
+        # Browsers ignore whitespace and control characters in schemes
+        match = URL_SCHEME_RE.match(URL_IGNORED_RE.sub('', url))
+        return match is None or match.group(1).lower() in self.schemes
+
+    def clean_attributes(self, tag, attrs):
+        '''Get allowed attributes of tag as html
+        '''
+        allowed = (tuple(self.attributes.get('*', ()))
+                   + tuple(self.attributes.get(tag, ())))
+        cleaned = []
+        for name, value in attrs:
+            if name not in allowed:
+                continue
+            if name in URL_ATTRIBUTES and not self.is_safe_url(value or ''):
+                value = '#'
+            cleaned.append(' %s="%s"' % (name, cgi.escape(value or '', True)))
+        return ''.join(cleaned)
+
+    def start(self, tag, attrs, closed):
+        '''Write allowed start tag, start removing content of dangerous tags
+        '''
+        if self.removed is not None:
+            if tag == self.removed[0] and not closed:
+                self.removed[1] += 1
+            return
+        if tag in REMOVED_CONTENT_TAGS:
+            if not closed:
+                self.removed = [tag, 1]
+            return
+        if tag not in self.tags:
+            return
+        closed = closed or tag in VOID_TAGS
+        self.output.append('<%s%s%s>' % (tag,
+                                         self.clean_attributes(tag, attrs),
+                                         ' /' if closed else ''))
+        if not closed:
+            self.opened.append(tag)
+
+    def handle_starttag(self, tag, attrs):
+        '''Write start tag
+        '''
+        self.start(tag, attrs, False)
+
+    def handle_startendtag(self, tag, attrs):
+        '''Write empty element tag
+        '''
+        self.start(tag, attrs, True)
+
+    def handle_endtag(self, tag):
+        '''Write end tag of opened tag, closing tags opened inside it
+        '''
+        if self.removed is not None:
+            if tag == self.removed[0]:
+                self.removed[1] -= 1
+                if not self.removed[1]:
+                    self.removed = None
+            return
+        if tag not in self.opened:
+            return
+        while True:
+            opened = self.opened.pop()
+            self.output.append('</%s>' % opened)
+            if opened == tag:
+                break
+
+    def handle_data(self, data):
+        '''Write escaped text
+        '''
+        if self.removed is None:
+            self.output.append(cgi.escape(data))
+
+    def handle_entityref(self, name):
+        '''Write named character reference
+        '''
+        if self.removed is None:
+            self.output.append('&%s;' % name)
+
+    def handle_charref(self, name):
+        '''Write numeric character reference
+        '''
+        if self.removed is None:
+            self.output.append('&#%s;' % name)
+
+    def get_html(self):
+        '''Finish parsing and get sanitized html
+        '''
+        self.close()
+        self.output.extend('</%s>' % tag for tag in reversed(self.opened))
+        del self.opened[:]
+        return ''.join(self.output)
+
+
+def sanitize(html, article=None):
+    '''Keep only allowed tags, attributes and URLs
+    '''
+    sanitizer = Sanitizer()
+    try:
+        sanitizer.feed(html)
+        return sanitizer.get_html()
+    except HTMLParser.HTMLParseError:
+        return cgi.escape(html)
+
+
+def rewrite_page_links(html, article=None):
+    '''Replace links like <a href="page:12"> with urls of current translation
+    aliases of pages in article language
+    '''
+    page_ids = set(int(match.group(2))
+                   for match in PAGE_LINK_RE.finditer(html))
+    if not page_ids or article is None:
+        return html
+    aliases = dict(models.PageTranslation.objects.filter(page__in=page_ids,
+                                language=article.page.language_id)
+                                    .values_list('page_id', 'alias'))
+
+    def replace(match):
+        '''Get link to page alias
+        '''
+        alias = aliases.get(int(match.group(2)))
+        if alias is None:
+            return match.group(0)
+        url = urlresolvers.reverse('show_page', kwargs={'slug': alias})
+        return match.group(1) + url + match.group(3)
+    return PAGE_LINK_RE.sub(replace, html)
+
+
+def lazy_images(html, article=None):
+    '''Make browsers load images lazily
+    '''
+    return IMAGE_RE.sub('<img loading="lazy"', html)
+
+
+def heading_anchors(html, article=None):
+    '''Add ids to headings without them, so a table of contents can link to
+    them
+    '''
+    used = set()
+
+    def replace(match):
+        '''Add id to heading
+        '''
+        tag, attributes, content = match.groups()
+        if re.search(r'\sid\s*=', attributes, re.I):
+            return match.group(0)
+        anchor = base = (defaultfilters.slugify(TAG_RE.sub('', content))
+                         or 'section')
+        index = 1
+        while anchor in used:
+            index += 1
+            anchor = '%s-%d' % (base, index)
+        used.add(anchor)
+        return '<%s id="%s"%s>%s</%s>' % (tag, anchor, attributes, content,
+                                         tag)
+    return HEADING_RE.sub(replace, html)
@@ -0,0 +1,152 @@
+'''Profiling of page rendering phases.
+
+Phases of page_view (slug resolution, page fetching, blocks and menus
+loading, template lookup and rendering) are timed when:
+
+    PAGES_SERVER_TIMING - is on, timings are sent in Server-Timing header
+    PAGES_PROFILING_HOOK - is set to a callable (or its dotted path), it's
+                           called with request, response and Timings
+
+Also a fraction of requests set with PAGES_PROFILE_SAMPLE_RATE (0.0 - 1.0) can
+be profiled with cProfile, profiles are dumped into PAGES_PROFILE_DIR (it's
+created if needed). Profiles which can't be saved are only logged, requests
+don't fail because of them.
+'''
+import contextlib
+import cProfile
+import errno
+import functools
+import logging
+import os
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core import urlresolvers
+
+logger = logging.getLogger('pages')
+
+_local = threading.local()
+
+
+class Timings(object):
+    '''Durations of request phases. Phases can be nested (menus are loaded
+    while template is rendered), durations of repeated phases are summed
+    '''
+
+    def __init__(self):
+        '''Create empty timings
+        '''
+        self.phases = []
+        self.durations = {}
+        self.lock = threading.Lock()  # Phases can be run by pool threads
+
+    def add(self, name, duration):
+        '''Add phase duration
+        '''
+        with self.lock:
+            if name not in self.durations:
+                self.phases.append(name)
+                self.durations[name] = 0.0
+            self.durations[name] += duration
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        '''Time a phase
+        '''
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, time.time() - started)
+
+    def header(self):
+        '''Get Server-Timing header value
+        '''
+        return ', '.join('%s;dur=%.1f' % (name, self.durations[name] * 1000)
+                         for name in self.phases)
+
+
+def current_timings():
+    '''Get timings of request processed by current thread
+    '''
+    return getattr(_local, 'timings', None)
+
+
+@contextlib.contextmanager
+def carried(timings):
+    '''Time phases of a block run by pool thread into timings of request
+    processed by another thread
+    '''
+    previous = current_timings()
+    _local.timings = timings
+    try:
+        yield
+    finally:
+        _local.timings = previous
+
+
+@contextlib.contextmanager
+def phase(name):
+    '''Time a phase of current request if it's profiled
+    '''
+    timings = current_timings()
+    if timings is None:
+        yield
+    else:
+        with timings.phase(name):
+            yield
+
+
+def dump_profile(profiler, request):
+    '''Save profiler stats into PAGES_PROFILE_DIR, errors are logged
+    '''
+    directory = getattr(settings, 'PAGES_PROFILE_DIR', None)
+    if not directory:
+        return
+    name = request.path.strip('/').replace('/', '_') or 'index'
+    path = os.path.join(directory, '%s-%d-%d.prof' % (
+                                    name, time.time() * 1000, os.getpid()))
+    try:
+        try:
+            os.makedirs(directory)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+        profiler.dump_stats(path)
+    except (IOError, OSError):
+        logger.exception('Profile %s was not saved', path)
+
+
+def timed(view):
+    '''Decorate a view to time its phases
+    '''
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        '''Call view and profile it if needed
+        '''
+        server_timing = getattr(settings, 'PAGES_SERVER_TIMING', False)
+        hook = getattr(settings, 'PAGES_PROFILING_HOOK', None)
+        rate = getattr(settings, 'PAGES_PROFILE_SAMPLE_RATE', 0)
+        sampled = rate > 0 and random.random() < rate
+        if not (server_timing or hook or sampled):
+            return view(request, *args, **kwargs)
+        timings = _local.timings = Timings()
+        profiler = cProfile.Profile() if sampled else None
+        try:
+            with timings.phase('total'):
+                if profiler is not None:
+                    response = profiler.runcall(view, request, *args, **kwargs)
+                else:
+                    response = view(request, *args, **kwargs)
+        finally:
+            _local.timings = None
+            if profiler is not None:
+                dump_profile(profiler, request)
+        if server_timing:
+            response['Server-Timing'] = timings.header()
+        if hook:
+            urlresolvers.get_callable(hook)(request, response, timings)
+        return response
+    return wrapper
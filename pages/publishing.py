@@ -0,0 +1,153 @@
+'''Publishing of pages.
+
+Editors change PageTranslation and content blocks rows, those changes become
+visible on site only after the page is published. Publishing writes a
+denormalized PublishedPage row per translation with layout template and
+blocks serialized, swapping previous version atomically.
+
+Published pages are served instead of editable ones when PAGES_SERVE_PUBLISHED
+setting is on. Menus show published pages then too, menu items themselves
+aren't published, they are shown as soon as they are saved.
+'''
+import json
+
+from django import http
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Q, sql
+
+import blocks
+import deferred
+import models
+import readmodels
+import signals
+
+CHUNK_SIZE = 500
+
+
+def is_serving_published():
+    '''Check are published pages shown on site
+    '''
+    return getattr(settings, 'PAGES_SERVE_PUBLISHED', False)
+
+
+def build_snapshots(translation_ids):
+    '''Build unsaved PublishedPage objects for active translations with ids
+    '''
+    translations = models.PageTranslation.objects.filter(
+                                    pk__in=translation_ids, is_active=True)
+    pages = readmodels.PageView.from_queryset(translations)
+    if not pages:
+        return []
+    layouts = dict((page.id, page.layout_id) for page in pages)
+    defaults = dict(translations.values_list('id', 'page__is_default'))
+    templates = dict(models.Layout.objects.filter(pk__in=layouts.values())
+                                          .values_list('id', 'template'))
+    page_blocks = dict((page.id, {}) for page in pages)
+    for label, model in blocks.registry.items():
+        for row in model.objects.filter(page__in=layouts.keys())\
+                    .order_by('place').values_list('page_id', 'layout_id',
+                                                   *model.read_model.fields):
+            if layouts[row[0]] == row[1]:
+                page_blocks[row[0]].setdefault(label, []).append(row[2:])
+    return [models.PublishedPage(alias=page.alias,
+                    language_id=page.language_id, translation_id=page.id,
+                    layout_id=page.layout_id, is_default=defaults[page.id],
+                    template=templates[page.layout_id],
+                    data=json.dumps({'page': page,
+                                     'blocks': page_blocks[page.id]}))
+            for page in pages]
+
+
+def delete_snapshots(published):
+    '''Delete published pages of queryset without sending signals for every
+    row, get a list of their aliases, None stands for the default page
+    '''
+    aliases, pks = [], []
+    for alias, is_default in published.values_list('alias', 'is_default'):
+        pks.append(alias)
+        aliases.append(alias)
+        if is_default:
+            aliases.append(None)
+    if pks:
+        sql.DeleteQuery(models.PublishedPage).delete_batch(pks,
+                            router.db_for_write(models.PublishedPage))
+        transaction.set_dirty()
+    return aliases
+
+
+@deferred.commit_on_success
+def publish(translation_ids):
+    '''Publish translations with ids, inactive ones are unpublished. Get a
+    list of published pages
+    '''
+    translation_ids = list(translation_ids)
+    snapshots = []
+    for start in range(0, len(translation_ids), CHUNK_SIZE):
+        chunk = translation_ids[start:start + CHUNK_SIZE]
+        chunk_snapshots = build_snapshots(chunk)
+        # Aliases could be moved between translations in the same chunk
+        unpublished = delete_snapshots(models.PublishedPage.objects.filter(
+                Q(translation__in=chunk) |
+                Q(pk__in=[page.alias for page in chunk_snapshots])))
+        models.PublishedPage.objects.bulk_create(chunk_snapshots)
+        snapshots.extend(chunk_snapshots)
+        signals.pages_published.send(sender=models.PublishedPage,
+                                     translation_ids=chunk,
+                                     aliases=unpublished)
+    return snapshots
+
+
+def publish_pages(pages):
+    '''Publish all translations of pages
+    '''
+    return publish(models.PageTranslation.objects.filter(page__in=pages)
+                                         .values_list('id', flat=True))
+
+
+def publish_all():
+    '''Publish all translations
+    '''
+    return publish(models.PageTranslation.objects.values_list('id',
+                                                              flat=True))
+
+
+def load_published(slug=None):
+    '''Load template name and read models for published page and its blocks.
+    Default page is loaded if there is no slug
+    '''
+    try:
+        if slug:
+            published = models.PublishedPage.objects.get(pk=slug)
+        else:
+            published = models.PublishedPage.objects.filter(
+                        is_default=True, language=settings.LANGUAGE_CODE)[0]
+    except (models.PublishedPage.DoesNotExist, IndexError):
+        raise http.Http404
+    data = json.loads(published.data)
+    stored = data['blocks']
+    if isinstance(stored, list):  # Published before block types were added
+        stored = {blocks.DEFAULT_TYPE: stored}
+    page_blocks = {}
+    for label, rows in stored.items():
+        model = blocks.registry.get(label)
+        if model is not None:
+            page_blocks.update((block.place, block)
+                               for block in blocks.make_blocks(model, rows))
+    return published.template, {
+        'page': readmodels.PageView._make(data['page']),
+        'blocks': page_blocks,
+    }
+
+
+def load_published_menu(alias, language):
+    '''Load read models for published translations of pages in menu
+    '''
+    published = models.PublishedPage.objects.filter(language=language,
+                                    translation__page__menuitem__menu=alias)
+    return [readmodels.MenuItemView(page.page_id, page.alias, page.header,
+                                    page.title)
+            for page in (readmodels.PageView._make(json.loads(data)['page'])
+                         for data in published.order_by(
+                                    'translation__page__menuitem__order')
+                                              .values_list('data', flat=True))]
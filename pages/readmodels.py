@@ -0,0 +1,78 @@
+'''Read models used on the public pages path.
+
+Compact tuple-backed objects containing only fields templates need. They are
+built directly from values_list rows, so no model instances are created, and
+they are cheap to pickle into cache and unpickle back.
+'''
+import collections
+
+
+class ReadModel(tuple):
+    '''Base class for read models. Subclasses are created by read_model()
+    '''
+    __slots__ = ()
+    fields = ()  # Lookups passed to values_list(), one per tuple item
+
+    @classmethod
+    def from_queryset(cls, queryset):
+        '''Get a list of read models for queryset rows
+        '''
+        return [cls._make(row) for row in queryset.values_list(*cls.fields)]
+
+    def __str__(self):
+        '''Get string representation
+        '''
+        return self.__unicode__().encode('utf-8')
+
+
+def read_model(name, fields):
+    '''Create a read model class with attributes for {attribute: lookup} pairs
+    '''
+    base = collections.namedtuple(name, [field[0] for field in fields])
+    return type(name, (ReadModel, base), {
+        '__slots__': (),
+        'fields': tuple(field[1] for field in fields),
+    })
+
+
+class PageView(read_model('PageView', (
+        ('id', 'id'), ('page_id', 'page_id'),
+        ('language_id', 'language_id'), ('layout_id', 'layout_id'),
+        ('alias', 'alias'), ('header', 'header'), ('title', 'title'),
+        ('title_tag', 'title_tag'), ('meta_description', 'meta_description'),
+        ('meta_keywords', 'meta_keywords')))):
+    '''Page translation data needed to render a page
+    '''
+    __slots__ = ()
+
+    def __unicode__(self):
+        '''The same as PageTranslation representation
+        '''
+        return self.title_tag or self.header or self.title
+
+
+class BlockView(read_model('BlockView', (
+        ('place', 'place_id'), ('article_title', 'article_title'),
+        ('text', 'html_body__content')))):
+    '''Page content block placed into placeholder, its text is processed
+    article html
+    '''
+    __slots__ = ()
+
+    def __unicode__(self):
+        '''Get article title
+        '''
+        return self.article_title
+
+
+class MenuItemView(read_model('MenuItemView', (
+        ('page_id', 'page_id'), ('alias', 'alias'), ('header', 'header'),
+        ('title', 'title')))):
+    '''Page translation shown as menu item
+    '''
+    __slots__ = ()
+
+    def __unicode__(self):
+        '''Get menu item text
+        '''
+        return self.header or self.title
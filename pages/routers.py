@@ -0,0 +1,127 @@
+'''Database routing for pages application.
+
+ReplicaRouter sends reads of pages models to one of replica databases and all
+writes to primary one:
+
+    DATABASE_ROUTERS = ['pages.routers.ReplicaRouter']
+    PAGES_DATABASE_PRIMARY = 'default'
+    PAGES_DATABASE_REPLICAS = ['replica1', 'replica2']
+
+Reads go to primary after a write made in the same thread until the end of
+request, and during unsafe (POST, PUT, DELETE) requests. Threads which don't
+handle requests (commands, workers) keep reading from primary once they wrote
+something. PrimaryStickinessMiddleware keeps the session of
+a user who has written something on primary for PAGES_PRIMARY_STICKINESS
+seconds, so editors see their changes even if replicas lag behind. It should
+be placed after SessionMiddleware.
+
+Locally it can be tried with a few SQLite databases, replicas should mirror
+primary database in tests:
+
+    DATABASES = {
+        'default': {'ENGINE': 'django.db.backends.sqlite3',
+                    'NAME': 'primary.db'},
+        'replica1': {'ENGINE': 'django.db.backends.sqlite3',
+                     'NAME': 'replica.db', 'TEST_MIRROR': 'default'},
+    }
+'''
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core import signals
+from django.db import DEFAULT_DB_ALIAS
+from django.dispatch import receiver
+
+SESSION_KEY = '_pages_primary_until'
+
+_local = threading.local()
+
+
+def get_primary():
+    '''Get primary database alias
+    '''
+    return getattr(settings, 'PAGES_DATABASE_PRIMARY', DEFAULT_DB_ALIAS)
+
+
+def pin_to_primary(pinned=True):
+    '''Make (or stop making) all reads of current thread go to primary
+    '''
+    _local.pinned = pinned
+    _local.wrote = False
+
+
+def is_pinned():
+    '''Check should reads go to primary
+    '''
+    return getattr(_local, 'pinned', False) or getattr(_local, 'wrote', False)
+
+
+def has_written():
+    '''Check was there a write since thread was pinned or unpinned
+    '''
+    return getattr(_local, 'wrote', False)
+
+
+@receiver(signals.request_finished)
+def request_finished(sender, **kwargs):
+    '''Forget writes of finished request, so the next request handled by
+    the thread reads from replicas again
+    '''
+    pin_to_primary(False)
+
+
+class ReplicaRouter(object):
+    '''Route reads of pages models to replicas and writes to primary
+    '''
+
+    def db_for_read(self, model, **hints):
+        '''Get database for reading
+        '''
+        if model._meta.app_label != 'pages':
+            return None
+        replicas = getattr(settings, 'PAGES_DATABASE_REPLICAS', ())
+        if not replicas or is_pinned():
+            return get_primary()
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        '''Get database for writing
+        '''
+        if model._meta.app_label != 'pages':
+            return None
+        _local.wrote = True
+        return get_primary()
+
+    def allow_relation(self, obj1, obj2, **hints):
+        '''Replicas contain the same data, so pages objects can be related
+        wherever they were read
+        '''
+        if (obj1._meta.app_label == 'pages'
+                and obj2._meta.app_label == 'pages'):
+            return True
+        return None
+
+
+class PrimaryStickinessMiddleware(object):
+    '''Keep users who made changes on primary database for a while
+    '''
+
+    def process_request(self, request):
+        '''Pin request to primary if it's unsafe or user wrote recently
+        '''
+        session = getattr(request, 'session', None)
+        until = session.get(SESSION_KEY, 0) if session is not None else 0
+        pin_to_primary(request.method not in ('GET', 'HEAD', 'OPTIONS')
+                       or until > time.time())
+
+    def process_response(self, request, response):
+        '''Remember time until user should stay on primary
+        '''
+        session = getattr(request, 'session', None)
+        if has_written() and session is not None:
+            session[SESSION_KEY] = time.time() + getattr(
+                                    settings, 'PAGES_PRIMARY_STICKINESS', 10)
+        pin_to_primary(False)
+        return response
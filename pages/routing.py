@@ -0,0 +1,374 @@
+'''Routing of page aliases.
+
+Resolves aliases into routes (translation id, layout and its template) before
+the database is touched, so requests for unknown slugs (bots, vulnerability
+scanners) are rejected for free and known pages are fetched by primary key.
+
+There are two kinds of routing tables:
+
+    AliasIndex - sorted arrays kept in memory of the current process, built
+                 lazily from database and dropped on PageTranslation changes
+                 in any process (see bus module)
+    RouteTable - compact sorted binary file shared by all worker processes
+                 with mmap, used when PAGES_ROUTING_TABLE setting contains a
+                 path to the file. The file is rebuilt and atomically swapped
+                 after transactions changing PageTranslation are committed,
+                 workers notice swaps by checking file stat at most once per
+                 PAGES_ROUTING_TABLE_CHECK seconds.
+
+Tables are stamped with the time their routes were read at, a table is never
+replaced with an older one. With PAGES_ROUTING_TABLE_AUTO set to False changes
+only mark the table stale and it's rebuilt by pages_build_routes --loop, so
+saves don't pay for the rebuild. Bulk changes made with ActiveQuerySet (see
+managers module) invalidate routes too.
+'''
+import bisect
+import collections
+import contextlib
+import fcntl
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import signals
+from django.dispatch import receiver
+
+import bus
+import deferred
+import models
+import publishing
+import signals as pages_signals
+
+Route = collections.namedtuple('Route',
+                               'translation_id layout_id template version')
+
+
+def get_routes():
+    '''Get a sorted list of (alias, translation id, layout id, template) for
+    active page translations (or published pages if they are served)
+    '''
+    if publishing.is_serving_published():
+        return sorted(models.PublishedPage.objects.values_list('alias',
+                                    'translation_id', 'layout_id', 'template'))
+    return sorted(models.PageTranslation.objects.filter(is_active=True)
+                            .values_list('alias', 'id', 'layout_id',
+                                         'layout__template'))
+
+
+class AliasIndex(object):
+    '''Sorted array of aliases with parallel array of routes, lookups are done
+    with a binary search
+    '''
+
+    def __init__(self, routes, version=0):
+        '''Create index from iterable of (alias, translation id, layout id,
+        template) tuples
+        '''
+        routes = sorted(routes)
+        self.version = version
+        self.aliases = tuple(route[0] for route in routes)
+        self.routes = tuple(Route(route[1], route[2], route[3], version)
+                            for route in routes)
+
+    def __contains__(self, alias):
+        '''Check is alias known
+        '''
+        return self.lookup(alias) is not None
+
+    def __len__(self):
+        '''Get count of aliases in index
+        '''
+        return len(self.aliases)
+
+    def lookup(self, alias):
+        '''Get route for alias or None if alias is unknown
+        '''
+        index = bisect.bisect_left(self.aliases, alias)
+        if index < len(self.aliases) and self.aliases[index] == alias:
+            return self.routes[index]
+        return None
+
+    @classmethod
+    def build(cls):
+        '''Build index from active page translations
+        '''
+        return cls(get_routes(), int(time.time()))
+
+
+# Table file layout: header, fixed size records sorted by alias and a blob
+# with utf-8 encoded aliases and templates referenced by records
+TABLE_MAGIC = 'PGRT'
+TABLE_HEADER = struct.Struct('<4sQI')  # magic, version, records count
+TABLE_RECORD = struct.Struct('<IHIIIH')  # alias offset, alias length,
+                                         # translation id, layout id,
+                                         # template offset, template length
+
+
+def new_version():
+    '''Get version for table with routes read now
+    '''
+    return int(time.time() * 1000)
+
+
+def read_version(path):
+    '''Get version of table file or None if there is no valid table
+    '''
+    try:
+        with open(path, 'rb') as table_file:
+            magic, version, __ = TABLE_HEADER.unpack(
+                                        table_file.read(TABLE_HEADER.size))
+    except (IOError, OSError, struct.error):
+        return None
+    return version if magic == TABLE_MAGIC else None
+
+
+@contextlib.contextmanager
+def locked(directory):
+    '''Lock directory of table files exclusively
+    '''
+    handle = os.open(directory, os.O_RDONLY)
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(handle)  # Releases the lock
+
+
+def write_table(path, routes, version=None):
+    '''Serialize routes into a table file, get version of the table in
+    place. File is written aside and then renamed, so processes never see
+    partially written table. Table isn't written if table in place has a newer
+    version
+    '''
+    version = new_version() if version is None else version
+    routes = sorted((alias.encode('utf-8'), translation_id, layout_id,
+                     template.encode('utf-8'))
+                    for alias, translation_id, layout_id, template in routes)
+    blob, records, templates = [], [], {}
+    position = [TABLE_HEADER.size + TABLE_RECORD.size * len(routes)]
+
+    def add_string(value):
+        '''Add string into blob and get it offset in the file
+        '''
+        offset = position[0]
+        blob.append(value)
+        position[0] += len(value)
+        return offset
+
+    for alias, translation_id, layout_id, template in routes:
+        alias_offset = add_string(alias)
+        if template not in templates:
+            templates[template] = add_string(template)
+        records.append(TABLE_RECORD.pack(alias_offset, len(alias),
+                                         translation_id, layout_id,
+                                         templates[template], len(template)))
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temp_path = tempfile.mkstemp(dir=directory, prefix='.routes-')
+    try:
+        with os.fdopen(handle, 'wb') as table_file:
+            table_file.write(TABLE_HEADER.pack(TABLE_MAGIC, version,
+                                               len(routes)))
+            table_file.write(''.join(records))
+            table_file.write(''.join(blob))
+        os.chmod(temp_path, 0o644)
+        with locked(directory):
+            current = read_version(path)
+            if current is not None and current > version:
+                os.unlink(temp_path)  # Concurrent build read newer routes
+                return current
+            os.rename(temp_path, path)
+    except:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    return version
+
+
+def build_table(path=None):
+    '''Build table file with routes for active page translations
+    '''
+    version = new_version()  # Taken before routes are read
+    return write_table(path or settings.PAGES_ROUTING_TABLE, get_routes(),
+                       version)
+
+
+class RouteTable(object):
+    '''Read-only routing table mapped into memory from file, so memory pages
+    are shared between all processes
+    '''
+
+    def __init__(self, path):
+        '''Map table file into memory
+        '''
+        with open(path, 'rb') as table_file:
+            stat = os.fstat(table_file.fileno())
+            self.buffer = mmap.mmap(table_file.fileno(), 0,
+                                    access=mmap.ACCESS_READ)
+        self.path = path
+        self.identity = (stat.st_ino, stat.st_mtime, stat.st_size)
+        magic, self.version, self.count = TABLE_HEADER.unpack_from(
+                                                                self.buffer, 0)
+        if magic != TABLE_MAGIC:
+            raise ValueError('%s is not a pages routing table' % path)
+
+    def __contains__(self, alias):
+        '''Check is alias known
+        '''
+        return self.lookup(alias) is not None
+
+    def __len__(self):
+        '''Get count of aliases in table
+        '''
+        return self.count
+
+    def record(self, index):
+        '''Get record unpacked
+        '''
+        return TABLE_RECORD.unpack_from(self.buffer,
+                                TABLE_HEADER.size + index * TABLE_RECORD.size)
+
+    def lookup(self, alias):
+        '''Get route for alias or None if alias is unknown
+        '''
+        key = alias.encode('utf-8')
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            record = self.record(middle)
+            current = self.buffer[record[0]:record[0] + record[1]]
+            if current < key:
+                low = middle + 1
+            elif current > key:
+                high = middle
+            else:
+                template = self.buffer[record[4]:record[4] + record[5]]
+                return Route(record[2], record[3], template.decode('utf-8'),
+                             self.version)
+        return None
+
+    def is_stale(self):
+        '''Check was table file swapped
+        '''
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return True
+        return (stat.st_ino, stat.st_mtime, stat.st_size) != self.identity
+
+    def close(self):
+        '''Unmap table
+        '''
+        self.buffer.close()
+
+
+_lock = threading.Lock()
+_state = {'index': None, 'generation': 0, 'table': None, 'checked': 0}
+
+
+def get_index():
+    '''Get current alias index, build it if it was invalidated
+    '''
+    index = _state['index']
+    if index is None:
+        generation = _state['generation']
+        index = AliasIndex.build()
+        with _lock:
+            # Do not publish index built before concurrent invalidation
+            if _state['generation'] == generation:
+                _state['index'] = index
+    return index
+
+
+def get_table():
+    '''Get shared routing table if it configured and exists. Check is table
+    swapped (or created if it's missing) not often than once per
+    PAGES_ROUTING_TABLE_CHECK seconds
+    '''
+    path = getattr(settings, 'PAGES_ROUTING_TABLE', None)
+    if not path:
+        return None
+    table, now = _state['table'], time.time()
+    interval = getattr(settings, 'PAGES_ROUTING_TABLE_CHECK', 1.0)
+    if now - _state['checked'] < interval:
+        return table
+    _state['checked'] = now
+    if table is not None and not table.is_stale():
+        return table
+    with _lock:
+        try:
+            _state['table'] = table = RouteTable(path)
+        except (IOError, OSError, ValueError):
+            # Fall back to the in-process index until the next check
+            _state['table'] = table = None
+        _state['checked'] = now
+    return table
+
+
+def lookup(alias):
+    '''Get route for alias or None if there is no active page translation
+    with this alias
+    '''
+    bus.poll()
+    table = get_table()
+    return (table if table is not None else get_index()).lookup(alias)
+
+
+def alias_exists(alias):
+    '''Check is there an active page translation with alias
+    '''
+    return lookup(alias) is not None
+
+
+def reset():
+    '''Drop the in-process index, it would be rebuilt on next lookup
+    '''
+    with _lock:
+        _state['generation'] += 1
+        _state['index'] = None
+        _state['checked'] = 0
+
+
+bus.subscribe('routing', reset)
+
+
+def is_table_auto():
+    '''Check is shared table rebuilt after changes by processes making them
+    '''
+    return getattr(settings, 'PAGES_ROUTING_TABLE_AUTO', True)
+
+
+def refresh():
+    '''Drop indexes of all processes, rebuild shared table if it's used or
+    mark it stale
+    '''
+    bus.bump('routing')
+    if getattr(settings, 'PAGES_ROUTING_TABLE', None):
+        if is_table_auto():
+            build_table()
+        else:
+            bus.bump('routing-table')
+
+
+def invalidate():
+    '''Drop indexes of all processes now, and refresh routes after the
+    current transaction ends, when changes are visible to other processes
+    '''
+    bus.bump('routing')
+    deferred.after_commit(refresh)
+
+
+@receiver(signals.post_save, sender=models.PageTranslation)
+@receiver(signals.post_delete, sender=models.PageTranslation)
+@receiver(signals.post_save, sender=models.Layout)
+@receiver(signals.post_delete, sender=models.PublishedPage)
+@receiver(pages_signals.pages_published)
+@receiver(pages_signals.pages_bulk_updated, sender=models.Layout)
+def translation_changed(sender, **kwargs):
+    '''Invalidate routes when page translation, layout or published pages
+    changed
+    '''
+    invalidate()
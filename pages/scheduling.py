@@ -0,0 +1,102 @@
+'''Scheduled publishing of page translations.
+
+Translations have publish_at and expire_at fields. Nothing is filtered by
+time on request: pages_schedule command (run by cron or with --loop option)
+applies due transitions in bulk by updating is_active field, and invalidates
+routes, caches and published pages of changed translations. Cache entries of
+pages and menus live not longer than until the nearest transition.
+'''
+from django.db.models import Min, signals
+from django.dispatch import receiver
+from django.utils import timezone
+
+import bus
+import cache
+import deferred
+import dependencies
+import models
+import publishing
+import routing
+
+schedule = bus.LocalState('schedule')
+
+
+def get_next_transition():
+    '''Get time of the nearest scheduled transition or None
+    '''
+    translations = models.PageTranslation.objects
+    times = [translations.filter(**{field + '__isnull': False})
+                         .aggregate(time=Min(field))['time']
+             for field in ('publish_at', 'expire_at')]
+    times = [time for time in times if time is not None]
+    return min(times) if times else None
+
+
+def cache_timeout():
+    '''Get timeout for cache entries of pages, they shouldn't outlive the
+    nearest transition
+    '''
+    timeout = cache.get_timeout()
+    if not timeout:
+        return timeout
+    transition = schedule.get('next', get_next_transition)
+    if transition is None:
+        return timeout
+    # Due transition which isn't applied yet gives the shortest timeout
+    seconds = int((transition - timezone.now()).total_seconds()) + 1
+    return max(1, min(timeout, seconds))
+
+
+@deferred.commit_on_success
+def update_due(now):
+    '''Update translations with due transitions, get a list of their ids
+    '''
+    translations = models.PageTranslation.objects
+    expiring = translations.filter(expire_at__lte=now)
+    due = translations.filter(publish_at__lte=now)\
+                      .exclude(pk__in=expiring.values('pk'))
+    published = list(due.values_list('id', flat=True))
+    expired = list(expiring.values_list('id', flat=True))
+    translations.filter(pk__in=published).update(is_active=True,
+                                                 publish_at=None)
+    translations.filter(pk__in=expired).update(is_active=False,
+                                               publish_at=None, expire_at=None)
+    return published + expired
+
+
+def apply_due(now=None):
+    '''Apply transitions due to now, get ids of changed translations
+    '''
+    changed = update_due(now or timezone.now())
+    if changed:
+        if publishing.is_serving_published():
+            publishing.publish(changed)
+        else:
+            routing.invalidate()
+            cache.invalidate_pages(dependencies.affected_aliases(changed))
+            pages = models.PageTranslation.objects.filter(pk__in=changed)\
+                                          .values_list('page_id', flat=True)
+            cache.invalidate_menus(dependencies.page_menus(pages),
+                                   dependencies.all_languages())
+    deferred.repeat_after_commit(bus.bump, 'schedule')
+    return changed
+
+
+@receiver(signals.post_init, sender=models.PageTranslation)
+def remember_schedule(sender, instance, **kwargs):
+    '''Remember transitions translation was loaded with
+    '''
+    instance._loaded_schedule = (instance.__dict__.get('publish_at'),
+                                 instance.__dict__.get('expire_at'))
+
+
+@receiver(signals.post_save, sender=models.PageTranslation)
+@receiver(signals.post_delete, sender=models.PageTranslation)
+def translation_changed(sender, instance, **kwargs):
+    '''Drop the nearest transition time if translation schedule changed
+    '''
+    current = (instance.publish_at, instance.expire_at)
+    if current != instance._loaded_schedule or (
+                    kwargs['signal'] is signals.post_delete and any(current)):
+        deferred.repeat_after_commit(bus.bump, 'schedule')
+    instance._loaded_schedule = current
@@ -0,0 +1,10 @@
+'''Signals sent by pages application
+'''
+from django.dispatch import Signal
+
+# Sent when translations were published or unpublished with bulk operations,
+# with aliases of replaced published pages (None stands for the default page)
+pages_published = Signal(providing_args=['translation_ids', 'aliases'])
+
+# Sent when objects were changed with a bulk update of ActiveQuerySet
+pages_bulk_updated = Signal()
@@ -0,0 +1,194 @@
+'''Sitemap of active page translations (of published ones when published
+pages are served, see publishing module).
+
+Sitemap is split into sections of PAGES_SITEMAP_SIZE translations (50000 by
+default, the protocol limit), sections are listed in the sitemap index.
+Translations are read in chunks ordered by key and xml is generated lazily,
+so neither views nor pages_sitemap command keep whole sitemap in memory.
+Every url lists translations of the same page into other languages as
+hreflang alternates.
+
+With a lot of languages section size should be lowered to keep section files
+under 50Mb.
+'''
+import gzip
+import os
+import tempfile
+
+from django.conf import settings
+from django.core import urlresolvers
+from django.utils.html import escape
+
+import models
+import publishing
+
+CHUNK_SIZE = 1000
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+URLSET_START = ('<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9" '
+                'xmlns:xhtml="http://www.w3.org/1999/xhtml">\n')
+URLSET_END = '</urlset>\n'
+INDEX_START = ('<sitemapindex '
+               'xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+INDEX_END = '</sitemapindex>\n'
+
+
+def get_size():
+    '''Get count of urls in sitemap section
+    '''
+    return getattr(settings, 'PAGES_SITEMAP_SIZE', 50000)
+
+
+def get_translations():
+    '''Get a queryset of translations listed in sitemap
+    '''
+    if publishing.is_serving_published():
+        return models.PublishedPage.objects.order_by('pk')
+    return models.PageTranslation.objects.filter(is_active=True)\
+                                         .order_by('pk')
+
+
+def get_fields():
+    '''Get lookups of key, alias, language, page id and update time of
+    translations listed in sitemap
+    '''
+    if publishing.is_serving_published():
+        return ('pk', 'alias', 'language', 'translation__page',
+                'published_at')
+    return ('pk', 'alias', 'language', 'page', 'updated_at')
+
+
+def get_sections_count():
+    '''Get count of sitemap sections
+    '''
+    return max(1, (get_translations().count() + get_size() - 1) // get_size())
+
+
+def page_url(alias):
+    '''Get page path by alias
+    '''
+    return urlresolvers.reverse('show_page', kwargs={'slug': alias})
+
+
+def iter_translations(section):
+    '''Iterate (key, alias, language, page id, updated at) for translations
+    of section, they are read by chunks
+    '''
+    size = get_size()
+    translations = get_translations().values_list(*get_fields())
+    start = get_translations().values_list('pk', flat=True)[
+                                        section * size:section * size + 1]
+    if not start:
+        return
+    after, left = {'pk__gte': start[0]}, size
+    while left > 0:
+        chunk = list(translations.filter(**after)[:min(left, CHUNK_SIZE)]
+                                 .iterator())
+        if not chunk:
+            break
+        for row in chunk:
+            yield row
+        after, left = {'pk__gt': chunk[-1][0]}, left - len(chunk)
+
+
+def iter_entries(section):
+    '''Iterate (alias, updated at, [(language, alias), ...]) for urls of
+    section, alternates of every chunk are loaded with a single query
+    '''
+    chunk = []
+    for row in iter_translations(section):
+        chunk.append(row)
+        if len(chunk) == CHUNK_SIZE:
+            for entry in chunk_entries(chunk):
+                yield entry
+            chunk = []
+    for entry in chunk_entries(chunk):
+        yield entry
+
+
+def chunk_entries(chunk):
+    '''Get entries for a chunk of translations rows
+    '''
+    if not chunk:
+        return []
+    fields = get_fields()
+    alternates = {}
+    for page_id, language, alias in get_translations().filter(**{
+                    fields[3] + '__in': set(row[3] for row in chunk)})\
+                        .values_list(fields[3], fields[2], fields[1]):
+        alternates.setdefault(page_id, []).append((language, alias))
+    return [(alias, updated_at,
+             alternates[page_id] if len(alternates[page_id]) > 1 else [])
+            for __, alias, language, page_id, updated_at in chunk]
+
+
+def urlset(section, base_url):
+    '''Generate xml of sitemap section by parts
+    '''
+    yield XML_HEADER
+    yield URLSET_START
+    for alias, updated_at, alternates in iter_entries(section):
+        parts = ['<url><loc>', escape(base_url + page_url(alias)), '</loc>']
+        if updated_at is not None:
+            parts.extend(('<lastmod>', updated_at.strftime('%Y-%m-%d'),
+                          '</lastmod>'))
+        for language, alternate in alternates:
+            parts.extend(('<xhtml:link rel="alternate" hreflang="',
+                          escape(language), '" href="',
+                          escape(base_url + page_url(alternate)), '"/>'))
+        parts.append('</url>\n')
+        yield ''.join(parts)
+    yield URLSET_END
+
+
+def index(locations):
+    '''Generate xml of sitemap index with locations of sections by parts
+    '''
+    yield XML_HEADER
+    yield INDEX_START
+    for location in locations:
+        yield '<sitemap><loc>%s</loc></sitemap>\n' % escape(location)
+    yield INDEX_END
+
+
+def section_url(section):
+    '''Get path of sitemap section
+    '''
+    return urlresolvers.reverse('pages_sitemap_section',
+                                kwargs={'section': section})
+
+
+def write(directory, base_url, compress=False):
+    '''Write sitemap index and sections files into directory, get a list of
+    written file names
+    '''
+    extension = '.xml.gz' if compress else '.xml'
+    names = []
+    for section in range(get_sections_count()):
+        names.append('sitemap-%d%s' % (section, extension))
+        write_file(os.path.join(directory, names[-1]),
+                   urlset(section, base_url), compress)
+    write_file(os.path.join(directory, 'sitemap' + extension),
+               index(['%s/%s' % (base_url, name) for name in names]),
+               compress)
+    return names + ['sitemap' + extension]
+
+
+def write_file(path, parts, compress=False):
+    '''Write parts of xml into file atomically
+    '''
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temporary = tempfile.mkstemp(dir=directory, prefix='.sitemap-')
+    try:
+        with os.fdopen(handle, 'wb') as output:
+            stream = (gzip.GzipFile(fileobj=output, mode='wb') if compress
+                      else output)
+            for part in parts:
+                stream.write(part.encode('utf-8') if isinstance(part, unicode)
+                             else part)
+            if compress:
+                stream.close()
+        os.chmod(temporary, 0o644)
+        os.rename(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
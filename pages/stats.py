@@ -0,0 +1,226 @@
+'''Buffered statistics of page views.
+
+Views of pages are counted in memory of the process when PAGES_STATS setting
+is on, nothing is written to database on requests. Counts are added to daily
+PageHits rows of page translations in batches every PAGES_STATS_INTERVAL
+seconds (60 by default) by a background thread of the process, with a single
+UPDATE for existing rows and a single INSERT for new ones. With zero interval
+there is no thread and counts should be flushed with flush().
+
+Rows inserted by another process meanwhile are updated instead, the insert
+is rolled back to a savepoint, so flushes work inside outer transactions too.
+Counts of a process not flushed yet are lost if the process is killed, so
+statistics are approximate.
+'''
+import atexit
+import collections
+import datetime
+import functools
+import logging
+import threading
+import time
+
+from django import db
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+import models
+
+BATCH_SIZE = 500
+
+logger = logging.getLogger('pages')
+
+_counts = collections.Counter()  # Views by (alias, date)
+_lock = threading.Lock()
+_state = {'thread': None}
+
+
+def is_enabled():
+    '''Check are page views counted
+    '''
+    return getattr(settings, 'PAGES_STATS', False)
+
+
+def get_interval():
+    '''Get seconds between flushes of counts
+    '''
+    return getattr(settings, 'PAGES_STATS_INTERVAL', 60)
+
+
+def today():
+    '''Get current date
+    '''
+    now = timezone.now()
+    return (timezone.localtime(now) if timezone.is_aware(now) else now).date()
+
+
+def count(alias):
+    '''Count a view of page with alias (None for the default page)
+    '''
+    with _lock:
+        _counts[(alias or '', today())] += 1
+    if _state['thread'] is None and get_interval():
+        start_flushing()
+
+
+def counted(view):
+    '''Decorator for page views counting successfully shown pages
+    '''
+    @functools.wraps(view)
+    def wrapper(request, slug=None):
+        '''Call view and count view of page
+        '''
+        response = view(request, slug)
+        if (is_enabled() and request.method == 'GET'
+                and response.status_code == 200):
+            count(slug)
+        return response
+    return wrapper
+
+
+def start_flushing():
+    '''Start the background thread flushing counts
+    '''
+    with _lock:
+        if _state['thread'] is not None:
+            return
+        thread = _state['thread'] = threading.Thread(target=flush_loop,
+                                                     name='pages-stats')
+    thread.daemon = True
+    thread.start()
+    atexit.register(flush)
+
+
+def flush_loop():
+    '''Flush counts periodically
+    '''
+    while True:
+        time.sleep(get_interval() or 60)
+        try:
+            flush()
+        except Exception:  # pylint: disable=W0703
+            logger.exception('Page views statistics were not saved')
+        finally:
+            db.close_connection()
+
+
+def flush():
+    '''Add counted views into database, get a count of saved views. Counts
+    are kept for the next flush if they weren't saved, views of unknown pages
+    are dropped
+    '''
+    with _lock:
+        taken = collections.Counter(_counts)
+        _counts.clear()
+    if not taken:
+        return 0
+    try:
+        return save(taken)
+    except BaseException:
+        with _lock:
+            _counts.update(taken)
+        raise
+
+
+def resolve(aliases):
+    '''Get a dict of ids of page translations by aliases, empty alias stands
+    for the default page
+    '''
+    translations = dict(models.PageTranslation.objects.filter(
+                            alias__in=aliases).values_list('alias', 'id'))
+    if '' in aliases:
+        default = models.PageTranslation.objects.filter(
+                page__is_default=True).values_list('id', flat=True)[:1]
+        if default:
+            translations[''] = default[0]
+    return translations
+
+
+def find_hits(keys):
+    '''Get a dict of ids of PageHits rows by (translation id, date) keys
+    '''
+    return dict(((translation_id, date), pk)
+                for pk, translation_id, date
+                in models.PageHits.objects.filter(
+                        translation__in=set(key[0] for key in keys),
+                        date__in=set(key[1] for key in keys))
+                    .values_list('id', 'translation_id', 'date'))
+
+
+@transaction.commit_on_success
+def save(counts):
+    '''Add counts of views by (alias, date) to hits of page translations,
+    get a count of saved views
+    '''
+    translations = resolve(set(alias for alias, __ in counts))
+    deltas = collections.Counter()
+    for (alias, date), hits in counts.items():
+        if alias in translations:
+            deltas[(translations[alias], date)] += hits
+    if not deltas:
+        return 0
+    existing = find_hits(deltas)
+    add_hits([(existing[key], hits) for key, hits in deltas.items()
+              if key in existing])
+    new = dict((key, hits) for key, hits in deltas.items()
+               if key not in existing)
+    if new:
+        savepoint = transaction.savepoint()
+        try:
+            insert_hits(new)
+        except db.IntegrityError:
+            # Rows were inserted by another process meanwhile
+            transaction.savepoint_rollback(savepoint)
+            inserted = find_hits(new)
+            add_hits([(inserted[key], hits) for key, hits in new.items()
+                      if key in inserted])
+            insert_hits(dict((key, hits) for key, hits in new.items()
+                             if key not in inserted))
+        else:
+            transaction.savepoint_commit(savepoint)
+    return sum(deltas.values())
+
+
+def insert_hits(hits):
+    '''Insert PageHits rows for a dict of hits by (translation id, date)
+    '''
+    models.PageHits.objects.bulk_create([
+                models.PageHits(translation_id=translation_id, date=date,
+                                hits=count)
+                for (translation_id, date), count in hits.items()],
+        batch_size=BATCH_SIZE)
+
+
+def add_hits(rows):
+    '''Add hits to PageHits rows for a list of (id, hits)
+    '''
+    quote = connection.ops.quote_name
+    table = quote(models.PageHits._meta.db_table)
+    hits = quote(models.PageHits._meta.get_field('hits').column)
+    pk = quote(models.PageHits._meta.pk.column)
+    cursor = connection.cursor()
+    for start in range(0, len(rows), BATCH_SIZE):
+        batch = rows[start:start + BATCH_SIZE]
+        cursor.execute(
+            'UPDATE %(table)s SET %(hits)s = %(hits)s + CASE %(pk)s %(cases)s '
+            'END WHERE %(pk)s IN (%(ids)s)' % {
+                'table': table, 'hits': hits, 'pk': pk,
+                'cases': ' '.join(['WHEN %s THEN %s'] * len(batch)),
+                'ids': ', '.join(['%s'] * len(batch))},
+            [value for row in batch for value in row] +
+            [row[0] for row in batch])
+    transaction.set_dirty()
+
+
+def popular(language=None, days=7, limit=10):
+    '''Get a list of (page translation id, hits) of the most viewed page
+    translations for the last days
+    '''
+    hits = models.PageHits.objects.filter(
+                date__gte=today() - datetime.timedelta(days=days - 1))
+    if language is not None:
+        hits = hits.filter(translation__language=language)
+    return list(hits.values_list('translation').annotate(total=Sum('hits'))
+                    .order_by('-total')[:limit])
@@ -3,18 +3,44 @@
 from django import template
 from django.conf import settings
 
-from .. import models
+from .. import (cache, instrumentation, models, profiling, publishing,
+               readmodels, scheduling)
 
 register = template.Library()
 
 
+def load_menu_items(alias, language):
+    '''Load read models for translations of pages in menu
+    '''
+    return readmodels.MenuItemView.from_queryset(
+                models.PageTranslation.objects.filter(language__code=language,
+                                            page__menuitem__menu__alias=alias)
+                                    .order_by('page__menuitem__order'))
+
+
+def get_menu_items(alias, language):
+    '''Get cached read models for translations of pages in menu, published
+    translations are shown when published pages are served
+    '''
+    load = (publishing.load_published_menu
+            if publishing.is_serving_published() else load_menu_items)
+    return cache.get_or_compute(cache.menu_key(alias, language),
+                                lambda: load(alias, language),
+                                timeout=scheduling.cache_timeout())
+
+
 @register.simple_tag(takes_context=True)
 def menu_items(context, var_name, alias):
     '''Put a list of menu items related to menu with specified alias into
-    context with selected variable name
+    context with selected variable name. Menus prefetched by view are taken
+    from prefetched_menus context variable
     '''
-    translations = models.PageTranslation.objects.filter(language__code=settings.LANGUAGE_CODE,
-                                                         page__menuitem__menu__alias=alias)\
-                                .order_by('page__menuitem__order')
-    context[var_name] = translations
+    language = settings.LANGUAGE_CODE
+    cache.note_menu(alias)
+    prefetched = context.get('prefetched_menus') or {}
+    if alias in prefetched:
+        context[var_name] = prefetched[alias]
+        return ''
+    with instrumentation.track('menu_items'), profiling.phase('menus'):
+        context[var_name] = get_menu_items(alias, language)
     return ''
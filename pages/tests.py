@@ -2,9 +2,87 @@
 
 TODO: split test into different files to make it easier to understand and modify
 """
-from django.test import TestCase
+import contextlib
+import datetime
+import gzip
+import os
+import pickle
+import shutil
+import StringIO
+import tempfile
+import threading
+import time
 
-from pages import mixins, models
+from django import db, http
+from django.contrib import admin
+from django.core import management, signals
+from django.core.management.color import no_style
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+from django.utils import timezone, translation
+
+from pages import (blocks, bus, cache, changelist, cloning, compression,
+                   deferred, dependencies, forms, instrumentation, lru, mixins,
+                   models, parallel, processing, profiling, publishing,
+                   readmodels, routers, routing, scheduling, sitemap, stats,
+                   views, warmup)
+from pages import admin as pages_admin
+from pages.management.commands import pages_convert_bodies
+from pages.templatetags import menu_tags
+
+
+class SharedConnections(object):
+    '''Database connections by aliases used by all threads
+    '''
+
+
+@contextlib.contextmanager
+def shared_connections():
+    '''Share database connections of the current thread with other threads,
+    in-memory test databases aren't seen by their own connections
+    '''
+    handler = db.connections
+    connections = handler._connections
+    shared = SharedConnections()
+    for connection in handler.all():
+        connection.allow_thread_sharing = True
+        setattr(shared, connection.alias, connection)
+    handler._connections = shared
+    try:
+        yield
+    finally:
+        handler._connections = connections
+        for connection in handler.all():
+            connection.allow_thread_sharing = False
+
+
+@contextlib.contextmanager
+def extra_database(alias):
+    '''Add in-memory SQLite database with alias to connections
+    '''
+    db.connections.databases[alias] = {
+                    'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}
+    try:
+        yield db.connections[alias]
+    finally:
+        del db.connections.databases[alias]
+        if hasattr(db.connections._connections, alias):
+            delattr(db.connections._connections, alias)
+
+
+def use_template(test_case, content, **options):
+    '''Use page.html template with content and settings options until the
+    end of test
+    '''
+    directory = tempfile.mkdtemp()
+    test_case.addCleanup(shutil.rmtree, directory)
+    with open(os.path.join(directory, 'page.html'), 'w') as template:
+        template.write(content)
+    overridden = override_settings(TEMPLATE_DIRS=(directory, ), **options)
+    overridden.enable()
+    test_case.addCleanup(overridden.disable)
 
 
 class TranslationMixinTest(TestCase):
@@ -41,3 +119,1404 @@ class TranslationMixinTest(TestCase):
         self.assertEqual(translatation.language, russian)
         self.assertEqual(translatation.page, page)
         self.assertEqual(translatation.title, 'Hello, Russia')
+
+
+class AliasRoutingTest(TestCase):
+    '''Test case for alias index used to reject unknown slugs
+    '''
+
+    def setUp(self):
+        '''Create a page with translation
+        '''
+        self.english = mixins.Language.objects.create(code='en')
+        self.layout = models.Layout.objects.create(name='Page',
+                                                   template='page.html')
+        self.page = models.Page.objects.create()
+        self.translation = models.PageTranslation.objects.create(
+                            page=self.page, language=self.english,
+                            layout=self.layout, alias='about', title='About')
+
+    def test_index(self):
+        '''Check alias index lookups
+        '''
+        index = routing.AliasIndex([('news', 2, 1, 'page.html'),
+                                    ('about', 1, 1, 'page.html'),
+                                    ('contacts', 3, 1, 'page.html')])
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.lookup('news'), (2, 1, 'page.html', 0))
+        self.assertTrue('about' in index)
+        self.assertTrue('news' in index)
+        self.assertFalse('wp-admin' in index)
+        self.assertFalse('zzz' in index)
+
+    def test_unknown_slug(self):
+        '''Unknown slugs are rejected without database queries
+        '''
+        self.assertTrue(routing.alias_exists('about'))
+        with self.assertNumQueries(0):
+            self.assertRaises(http.Http404, views.get_page_data, None,
+                              'wp-admin')
+
+    def test_invalidation(self):
+        '''Index is rebuilt after translation changes
+        '''
+        self.assertFalse(routing.alias_exists('company'))
+        self.translation.alias = 'company'
+        self.translation.save()
+        self.assertTrue(routing.alias_exists('company'))
+        self.assertFalse(routing.alias_exists('about'))
+
+    def test_route_table(self):
+        '''Build shared routing table and resolve aliases through it
+        '''
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            routing.write_table(path, [(u'news', 2, 1, u'page.html'),
+                                       (u'about', 1, 1, u'page.html'),
+                                       (u'contacts', 3, 2, u'contacts.html')],
+                                version=7)
+            table = routing.RouteTable(path)
+            self.assertEqual(len(table), 3)
+            self.assertEqual(table.lookup(u'about'),
+                             routing.Route(1, 1, u'page.html', 7))
+            self.assertEqual(table.lookup(u'contacts'),
+                             routing.Route(3, 2, u'contacts.html', 7))
+            self.assertEqual(table.lookup(u'wp-admin'), None)
+            self.assertFalse(table.is_stale())
+            routing.build_table(path)
+            self.assertTrue(table.is_stale())
+            table = routing.RouteTable(path)
+            self.assertEqual(table.lookup(u'about').translation_id,
+                             self.translation.id)
+        finally:
+            os.unlink(path)
+
+    def test_older_table(self):
+        '''Table isn't replaced with a table of older routes
+        '''
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        self.addCleanup(os.unlink, path)
+        routes = [(u'about', 1, 1, u'page.html')]
+        self.assertEqual(routing.write_table(path, routes, version=10), 10)
+        self.assertEqual(routing.write_table(path, [], version=5), 10)
+        self.assertEqual(len(routing.RouteTable(path)), 1)
+        self.assertEqual(routing.write_table(path, [], version=11), 11)
+        self.assertEqual(len(routing.RouteTable(path)), 0)
+
+    def test_table_after_commit(self):
+        '''Shared table is rebuilt after transaction ends
+        '''
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        self.addCleanup(os.unlink, path)
+        with override_settings(PAGES_ROUTING_TABLE=path):
+            routing.build_table()
+            deferred.get_pending().clear()
+            self.translation.alias = 'company'
+            self.translation.save()
+            self.assertIn(u'about', routing.RouteTable(path))
+            deferred.run_pending()
+            self.assertIn(u'company', routing.RouteTable(path))
+
+    def test_missing_table(self):
+        '''Missing shared table is looked for once per check interval
+        '''
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'routes')
+        with override_settings(PAGES_ROUTING_TABLE=path,
+                               PAGES_ROUTING_TABLE_CHECK=60):
+            routing.reset()
+            self.assertIsNone(routing.get_table())
+            self.assertTrue(routing.alias_exists('about'))
+            routing.write_table(path, [], version=1)
+            self.assertIsNone(routing.get_table())
+            routing.reset()
+            self.assertEqual(len(routing.get_table()), 0)
+        routing._state['table'] = None
+
+    def test_bulk_update(self):
+        '''Routes are dropped after bulk updates of layouts
+        '''
+        self.assertTrue(routing.alias_exists('about'))
+        models.Layout.objects.all().mark_inactive()
+        self.assertIsNone(routing._state['index'])
+
+
+class PageDataTest(instrumentation.BudgetAssertionsMixin, TestCase):
+    '''Test case for data loaded for the public pages
+    '''
+
+    def setUp(self):
+        '''Create a page with article
+        '''
+        english = mixins.Language.objects.create(code='en')
+        layout = models.Layout.objects.create(name='Page',
+                                              template='page.html')
+        self.translation = models.PageTranslation.objects.create(
+                            page=models.Page.objects.create(),
+                            language=english, layout=layout, alias='about',
+                            title_tag='About us')
+        self.article = models.PageArticle.objects.create(
+                            page=self.translation, layout=layout,
+                            place=models.Placeholder.objects.create(
+                                                            alias='content'),
+                            article_title='Company', text='<p>Hello</p>')
+
+    def test_read_models(self):
+        '''Page data contains read models instead of model instances
+        '''
+        template_name, data = views.get_page_data(None, 'about')
+        self.assertEqual(template_name, 'page.html')
+        page = data['page']
+        self.assertTrue(isinstance(page, readmodels.PageView))
+        self.assertEqual(page.id, self.translation.id)
+        self.assertEqual(unicode(page), u'About us')
+        block = data['blocks']['content']
+        self.assertEqual(block.text, '<p>Hello</p>')
+        self.assertEqual(pickle.loads(pickle.dumps(page, 2)), page)
+
+    @override_settings(PAGES_CACHE_TIMEOUT=60)
+    def test_cache(self):
+        '''Page data is cached until content changed
+        '''
+        views.get_page_data(None, 'about')
+        with self.assertNumQueries(0):
+            __, data = views.get_page_data(None, 'about')
+        self.article.text = '<p>Updated</p>'
+        self.article.save()
+        __, data = views.get_page_data(None, 'about')
+        self.assertEqual(data['blocks']['content'].text, '<p>Updated</p>')
+
+    @override_settings(PAGES_CACHE_TIMEOUT=60)
+    def test_cache_after_commit(self):
+        '''Data cached from old rows before commit is deleted after it
+        '''
+        deferred.get_pending().clear()
+        views.get_page_data(None, 'about')
+        entry = cache.get_cache().get(cache.page_key('about'))
+        self.article.text = '<p>Updated</p>'
+        self.article.save()
+        self.assertIsNone(cache.get_cache().get(cache.page_key('about')))
+        # Concurrent reader caches old rows while transaction isn't committed
+        cache.get_cache().set(cache.page_key('about'), entry)
+        deferred.run_pending()
+        self.assertIsNone(cache.get_cache().get(cache.page_key('about')))
+
+    @override_settings(PAGES_QUERY_BUDGETS={'get_page_data': 3})
+    def test_budget(self):
+        '''Page data is loaded within queries budget
+        '''
+        self.assertQueryBudget('get_page_data', views.get_page_data, None,
+                               'about')
+        with instrumentation.assert_budget(2) as tracker:
+            views.get_page_data(None, 'about')
+        self.assertEqual(tracker.queries, 2)
+
+        def over_budget():
+            '''Run page data loading with not enough budget
+            '''
+            with instrumentation.assert_budget(1):
+                views.get_page_data(None, 'about')
+        self.assertRaises(AssertionError, over_budget)
+
+    def test_all_databases(self):
+        '''Queries to all databases are counted
+        '''
+        views.get_page_data(None, 'about')  # Load routing index
+        with extra_database('other'):
+            with instrumentation.assert_budget(3) as tracker:
+                views.get_page_data(None, 'about')
+                db.connections['other'].cursor().execute('SELECT 1')
+            self.assertEqual(tracker.queries, 3)
+
+    @override_settings(PAGES_SERVE_PUBLISHED=True)
+    def test_published(self):
+        '''Only published data is shown when published pages are served
+        '''
+        routing.invalidate()
+        self.assertRaises(http.Http404, views.get_page_data, None, 'about')
+        publishing.publish([self.translation.id])
+        self.article.text = '<p>Draft</p>'
+        self.article.save()
+        self.assertTrue(routing.alias_exists('about'))
+        with self.assertNumQueries(1):
+            template_name, data = views.get_page_data(None, 'about')
+        self.assertEqual(template_name, 'page.html')
+        self.assertEqual(data['page'].id, self.translation.id)
+        self.assertEqual(data['blocks']['content'].text, '<p>Hello</p>')
+        self.translation.is_active = False
+        self.translation.save()
+        publishing.publish([self.translation.id])
+        self.assertRaises(http.Http404, views.get_page_data, None, 'about')
+
+    @override_settings(PAGES_SERVE_PUBLISHED=True, PAGES_CACHE_TIMEOUT=60)
+    def test_republish(self):
+        '''Replaced published pages are deleted without signals for every
+        row and invalidated with published ones
+        '''
+        publishing.publish([self.translation.id])
+        self.translation.alias = 'company'
+        self.translation.save()
+        views.get_page_data(None, 'about')
+        self.assertIsNotNone(cache.get_cache().get(cache.page_key('about')))
+        deleted = []
+        receiver = lambda sender, **kwargs: deleted.append(kwargs['instance'])
+        db.models.signals.post_delete.connect(receiver,
+                                              sender=models.PublishedPage)
+        self.addCleanup(db.models.signals.post_delete.disconnect, receiver,
+                        sender=models.PublishedPage)
+        publishing.publish([self.translation.id])
+        self.assertEqual(deleted, [])
+        self.assertEqual(list(models.PublishedPage.objects.values_list(
+                                                    'alias', flat=True)),
+                         [u'company'])
+        self.assertIsNone(cache.get_cache().get(cache.page_key('about')))
+
+    @override_settings(PAGES_SERVE_PUBLISHED=True, PAGES_CACHE_TIMEOUT=60)
+    def test_published_menu(self):
+        '''Menus show published translations when published pages are served
+        '''
+        deferred.get_pending().clear()
+        models.MenuItem.objects.create(
+                menu=models.Menu.objects.create(name='Main', alias='main'),
+                page=self.translation.page, order=1)
+        self.translation.header = 'About'
+        self.translation.save()
+        publishing.publish([self.translation.id])
+        self.translation.header = 'Draft about'
+        self.translation.save()
+        self.assertEqual([unicode(item) for item
+                          in menu_tags.get_menu_items('main', 'en')],
+                         [u'About'])
+        self.assertEqual(menu_tags.get_menu_items('main', 'en')[0].alias,
+                         'about')
+        publishing.publish([self.translation.id])
+        self.assertEqual([unicode(item) for item
+                          in menu_tags.get_menu_items('main', 'en')],
+                         [u'Draft about'])
+
+
+class CompressionTest(TestCase):
+    '''Test case for precompressed response bodies
+    '''
+
+    def test_accepted_encodings(self):
+        '''Parse Accept-Encoding header
+        '''
+        self.assertEqual(compression.accepted_encodings(''),
+                         set(['identity']))
+        self.assertEqual(
+                compression.accepted_encodings('gzip, deflate;q=0.5, br;q=0'),
+                set(['identity', 'gzip', 'deflate']))
+
+    def test_compressed_response(self):
+        '''Response is served in encoding accepted by client
+        '''
+        bodies = compression.compress('<p>Hello, world!</p>' * 100)
+        self.assertTrue('gzip' in bodies)
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        response = compression.compressed_response(request, bodies,
+                                                   'text/html')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response.content, bodies['gzip'])
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        request = RequestFactory().get('/')
+        response = compression.compressed_response(request, bodies,
+                                                   'text/html')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, bodies['identity'])
+
+
+class HTMLCacheTest(TestCase):
+    '''Test case for rendered pages cached by page view
+    '''
+
+    def setUp(self):
+        '''Create a page showing menu with another page
+        '''
+        use_template(self, '{% load menu_tags %}'
+                           '{% menu_items "items" "main" %}'
+                           '{% for item in items %}<a>{{ item }}</a>'
+                           '{% endfor %}{{ blocks.content.text|safe }}',
+                     PAGES_CACHE_TIMEOUT=60, PAGES_CACHE_HTML=True)
+        cache.get_cache().clear()
+        english = mixins.Language.objects.create(code='en')
+        layout = models.Layout.objects.create(name='Page',
+                                              template='page.html')
+        translation = models.PageTranslation.objects.create(
+                            page=models.Page.objects.create(),
+                            language=english, layout=layout, alias='about')
+        models.PageArticle.objects.create(page=translation, layout=layout,
+                            place=models.Placeholder.objects.create(
+                                                            alias='content'),
+                            article_title='Company',
+                            text='<p>Hello, world!</p>' * 20)
+        self.news = models.PageTranslation.objects.create(
+                            page=models.Page.objects.create(),
+                            language=english, layout=layout, alias='news',
+                            header='News')
+        models.MenuItem.objects.create(
+                menu=models.Menu.objects.create(name='Main', alias='main'),
+                page=self.news.page, order=1)
+        routing.invalidate()
+
+    def test_cache_hit(self):
+        '''Rendered page is taken from cache without queries
+        '''
+        response = views.page_view(RequestFactory().get('/about/'), 'about')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue('<a>News</a>' in response.content)
+        with self.assertNumQueries(0):
+            cached = views.page_view(RequestFactory().get('/about/'), 'about')
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached['Vary'], 'Accept-Encoding')
+
+    def test_encodings(self):
+        '''Cached page is served in encoding accepted by request
+        '''
+        response = views.page_view(RequestFactory().get('/about/',
+                                        HTTP_ACCEPT_ENCODING='gzip, br;q=0'),
+                                   'about')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        with self.assertNumQueries(0):
+            plain = views.page_view(RequestFactory().get('/about/'), 'about')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertEqual(plain['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO.StringIO(
+                                            response.content)).read(),
+                         plain.content)
+
+    def test_fresh(self):
+        '''Cached page is rendered again when menu shown on it changes
+        '''
+        views.page_view(RequestFactory().get('/about/'), 'about')
+        entry = cache.get_cache().get(cache.html_key('about'))[1]
+        self.assertEqual(entry[2].keys(), ['main'])
+        self.assertTrue(views.is_html_fresh(entry))
+        self.news.header = 'Latest news'
+        self.news.save()
+        self.assertFalse(views.is_html_fresh(entry))
+        response = views.page_view(RequestFactory().get('/about/'), 'about')
+        self.assertTrue('<a>Latest news</a>' in response.content)
+
+
+class WarmupTest(TransactionTestCase):
+    '''Test case for warming up of pages caches
+    '''
+
+    def setUp(self):
+        '''Create the default page, a page in menu and another page
+        '''
+        english = mixins.Language.objects.create(code='en')
+        layout = models.Layout.objects.create(name='Page',
+                                              template='page.html')
+        for alias in ('about', 'news', 'home'):
+            models.PageTranslation.objects.create(
+                        page=models.Page.objects.create(
+                                            is_default=alias == 'home'),
+                        language=english, layout=layout, alias=alias,
+                        header=alias.capitalize())
+        models.MenuItem.objects.create(
+                menu=models.Menu.objects.create(name='Main', alias='main'),
+                page=models.Page.objects.get(translations__alias='news'),
+                order=1)
+        cache.get_cache().clear()
+        bus.poll(force=True)  # Bus counters were cleared with cache
+
+    def test_tasks(self):
+        '''Menus are warmed first, then the default page and menu pages
+        '''
+        self.assertEqual(warmup.get_tasks(), [('menu', 'main', 'en'),
+                                              ('page', 'home'), ('page', None),
+                                              ('page', 'news'),
+                                              ('page', 'about')])
+        self.assertEqual(warmup.get_tasks(False)[1:],
+                         [('page', None), ('page', 'about'), ('page', 'news'),
+                          ('page', 'home')])
+
+    @override_settings(PAGES_CACHE_TIMEOUT=60)
+    def test_run(self):
+        '''Pool workers fill menus and page data caches
+        '''
+        results = []
+        with shared_connections():
+            warmup.run(warmup.get_tasks(), workers=2,
+                       callback=results.append)
+        self.assertEqual(len(results), 5)
+        self.assertEqual([error for __, __, error in results], [None] * 5)
+        backend = cache.get_cache()
+        self.assertEqual([unicode(item) for item in backend.get(
+                                cache.menu_key('main', 'en'))[1]], [u'News'])
+        for slug in ('home', None, 'news', 'about'):
+            self.assertIsNotNone(backend.get(cache.page_key(slug)))
+        with self.assertNumQueries(0):
+            __, data = views.get_page_data(None, 'about')
+        self.assertEqual(data['page'].header, 'About')
+
+
+    @override_settings(PAGES_CACHE_TIMEOUT=60, PAGES_CACHE_HTML=True,
+                       PAGES_STATS=True, PAGES_STATS_INTERVAL=0)
+    def test_not_counted(self):
+        '''Pages rendered by warm-up aren't counted as views
+        '''
+        stats._counts.clear()
+        self.assertIsNone(warmup.warm(('page', 'about'))[2])
+        self.assertIsNotNone(cache.get_cache().get(cache.html_key('about')))
+        self.assertFalse(stats._counts)
+
+
+class ProfilingTest(TestCase):
+    '''Test case for page phases timings
+    '''
+
+    def test_server_timing(self):
+        '''Build Server-Timing header from phases durations
+        '''
+        timings = profiling.Timings()
+        timings.add('page', 0.002)
+        timings.add('menus', 0.001)
+        timings.add('menus', 0.0005)
+        self.assertEqual(timings.header(), 'page;dur=2.0, menus;dur=1.5')
+        with profiling.phase('route'):
+            pass  # There are no timings outside of profiled view
+        self.assertEqual(profiling.current_timings(), None)
+
+    def test_timed(self):
+        '''Phases of timed view are passed into profiling hook
+        '''
+        calls = []
+
+        @profiling.timed
+        def view(request):
+            '''Run a phase
+            '''
+            with profiling.phase('page'):
+                pass
+            return http.HttpResponse('')
+
+        def hook(request, response, timings):
+            '''Remember timings
+            '''
+            calls.append(timings)
+        request = RequestFactory().get('/')
+        self.assertFalse(view(request).has_header('Server-Timing'))
+        with self.settings(PAGES_PROFILING_HOOK=hook):
+            response = view(request)
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(calls[0].phases, ['page', 'total'])
+        self.assertEqual(profiling.current_timings(), None)
+
+    @override_settings(PAGES_SERVER_TIMING=True)
+    def test_page_view(self):
+        '''Page view sends timings of its phases in Server-Timing header
+        '''
+        use_template(self, '{{ blocks.content.text|safe }}')
+        english = mixins.Language.objects.create(code='en')
+        layout = models.Layout.objects.create(name='Page',
+                                              template='page.html')
+        translation = models.PageTranslation.objects.create(
+                            page=models.Page.objects.create(),
+                            language=english, layout=layout, alias='about')
+        models.PageArticle.objects.create(page=translation, layout=layout,
+                            place=models.Placeholder.objects.create(
+                                                            alias='content'),
+                            article_title='Company', text='<p>Hello</p>')
+        routing.invalidate()
+        response = views.page_view(RequestFactory().get('/about/'), 'about')
+        self.assertEqual(response.content, '<p>Hello</p>')
+        self.assertEqual([timing.split(';')[0] for timing
+                          in response['Server-Timing'].split(', ')],
+                         ['route', 'page', 'blocks', 'template', 'render',
+                          'total'])
+
+    @override_settings(PAGES_PROFILE_SAMPLE_RATE=1)
+    def test_sampled(self):
+        '''Profiles of sampled requests are dumped, failed dumps don't break
+        requests
+        '''
+        view = profiling.timed(lambda request: http.HttpResponse('Done'))
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        profiles = os.path.join(directory, 'profiles')
+        with self.settings(PAGES_PROFILE_DIR=profiles):
+            response = view(RequestFactory().get('/news/2014/'))
+        self.assertEqual(response.content, 'Done')
+        names = os.listdir(profiles)
+        self.assertEqual(len(names), 1)
+        self.assertTrue(names[0].startswith('news_2014-'))
+        with open(os.path.join(directory, 'file'), 'w'):
+            pass
+        with self.settings(PAGES_PROFILE_DIR=os.path.join(directory, 'file',
+                                                          'profiles')):
+            response = view(RequestFactory().get('/news/2014/'))
+        self.assertEqual(response.content, 'Done')
+
+
+@override_settings(PAGES_DATABASE_PRIMARY='default',
+                   PAGES_DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTest(TestCase):
+    '''Test case for pages database router
+    '''
+
+    def setUp(self):
+        '''Create router and middleware
+        '''
+        self.router = routers.ReplicaRouter()
+        self.middleware = routers.PrimaryStickinessMiddleware()
+        self.factory = RequestFactory()
+
+    def tearDown(self):
+        '''Unpin thread
+        '''
+        routers.pin_to_primary(False)
+
+    def test_routing(self):
+        '''Reads go to replica until something is written
+        '''
+        routers.pin_to_primary(False)
+        self.assertEqual(self.router.db_for_read(models.Page), 'replica')
+        self.assertEqual(self.router.db_for_read(mixins.Language), 'replica')
+        self.assertEqual(self.router.db_for_write(models.Page), 'default')
+        self.assertEqual(self.router.db_for_read(models.Page), 'default')
+
+    def test_stickiness(self):
+        '''User stays on primary for a while after writing
+        '''
+        request = self.factory.post('/admin/pages/page/1/')
+        request.session = {}
+        self.middleware.process_request(request)
+        self.assertEqual(self.router.db_for_read(models.Page), 'default')
+        self.router.db_for_write(models.Page)
+        self.middleware.process_response(request, http.HttpResponse())
+        self.assertEqual(self.router.db_for_read(models.Page), 'replica')
+        # Next request of the same user is pinned to primary
+        next_request = self.factory.get('/about/')
+        next_request.session = request.session
+        self.middleware.process_request(next_request)
+        self.assertEqual(self.router.db_for_read(models.Page), 'default')
+        self.middleware.process_response(next_request, http.HttpResponse())
+        # Anonymous users read from replica
+        anonymous_request = self.factory.get('/about/')
+        anonymous_request.session = {}
+        self.middleware.process_request(anonymous_request)
+        self.assertEqual(self.router.db_for_read(models.Page), 'replica')
+
+    def test_databases(self):
+        '''Reads go to replica database, after a write they go to primary
+        until the end of request
+        '''
+        with extra_database('replica'):
+            management.call_command('syncdb', database='replica',
+                                    verbosity=0, interactive=False)
+            models.Placeholder.objects.using('replica').create(
+                                            alias='content', name='Replica')
+            models.Placeholder.objects.create(alias='content', name='Primary')
+            self.addCleanup(setattr, db.router, 'routers', db.router.routers)
+            db.router.routers = [self.router]
+            routers.pin_to_primary(False)
+            self.assertEqual(models.Placeholder.objects.get().name,
+                             'Replica')
+            models.Placeholder.objects.create(alias='sidebar')
+            self.assertEqual(models.Placeholder.objects.get(
+                                                alias='content').name,
+                             'Primary')
+            routers.request_finished(sender=None)
+            self.assertEqual(models.Placeholder.objects.get().name,
+                             'Replica')
+
+
+class ProcessingTest(TestCase):
+    '''Test case for article content processors
+    '''
+
+    def test_sanitize(self):
+        '''Remove scripts and event handlers
+        '''
+        self.assertEqual(processing.sanitize(
+                    '<p onclick="go()" onmouseover=\'go()\'>Hi</p>'
+                    '<script type="text/javascript">go();</script>'
+                    '<a href="javascript:go()">link</a>'),
+                '<p>Hi</p><a href="#">link</a>')
+
+    def test_sanitize_payloads(self):
+        '''Only allowed tags, attributes and URLs are kept
+        '''
+        for html, sanitized in (
+                ('<scr<script></script>ipt>alert(1)</script>',
+                 'ipt&gt;alert(1)'),
+                ('<svg/onload=alert(1)>Logo', 'Logo'),
+                ('<a href="jav&#x61;script:alert(1)">x</a>',
+                 '<a href="#">x</a>'),
+                ('<a href="java\tscript:alert(1)">x</a>', '<a href="#">x</a>'),
+                ('<form action="javascript:alert(1)"><input>Send</form>',
+                 'Send'),
+                ('<a href="javascript:alert(1) ">x</a>', '<a href="#">x</a>'),
+                ('<style>p {background: url(javascript:x)}</style><p>Hi',
+                 '<p>Hi</p>'),
+                ('<iframe><iframe></iframe>x</iframe><img src=x onerror=go()>',
+                 '<img src="x" />'),
+                ('<a href="page:2" title=\'"x"\'>p</a></div>1 < 2',
+                 '<a href="page:2" title="&quot;x&quot;">p</a>1 &lt; 2')):
+            self.assertEqual(processing.sanitize(html), sanitized)
+
+    def test_lazy_images(self):
+        '''Images are loaded lazily
+        '''
+        self.assertEqual(processing.lazy_images(
+                            '<img src="a.png" /><img loading="eager" />'),
+                         '<img loading="lazy" src="a.png" />'
+                         '<img loading="eager" />')
+
+    def test_heading_anchors(self):
+        '''Headings get unique ids
+        '''
+        self.assertEqual(processing.heading_anchors(
+                '<h2>Our team</h2><h2>Our <b>team</b></h2><h3 id="x">X</h3>'),
+                '<h2 id="our-team">Our team</h2>'
+                '<h2 id="our-team-2">Our <b>team</b></h2><h3 id="x">X</h3>')
+
+    @override_settings(PAGES_CONTENT_PROCESSORS=(
+                                        'pages.processing.lazy_images', ))
+    def test_save(self):
+        '''Processed text is stored on save
+        '''
+        english = mixins.Language.objects.create(code='en')
+        layout = models.Layout.objects.create(name='Page',
+                                              template='page.html')
+        translation = models.PageTranslation.objects.create(
+                            page=models.Page.objects.create(),
+                            language=english, layout=layout, alias='about')
+        article = models.PageArticle.objects.create(page=translation,
+                            layout=layout,
+                            place=models.Placeholder.objects.create(
+                                                            alias='content'),
+                            article_title='Team', text='<img src="a.png" />')
+        self.assertEqual(article.html, '<img loading="lazy" src="a.png" />')
+        self.assertEqual(article.text, '<img src="a.png" />')
+
+
+class DependenciesTest(TestCase):
+    '''Test case for pages dependencies used for invalidation
+    '''
+
+    def setUp(self):
+        '''Create a page and a page linking to it
+        '''
+        english = mixins.Language.objects.create(code='en')
+        layout = models.Layout.objects.create(name='Page',
+                                              template='page.html')
+        place = models.Placeholder.objects.create(alias='content')
+        self.about, self.news, self.contacts = [
+                models.PageTranslation.objects.create(
+                            page=models.Page.objects.create(),
+                            language=english, layout=layout, alias=alias)
+                for alias in ('about', 'news', 'contacts')]
+        self.article = models.PageArticle.objects.create(page=self.news,
+                layout=layout, place=place, article_title='News',
+                text='<a href="page:%d">About</a> <a href="/contacts/#map">'
+                     'Map</a>' % self.about.page_id)
+
+    def test_links(self):
+        '''Links by page id and by alias are extracted on save
+        '''
+        self.assertEqual(set(self.news.links.values_list('target_id',
+                                                         flat=True)),
+                         set([self.about.page_id, self.contacts.page_id]))
+        self.article.text = '<a href="http://example.com/about/">About</a>'
+        self.article.save()
+        self.assertFalse(self.news.links.exists())
+
+    @override_settings(PAGES_CACHE_TIMEOUT=60, PAGES_CONTENT_PROCESSORS=(
+                                    'pages.processing.rewrite_page_links',))
+    def test_invalidation(self):
+        '''Only pages depending on changed translation are invalidated
+        '''
+        self.article.save()
+        self.assertEqual(dependencies.affected_aliases([self.about.id]),
+                         set(['about', 'news']))
+        for alias in ('about', 'news', 'contacts'):
+            views.get_page_data(None, alias)
+        self.about.alias = 'company'
+        self.about.save()
+        routing.alias_exists('company')  # Rebuild routing index
+        with self.assertNumQueries(0):
+            views.get_page_data(None, 'contacts')
+        __, data = views.get_page_data(None, 'news')
+        self.assertTrue('href="/company/"' in data['blocks']['content'].text)
+
+
+class PublishCommandTest(TransactionTestCase):
+    '''Test case for routes refreshed by management commands
+    '''
+
+    def test_publish(self):
+        '''Shared table is rebuilt after pages are published by command
+        '''
+        english = mixins.Language.objects.create(code='en')
+        layout = models.Layout.objects.create(name='Page',
+                                              template='page.html')
+        models.PageTranslation.objects.create(
+                            page=models.Page.objects.create(),
+                            language=english, layout=layout, alias='about',
+                            title='About')
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        self.addCleanup(os.unlink, path)
+        with override_settings(PAGES_ROUTING_TABLE=path,
+                               PAGES_SERVE_PUBLISHED=True):
+            routing.build_table()
+            self.assertEqual(len(routing.RouteTable(path)), 0)
+            management.call_command('pages_publish', all=True, verbosity=0)
+            self.assertIn(u'about', routing.RouteTable(path))
+            self.assertFalse(deferred.get_pending())
+
+
+class DependenciesCommitTest(TransactionTestCase):
+    '''Test case for invalidation after transaction commit
+    '''
+
+    @override_settings(PAGES_CACHE_TIMEOUT=60)
+    def test_request(self):
+        '''Dependent pages are invalidated again after request transaction
+        '''
+        english = mixins.Language.objects.create(code='en')
+        layout = models.Layout.objects.create(name='Page',
+                                              template='page.html')
+        about, news = [models.PageTranslation.objects.create(
+                            page=models.Page.objects.create(),
+                            language=english, layout=layout, alias=alias)
+                       for alias in ('about', 'news')]
+        models.PageArticle.objects.create(page=news, layout=layout,
+                place=models.Placeholder.objects.create(alias='content'),
+                article_title='News',
+                text='<a href="page:%d">About</a>' % about.page_id)
+        key = cache.page_key('news')
+        views.get_page_data(None, 'news')
+        entry = cache.get_cache().get(key)
+        with transaction.commit_on_success():
+            about.title = 'Company'
+            about.save()
+            self.assertIsNone(cache.get_cache().get(key))
+            # Concurrent reader caches old rows before commit
+            cache.get_cache().set(key, entry)
+        signals.request_finished.send(sender=None)
+        self.assertIsNone(cache.get_cache().get(key))
+
+
+@override_settings(PAGES_BUS_BACKEND='pages.bus.LocalBackend',
+                   PAGES_BUS_INTERVAL=0)
+class BusTest(TestCase):
+    '''Test case for invalidation bus of in-process state
+    '''
+
+    def test_other_process(self):
+        '''Local state is dropped when namespace is bumped by other process
+        '''
+        state = bus.LocalState('test')
+        self.assertEqual(state.get('key', lambda: 1), 1)
+        self.assertEqual(state.get('key', lambda: 2), 1)
+        bus.get_backend().incr('test')  # Bump without local notification
+        self.assertEqual(state.get('key', lambda: 3), 3)
+        bus.bump('test')
+        self.assertEqual(state.get('key', lambda: 4), 4)
+
+    def test_default_layout(self):
+        '''Default layout is taken again after layouts changed
+        '''
+        models.Layout.objects.create(name='Old', template='page.html',
+                                     is_default=True)
+        page_admin = pages_admin.PageAdmin(models.Page, admin.site)
+        self.assertEqual(page_admin.default_layout.name, 'Old')
+        models.Layout.objects.create(name='New', template='page.html',
+                                     is_default=True)
+        with self.assertNumQueries(1):
+            self.assertEqual(page_admin.default_layout.name, 'New')
+            page_admin.default_layout
+
+    def test_after_commit(self):
+        '''State loaded from old rows before commit is dropped after it
+        '''
+        deferred.get_pending().clear()
+        models.Language.objects.create(code='en')
+        # Concurrent reader loads old rows while transaction isn't committed
+        self.assertEqual(bus.languages.get('en', lambda: 'old'), 'old')
+        deferred.run_pending()
+        self.assertEqual(bus.languages.get('en', lambda: 'new'), 'new')
+
+    @override_settings(PAGES_CACHE_TIMEOUT=60,
+                       PAGES_TEMPLATES_PLACEHOLDERS={
+                                        'page.html': ('content', )})
+    def test_layout_form(self):
+        '''Empty content forms of layout are rendered once
+        '''
+        mixins.Language.objects.create(code='en')
+        layout = models.Layout.objects.create(name='Page',
+                                              template='page.html')
+        page_admin = pages_admin.PageAdmin(models.Page, admin.site)
+        request = RequestFactory().get('/')
+        response = page_admin.layout_view(request, layout_id=str(layout.id),
+                                          lang_code='en')
+        self.assertIn('en-%d-content-text' % layout.id, response.content)
+        with self.assertNumQueries(0):
+            self.assertEqual(page_admin.layout_view(request,
+                                    layout_id=str(layout.id),
+                                    lang_code='en').content,
+                             response.content)
+        # Labels are translated to the language of admin interface
+        with translation.override('ru'):
+            self.assertNotEqual(page_admin.layout_view(request,
+                                        layout_id=str(layout.id),
+                                        lang_code='en').content,
+                                response.content)
+
+
+class LocalCacheTest(TestCase):
+    '''Test case for in-process tier of pages cache
+    '''
+
+    def test_lru(self):
+        '''Least recently used entries are evicted
+        '''
+        local_cache = lru.LRUCache(2)
+        local_cache.set('a', 1)
+        local_cache.set('b', 2)
+        local_cache.get('a')
+        local_cache.set('c', 3)
+        self.assertEqual(local_cache.get('b'), lru.MISSING)
+        self.assertEqual(local_cache.get('a'), 1)
+        stats = local_cache.stats()
+        self.assertEqual((stats['entries'], stats['hits'], stats['misses'],
+                          stats['evictions']), (2, 2, 1, 1))
+
+    def test_size(self):
+        '''Size of entries is limited
+        '''
+        local_cache = lru.LRUCache(10, max_bytes=150)
+        local_cache.set('big', 'x' * 200)
+        self.assertEqual(local_cache.get('big'), lru.MISSING)
+        local_cache.set('a', 'x' * 60)
+        local_cache.set('b', 'x' * 60)
+        local_cache.set('c', 'x' * 60)
+        self.assertEqual(local_cache.stats()['evictions'], 1)
+        self.assertTrue(local_cache.stats()['bytes'] <= 150)
+
+    @override_settings(PAGES_CACHE_TIMEOUT=60, PAGES_LOCAL_CACHE_ENTRIES=10,
+                       PAGES_BUS_BACKEND='pages.bus.LocalBackend')
+    def test_coalescing(self):
+        '''Value is computed once by concurrent threads and invalidated
+        '''
+        calls = []
+
+        def compute():
+            '''Compute value slowly
+            '''
+            calls.append(1)
+            time.sleep(0.05)
+            return len(calls)
+        threads = [threading.Thread(target=cache.get_or_compute,
+                                    args=('pages:test', compute))
+                   for __ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.get_or_compute('pages:test', compute), 1)
+        cache.invalidate()
+        self.assertEqual(cache.get_or_compute('pages:test', compute), 2)
+
+    @override_settings(PAGES_CACHE_TIMEOUT=100, PAGES_CACHE_JITTER=0.5)
+    def test_jitter(self):
+        '''Entries of shared cache expire after timeouts shortened by jitter
+        '''
+        backend = cache.get_cache()
+        backend.clear()
+        cache.new_generation()
+        timeouts = []
+
+        def set_value(key, value, timeout=None, **kwargs):
+            '''Remember timeout of entry
+            '''
+            timeouts.append(timeout)
+        backend.set = set_value
+        self.addCleanup(delattr, backend, 'set')
+        for index in range(20):
+            cache.get_or_compute('pages:test-%d' % index, lambda: 0)
+        cache.get_or_compute('pages:test-short', lambda: 0, timeout=1)
+        self.assertTrue(all(50 <= timeout <= 100 for timeout in timeouts[:-1]))
+        self.assertTrue(len(set(timeouts)) > 1)
+        self.assertEqual(timeouts[-1], 1)
+
+
+class SchedulingTest(TestCase):
+    '''Test case for scheduled publishing
+    '''
+
+    def setUp(self):
+        '''Create a page scheduled for publishing
+        '''
+        english = mixins.Language.objects.create(code='en')
+        layout = models.Layout.objects.create(name='Page',
+                                              template='page.html')
+        self.now = timezone.now()
+        self.translation = models.PageTranslation.objects.create(
+                            page=models.Page.objects.create(),
+                            language=english, layout=layout, alias='launch',
+                            is_active=False,
+                            publish_at=self.now + datetime.timedelta(hours=1),
+                            expire_at=self.now + datetime.timedelta(hours=2))
+
+    @override_settings(PAGES_CACHE_TIMEOUT=60 * 60 * 24)
+    def test_cache_timeout(self):
+        '''Cache entries live until the nearest transition
+        '''
+        self.assertTrue(3000 < scheduling.cache_timeout() <= 3601)
+
+    def test_apply_due(self):
+        '''Due transitions are applied in bulk
+        '''
+        self.assertEqual(scheduling.apply_due(self.now), [])
+        self.assertFalse(routing.alias_exists('launch'))
+        hour = datetime.timedelta(hours=1)
+        self.assertEqual(scheduling.apply_due(self.now + hour),
+                         [self.translation.id])
+        self.assertTrue(routing.alias_exists('launch'))
+        translation = models.PageTranslation.objects.get(
+                                                pk=self.translation.pk)
+        self.assertEqual((translation.is_active, translation.publish_at),
+                         (True, None))
+        self.assertEqual(scheduling.apply_due(self.now + 2 * hour),
+                         [self.translation.id])
+        self.assertFalse(routing.alias_exists('launch'))
+        self.assertEqual(scheduling.get_next_transition(), None)
+
+
+    def test_form(self):
+        '''Translations scheduled for publishing aren't active at once
+        '''
+        data = {'en-title_tag': 'Sale', 'en-alias': 'sale',
+                'en-layout': self.translation.layout_id, 'en-is_active': 'on',
+                'en-publish_at': '2100-01-01 10:00'}
+        form = forms.PageTranslationForm(data,
+                                         language=self.translation.language)
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertFalse(form.cleaned_data['is_active'])
+        data['en-publish_at'] = '2000-01-01 10:00'
+        form = forms.PageTranslationForm(data,
+                                         language=self.translation.language)
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertTrue(form.cleaned_data['is_active'])
+
+
+class ParallelTest(TestCase):
+    '''Test case for concurrent variant of page view
+    '''
+
+    @override_settings(PAGES_CONCURRENT_WORKERS=2)
+    def test_gather(self):
+        '''Calls are run concurrently and results are kept in order
+        '''
+        released = threading.Event()
+        # The first call waits for the last one, so they can't be run in turn
+        self.assertEqual(parallel.gather([(released.wait, 5), (len, 'ab'),
+                                          (released.set, )]),
+                         [True, 2, None])
+        self.assertRaises(ValueError, parallel.gather,
+                          [(len, ''), (int, 'x')])
+
+    @override_settings(PAGES_CONCURRENT_WORKERS=2)
+    def test_context(self):
+        '''Phases and queries of pool threads are counted for request
+        '''
+        def query():
+            '''Make a query in a timed phase
+            '''
+            with profiling.phase('blocks'):
+                db.connection.cursor().execute('SELECT 1')
+        timings = profiling.Timings()
+        with profiling.carried(timings):
+            with instrumentation.assert_budget(1) as tracker:
+                parallel.gather([(len, ''), (query, )])
+        self.assertEqual(tracker.queries, 1)
+        self.assertEqual(timings.phases, ['blocks'])
+
+    def test_page_data(self):
+        '''Page data is the same as loaded by sequential view
+        '''
+        english = mixins.Language.objects.create(code='en')
+        layout = models.Layout.objects.create(name='Page',
+                                              template='page.html')
+        translation = models.PageTranslation.objects.create(
+                            page=models.Page.objects.create(),
+                            language=english, layout=layout, alias='about')
+        models.PageArticle.objects.create(page=translation, layout=layout,
+                            place=models.Placeholder.objects.create(
+                                                            alias='content'),
+                            article_title='Company', text='<p>Hello</p>')
+        self.assertEqual(parallel.load_page_data('about'),
+                         views.load_page_data('about'))
+
+
+class ParallelDatabaseTest(TransactionTestCase):
+    '''Test case for concurrent loading of pages from database
+    '''
+
+    @override_settings(PAGES_CONCURRENT_WORKERS=2)
+    def test_page_data(self):
+        '''Page translation and blocks are loaded by different threads
+        '''
+        english = mixins.Language.objects.create(code='en')
+        layout = models.Layout.objects.create(name='Page',
+                                              template='page.html')
+        translation = models.PageTranslation.objects.create(
+                            page=models.Page.objects.create(),
+                            language=english, layout=layout, alias='about')
+        models.PageArticle.objects.create(page=translation, layout=layout,
+                            place=models.Placeholder.objects.create(
+                                                            alias='content'),
+                            article_title='Company', text='<p>Hello</p>')
+        routing.invalidate()
+        with shared_connections():
+            template_name, data = parallel.load_page_data('about')
+        self.assertEqual(template_name, 'page.html')
+        self.assertEqual(data['page'].id, translation.id)
+        self.assertEqual(data['blocks']['content'].text, '<p>Hello</p>')
+
+
+@override_settings(PAGES_SITEMAP_SIZE=2)
+class SitemapTest(TestCase):
+    '''Test case for sitemap of pages
+    '''
+
+    def setUp(self):
+        '''Create pages translated into two languages
+        '''
+        languages = [mixins.Language.objects.create(code=code)
+                     for code in ('en', 'ru')]
+        layout = models.Layout.objects.create(name='Page',
+                                              template='page.html')
+        for index in range(2):
+            page = models.Page.objects.create()
+            for language in languages:
+                models.PageTranslation.objects.create(page=page,
+                            language=language, layout=layout,
+                            alias='page-%d-%s' % (index, language.code))
+
+    def test_sections(self):
+        '''Translations are split into sections with alternates
+        '''
+        self.assertEqual(sitemap.get_sections_count(), 2)
+        xml = ''.join(sitemap.urlset(1, 'http://example.com'))
+        self.assertEqual(xml.count('<url>'), 2)
+        self.assertTrue('<loc>http://example.com/page-1-en/</loc>' in xml)
+        self.assertTrue('<xhtml:link rel="alternate" hreflang="ru" '
+                        'href="http://example.com/page-1-ru/"/>' in xml)
+        self.assertFalse('page-0' in xml)
+        self.assertEqual(list(sitemap.urlset(2, 'http://example.com'))[2:],
+                         [sitemap.URLSET_END])
+
+    def test_write(self):
+        '''Sitemap files are written with index
+        '''
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        names = sitemap.write(directory, 'http://example.com', compress=True)
+        self.assertEqual(names, ['sitemap-0.xml.gz', 'sitemap-1.xml.gz',
+                                 'sitemap.xml.gz'])
+        index = gzip.open(os.path.join(directory, 'sitemap.xml.gz')).read()
+        self.assertTrue('<loc>http://example.com/sitemap-1.xml.gz</loc>'
+                        in index)
+
+    @override_settings(PAGES_SERVE_PUBLISHED=True)
+    def test_published(self):
+        '''Published translations are listed when published pages are served
+        '''
+        publishing.publish_pages(models.Page.objects.filter(
+                                    translations__alias='page-1-en'))
+        translation = models.PageTranslation.objects.get(alias='page-1-en')
+        translation.alias = 'draft'
+        translation.save()
+        self.assertEqual(sitemap.get_sections_count(), 1)
+        xml = ''.join(sitemap.urlset(0, 'http://example.com'))
+        self.assertEqual(xml.count('<url>'), 2)
+        self.assertTrue('<loc>http://example.com/page-1-en/</loc>' in xml)
+        self.assertTrue('<xhtml:link rel="alternate" hreflang="ru" '
+                        'href="http://example.com/page-1-ru/"/>' in xml)
+        self.assertFalse('page-0' in xml or 'draft' in xml)
+
+
+class CloningTest(TestCase):
+    '''Test case for cloning pages content into a new language
+    '''
+
+    def test_clone(self):
+        '''Translations and articles are copied with unique aliases
+        '''
+        english = mixins.Language.objects.create(code='en')
+        layout = models.Layout.objects.create(name='Page',
+                                              template='page.html')
+        place = models.Placeholder.objects.create(alias='content')
+        about, news = [models.PageTranslation.objects.create(
+                            page=models.Page.objects.create(),
+                            language=english, layout=layout, alias=alias,
+                            title_tag=alias.title())
+                       for alias in ('about', 'about-ru')]
+        models.PageArticle.objects.create(page=news, layout=layout,
+                place=place, article_title='News',
+                text='<a href="page:%d">About</a>' % about.page_id)
+        created = cloning.clone_language('en', 'ru')
+        self.assertEqual(len(created), 2)
+        copy = models.PageTranslation.objects.get(page=news.page,
+                                                  language='ru')
+        self.assertEqual((copy.alias, copy.title_tag, copy.is_active),
+                         ('about-ru-ru', 'About-Ru', False))
+        self.assertEqual(models.PageTranslation.objects.get(
+                                page=about.page, language='ru').alias,
+                         'about-ru-2')
+        article = copy.pagearticle_blocks.get()
+        self.assertEqual((article.article_title, article.html),
+                         ('News', '<a href="page:%d">About</a>' %
+                                  about.page_id))
+        self.assertEqual(list(copy.links.values_list('target', flat=True)),
+                         [about.page_id])
+        self.assertEqual(cloning.clone_language('en', 'ru'), [])
+
+
+class BlocksTest(TestCase):
+    '''Test case for content block types registry
+    '''
+
+    def test_load(self):
+        '''Blocks of registered types are loaded by placeholders
+        '''
+        self.assertIs(blocks.registry[blocks.DEFAULT_TYPE],
+                      models.PageArticle)
+        self.assertIs(blocks.get_type('content'), models.PageArticle)
+        english = mixins.Language.objects.create(code='en')
+        layout = models.Layout.objects.create(name='Page',
+                                              template='page.html')
+        places = [models.Placeholder.objects.create(alias=alias)
+                  for alias in ('content', 'sidebar')]
+        translation = models.PageTranslation.objects.create(
+                            page=models.Page.objects.create(),
+                            language=english, layout=layout, alias='about')
+        article = models.PageArticle.objects.create(page=translation,
+                                layout=layout, place=places[0], text='Hi')
+        loaded = blocks.load(translation.id, layout.id)
+        self.assertEqual(loaded.keys(), ['content'])
+        self.assertEqual(loaded['content'].text, article.html)
+        instances = blocks.load_instances(translation, layout, places)
+        self.assertEqual(instances['content'], article)
+        self.assertEqual(instances['sidebar'].place_id, 'sidebar')
+        self.assertEqual(instances['sidebar'].text, '')
+        self.assertEqual(models.PageArticle.objects.count(), 2)
+        # Missing blocks are created at once
+        places.extend(models.Placeholder.objects.create(alias='place-%d' % i)
+                      for i in range(5))
+        with self.assertNumQueries(5):
+            instances = blocks.load_instances(translation, layout, places)
+        self.assertEqual(len(instances), 7)
+        # Texts are loaded with articles for admin forms
+        with self.assertNumQueries(0):
+            form = forms.PageArticleForm(instance=instances['content'],
+                                         layout=layout, place=places[0],
+                                         language=english)
+            self.assertEqual(form.initial['text'], 'Hi')
+            self.assertEqual(instances['place-4'].text, '')
+        self.assertEqual(list(translation.content.all()),
+                         list(translation.pagearticle_blocks.all()))
+        self.assertEqual(layout.blocks.count(), 7)
+        self.assertEqual(list(places[0].blocks.all()), [article])
+        form = forms.get_content_form(models.PageArticle)
+        self.assertIs(form, forms.get_content_form(models.PageArticle))
+        self.assertIs(form._meta.model, models.PageArticle)
+
+
+class KeysetChangeListTest(TestCase):
+    '''Test case for keyset paginated pages changelist
+    '''
+
+    def get_changelist(self, **params):
+        '''Get changelist for request with params
+        '''
+        page_admin = pages_admin.PageAdmin(models.Page, admin.site)
+        return changelist.KeysetChangeList(RequestFactory().get('/', params),
+                    models.Page, page_admin.list_display, (), (), None,
+                    page_admin.search_fields, False, 2, 200, (), page_admin)
+
+    @override_settings(PAGES_ADMIN_COUNT_LIMIT=3)
+    def test_pages(self):
+        '''Pages are seeked by key and matched by translations once
+        '''
+        layout = models.Layout.objects.create(name='Page',
+                                              template='page.html')
+        pages = [models.Page.objects.create() for __ in range(4)]
+        for page in pages:
+            for code in ('en', 'ru'):
+                models.PageTranslation.objects.create(page=page,
+                        language=mixins.Language.objects.get_or_create(
+                                                            code=code)[0],
+                        layout=layout, alias='about-%d-%s' % (page.id, code),
+                        title='About')
+        first = self.get_changelist(q='about')
+        self.assertEqual(first.result_list, pages[:1:-1])
+        self.assertEqual((first.result_count, first.count_limited),
+                         (3, True))
+        second = self.get_changelist(q='about', after=first.next_key)
+        self.assertEqual(second.result_list, pages[1::-1])
+        self.assertIsNone(second.next_key)
+        self.assertIn('after=%d' % first.next_key, first.next_url())
+
+
+@override_settings(PAGES_STATS=True, PAGES_STATS_INTERVAL=0)
+class StatsTest(TestCase):
+    '''Test case for buffered page views statistics
+    '''
+
+    def test_flush(self):
+        '''Counted views are added to daily hits by flushes
+        '''
+        translation = models.PageTranslation.objects.create(
+                            page=models.Page.objects.create(),
+                            language=mixins.Language.objects.create(code='en'),
+                            layout=models.Layout.objects.create(name='Page',
+                                                        template='page.html'),
+                            alias='about')
+        view = stats.counted(lambda request, slug=None: http.HttpResponse())
+        view(RequestFactory().get('/about'), 'about')
+        view(RequestFactory().post('/about'), 'about')
+        stats.count('about')
+        stats.count('missing')
+        with self.assertNumQueries(3):
+            self.assertEqual(stats.flush(), 2)
+        stats.count('about')
+        self.assertEqual(stats.flush(), 1)
+        self.assertEqual(stats.flush(), 0)
+        hits = models.PageHits.objects.get()
+        self.assertEqual((hits.translation, hits.date, hits.hits),
+                         (translation, stats.today(), 3))
+        self.assertEqual(stats.popular('en'), [(translation.id, 3)])
+
+    def test_concurrent_insert(self):
+        '''Rows inserted by another process during flush are updated
+        '''
+        translation = models.PageTranslation.objects.create(
+                            page=models.Page.objects.create(),
+                            language=mixins.Language.objects.create(code='en'),
+                            layout=models.Layout.objects.create(name='Page',
+                                                        template='page.html'),
+                            alias='about')
+        add_hits = stats.add_hits
+
+        def insert_meanwhile(rows):
+            '''Insert row of another process before adding hits
+            '''
+            if not models.PageHits.objects.exists():
+                models.PageHits.objects.create(translation=translation,
+                                               date=stats.today(), hits=5)
+            add_hits(rows)
+        stats.add_hits = insert_meanwhile
+        self.addCleanup(setattr, stats, 'add_hits', add_hits)
+        stats.count('about')
+        stats.count('about')
+        self.assertEqual(stats.flush(), 2)
+        self.assertEqual(models.PageHits.objects.get().hits, 7)
+
+
+class ArticleBodyTest(TestCase):
+    '''Test case for article bodies shared by articles
+    '''
+
+    def test_shared(self):
+        '''Articles with equal texts share bodies
+        '''
+        translation = models.PageTranslation.objects.create(
+                            page=models.Page.objects.create(),
+                            language=mixins.Language.objects.create(code='en'),
+                            layout=models.Layout.objects.create(name='Page',
+                                                        template='page.html'),
+                            alias='about')
+        articles = [models.PageArticle.objects.create(page=translation,
+                            layout=translation.layout, article_title='About',
+                            place=models.Placeholder.objects.create(
+                                                            alias=alias),
+                        text=u'<p>\u041f\u0440\u0438\u0432\u0435\u0442</p>')
+                    for alias in ('content', 'sidebar')]
+        self.assertEqual(articles[0].text_body_id, articles[1].text_body_id)
+        self.assertEqual(models.ArticleBody.objects.count(), 1)
+        article = models.PageArticle.objects.get(pk=articles[1].pk)
+        self.assertEqual(article.text, articles[0].text)
+        article.text = '<p>Changed</p>'
+        article.save()
+        self.assertEqual(models.PageArticle.objects.get(pk=article.pk).html,
+                         '<p>Changed</p>')
+        self.assertEqual(models.ArticleBody.objects.delete_unused(), 0)
+        articles[0].delete()
+        self.assertEqual(models.ArticleBody.objects.delete_unused(), 1)
+
+
+class ArticleBodiesConversionTest(TransactionTestCase):
+    '''Test case for conversion of articles created before article bodies
+    '''
+
+    def setUp(self):
+        '''Replace articles table with the old one
+        '''
+        self.addCleanup(self.restore_table)
+        cursor = db.connection.cursor()
+        cursor.execute('DROP TABLE pages_pagearticle')
+        cursor.execute('CREATE TABLE pages_pagearticle ('
+                       'id integer NOT NULL PRIMARY KEY, '
+                       'page_id integer NOT NULL, '
+                       'layout_id integer NOT NULL, '
+                       'place_id varchar(64) NOT NULL, '
+                       'article_title varchar(1024) NOT NULL, '
+                       'text text NOT NULL, html text NOT NULL)')
+
+    def restore_table(self):
+        '''Create articles table of the current model
+        '''
+        cursor = db.connection.cursor()
+        cursor.execute('DROP TABLE pages_pagearticle')
+        creation = db.connection.creation
+        for sql in (creation.sql_create_model(models.PageArticle,
+                                              no_style(), set())[0]
+                    + creation.sql_indexes_for_model(models.PageArticle,
+                                                     no_style())):
+            cursor.execute(sql)
+
+    def test_convert(self):
+        '''Texts are moved into bodies and the old columns are dropped
+        '''
+        layout = models.Layout.objects.create(name='Page',
+                                              template='page.html')
+        translation = models.PageTranslation.objects.create(
+                            page=models.Page.objects.create(),
+                            language=mixins.Language.objects.create(code='en'),
+                            layout=layout, alias='about')
+        models.Placeholder.objects.create(alias='content')
+        cursor = db.connection.cursor()
+        for pk, html in ((1, '<p id="x">Hi</p>'), (2, '<p>Hi</p>')):
+            cursor.execute('INSERT INTO pages_pagearticle VALUES '
+                           '(%s, %s, %s, %s, %s, %s, %s)',
+                           [pk, translation.pk, layout.pk, 'content', 'Hi',
+                            '<p>Hi</p>', html])
+        management.call_command('pages_convert_bodies', verbosity=0,
+                                chunk_size=1)
+        self.assertEqual([(article.text, article.html) for article
+                          in models.PageArticle.objects.order_by('pk')],
+                         [('<p>Hi</p>', '<p id="x">Hi</p>'),
+                          ('<p>Hi</p>', '<p>Hi</p>')])
+        self.assertEqual(models.ArticleBody.objects.count(), 2)
+        columns = [column[0] for column
+                   in db.connection.introspection.get_table_description(
+                                                cursor, 'pages_pagearticle')]
+        self.assertFalse('text' in columns or 'html' in columns)
+        self.assertRaises(management.CommandError,
+                          pages_convert_bodies.Command().handle,
+                          verbosity=0, chunk_size=500)
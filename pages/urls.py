@@ -1,16 +1,23 @@
 '''Url mapping for pages
 '''
 from django.conf.urls.defaults import patterns, url
-from . import views
+from . import parallel, views
 from django.conf import settings
 
+page_view = (parallel.page_view
+             if getattr(settings, 'PAGES_CONCURRENT_WORKERS', 0)
+             else views.page_view)
+
 
 if settings.APPEND_SLASH:
-    reg = url(r'^(?P<slug>[0-9A-Za-z-_.//]+)/$', views.page_view, name='show_page')
+    reg = url(r'^(?P<slug>[0-9A-Za-z-_.//]+)/$', page_view, name='show_page')
 else:
-    reg = url(r'^(?P<slug>[0-9A-Za-z-_.//]+)$', views.page_view, name='show_page')
+    reg = url(r'^(?P<slug>[0-9A-Za-z-_.//]+)$', page_view, name='show_page')
 
 urlpatterns = patterns('',
+    url(r'^sitemap\.xml$', views.sitemap_index, name='pages_sitemap'),
+    url(r'^sitemap-(?P<section>\d+)\.xml$', views.sitemap_section,
+        name='pages_sitemap_section'),
     reg,
-    url('^$', views.page_view, name='show_page'),
+    url('^$', page_view, name='show_page'),
 )
@@ -1,27 +1,160 @@
 '''View that renders the page
 '''
-from django import shortcuts, template
+from django import http, template
+from django.conf import settings
+from django.template import loader
 
-from . import models
+from . import (blocks, cache, compression, instrumentation, models, profiling,
+               publishing, readmodels, routing, scheduling, sitemap, stats)
+
+
+def load_translation(translation_id):
+    '''Load a list with read model of active page translation
+    '''
+    return readmodels.PageView.from_queryset(
+                models.PageTranslation.objects.filter(pk=translation_id,
+                                                      is_active=True))
+
+
+def load_blocks(translation_id, layout_id):
+    '''Load read models of page blocks of all types shown with layout by
+    placeholders
+    '''
+    return blocks.load(translation_id, layout_id)
+
+
+def load_page_data(slug=None):
+    '''Load template name and read models for page and its blocks from
+    database
+    '''
+    with profiling.phase('page'):
+        if slug:
+            route = routing.lookup(slug)
+            if route is None:
+                raise http.Http404
+            pages = load_translation(route.translation_id)
+            template_name = route.template
+        else:
+            pages = readmodels.PageView.from_queryset(
+                        models.PageTranslation.objects.filter(
+                                    page__is_default=True))
+            template_name = None
+        if not pages:
+            raise http.Http404
+        page = pages[0]
+        if template_name is None:
+            template_name = models.Layout.objects.filter(
+                    pk=page.layout_id).values_list('template', flat=True)[0]
+    with profiling.phase('blocks'):
+        page_blocks = load_blocks(page.id, page.layout_id)
+    return template_name, {'page': page, 'blocks': page_blocks}
 
 
 def get_page_data(request, slug=None):
     '''Get all data needed for page
     '''
-    filters = ({'alias': slug, 'is_active': True} if slug
-                else {'page__is_default': True})
-    page = shortcuts.get_object_or_404(models.PageTranslation, **filters)
-    template_name = page.layout.template
-    articles = models.PageArticle.objects.filter(page=page,
-                            layout=page.layout).select_related('place_alias')
-    blocks = {article.place.alias: article for article in articles}
-    return template_name, {'page': page, 'blocks': blocks}
+    with profiling.phase('route'):
+        # Resolve alias without database, unknown aliases are rejected
+        if slug and not routing.alias_exists(slug):
+            raise http.Http404
+    load = (publishing.load_published if publishing.is_serving_published()
+            else load_page_data)
+    return cache.get_or_compute(cache.page_key(slug), lambda: load(slug),
+                                timeout=scheduling.cache_timeout())
 
 
-def page_view(request, slug=None):
+def render_page(request, slug=None):
     '''Render a page template with a content
     '''
     template_name, data = get_page_data(request, slug)
-    context = template.RequestContext(request)
-    return shortcuts.render_to_response(template_name, data,
-                                        context_instance=context)
+    return render_template(request, template_name, data)
+
+
+def render_template(request, template_name, data):
+    '''Render a page template with page data
+    '''
+    with profiling.phase('template'):
+        page_template = loader.get_template(template_name)
+    with profiling.phase('render'):
+        content = page_template.render(template.RequestContext(request, data))
+    return http.HttpResponse(content)
+
+
+def is_html_cacheable(request):
+    '''Check can be rendered page be taken from cache for request. Only pages
+    shown to anonymous users are cached
+    '''
+    user = getattr(request, 'user', None)
+    return (getattr(settings, 'PAGES_CACHE_HTML', False)
+            and cache.get_timeout() > 0
+            and request.method in ('GET', 'HEAD')
+            and not (user and user.is_authenticated()))
+
+
+def render_compressed(request, slug=None, render=render_page):
+    '''Render page and get its content type, bodies in all encodings and
+    versions of menus shown on it
+    '''
+    with cache.collect_menus() as menus:
+        response = render(request, slug)
+    return (response['Content-Type'], compression.compress(response.content),
+            cache.menu_versions(menus))
+
+
+def is_html_fresh(entry):
+    '''Check were menus shown on rendered page changed
+    '''
+    versions = entry[2]
+    return not versions or cache.menu_versions(versions.keys()) == versions
+
+
+@profiling.timed
+@instrumentation.track('page_view')
+@stats.counted
+def page_view(request, slug=None):
+    '''Render a page template with a content. Rendered page is cached with
+    its compressed variants when PAGES_CACHE_HTML setting is on
+    '''
+    return show_page(request, slug)
+
+
+def show_page(request, slug=None):
+    '''Get response of page view without timing, tracking and counting of
+    the view, used to fill caches
+    '''
+    if not is_html_cacheable(request):
+        return render_page(request, slug)
+    with profiling.phase('route'):
+        if slug and not routing.alias_exists(slug):
+            raise http.Http404
+    content_type, bodies, __ = cache.get_or_compute(cache.html_key(slug),
+                                    lambda: render_compressed(request, slug),
+                                    is_html_fresh, scheduling.cache_timeout())
+    return compression.compressed_response(request, bodies, content_type)
+
+
+def get_base_url(request):
+    '''Get scheme and host of request
+    '''
+    return '%s://%s' % ('https' if request.is_secure() else 'http',
+                        request.get_host())
+
+
+def sitemap_index(request):
+    '''Stream sitemap index listing sitemap sections
+    '''
+    base_url = get_base_url(request)
+    return http.HttpResponse(sitemap.index(
+                    base_url + sitemap.section_url(section)
+                    for section in range(sitemap.get_sections_count())),
+                             content_type='application/xml')
+
+
+def sitemap_section(request, section):
+    '''Stream sitemap section
+    '''
+    section = int(section)
+    if section >= sitemap.get_sections_count():
+        raise http.Http404
+    return http.HttpResponse(sitemap.urlset(section, get_base_url(request)),
+                             content_type='application/xml')
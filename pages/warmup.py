@@ -0,0 +1,97 @@
+'''Warming up of pages caches.
+
+Fills menus, page data and (if PAGES_CACHE_HTML is on) rendered pages caches,
+so first visitors after deploy or cache flush don't pay for it. Tasks are run
+in a pool of threads or processes. Menus are warmed first because they are
+shown on all the pages, then the default page, then pages linked from menus
+and then all other pages. Database connections of pool workers are closed
+after every task, so they aren't left open when the pool is gone.
+'''
+import multiprocessing
+import multiprocessing.pool
+import time
+
+from django import db
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.test.client import RequestFactory
+
+from . import models, views
+from .templatetags import menu_tags
+
+DEFAULT_PRIORITY, MENU_PRIORITY, PAGE_PRIORITY = range(3)
+
+
+def get_tasks(prioritize=True):
+    '''Get a list of tasks: ('menu', menu alias, language code) and ('page',
+    page alias) tuples. Default page is represented with None alias.
+    '''
+    languages = list(models.Language.objects.values_list('code', flat=True))
+    menus = models.Menu.objects.filter(is_active=True)
+    tasks = [('menu', alias, language)
+             for alias in menus.values_list('alias', flat=True)
+             for language in languages]
+    in_menus = set(models.MenuItem.objects.filter(menu__is_active=True)
+                                          .values_list('page_id', flat=True))
+    pages = []
+    for alias, page_id, is_default in models.PageTranslation.objects.filter(
+                    is_active=True).values_list('alias', 'page_id',
+                                                'page__is_default'):
+        if is_default:
+            priority = DEFAULT_PRIORITY
+        elif page_id in in_menus:
+            priority = MENU_PRIORITY
+        else:
+            priority = PAGE_PRIORITY
+        pages.append((priority if prioritize else PAGE_PRIORITY, alias))
+    if models.Page.objects.filter(is_default=True).exists():
+        pages.append((DEFAULT_PRIORITY, None))
+    pages.sort(key=lambda page: page[0])  # Stable, keeps database order
+    return tasks + [('page', alias) for __, alias in pages]
+
+
+def warm(task):
+    '''Run task, get a (task, duration, error message) tuple
+    '''
+    started = time.time()
+    try:
+        if task[0] == 'menu':
+            alias, language = task[1:]
+            menu_tags.get_menu_items(alias, language)
+        else:
+            views.get_page_data(None, task[1])
+            if getattr(settings, 'PAGES_CACHE_HTML', False):
+                request = RequestFactory().get('/')
+                request.user = AnonymousUser()
+                views.show_page(request, task[1])
+        error = None
+    except Exception as exc:  # pylint: disable=W0703
+        error = '%s: %s' % (exc.__class__.__name__, exc)
+    return task, time.time() - started, error
+
+
+def warm_pooled(task):
+    '''Run task in pool worker and close its database connections
+    '''
+    try:
+        return warm(task)
+    finally:
+        db.close_connection()
+
+
+def run(tasks, workers=4, processes=False, callback=None):
+    '''Run tasks in a pool of threads (or processes), callback is called with
+    result of every task in order of completion
+    '''
+    if processes:
+        db.close_connection()  # Children shouldn't share connection
+        pool = multiprocessing.Pool(workers)
+    else:
+        pool = multiprocessing.pool.ThreadPool(workers)
+    try:
+        for result in pool.imap_unordered(warm_pooled, tasks):
+            if callback is not None:
+                callback(result)
+    finally:
+        pool.close()
+        pool.join()
@@ -15,11 +15,13 @@ setup(
     author_email='undeadgrandse@gmail.com',
     url='https://github.com/GrAndSE/django-pages',
     long_description=open('README', 'r').read(),
-    packages=['pages', 'pages.templatetags'],
+    packages=['pages', 'pages.management', 'pages.management.commands',
+              'pages.templatetags'],
     package_data={
         'pages': [
             'templates/admin/includes/*',
-            'templates/admin/page_change_form.html']
+            'templates/admin/page_change_form.html',
+            'templates/admin/page_change_list.html']
     },
     zip_safe=False,
     requires=[],